@@ -1,6 +1,6 @@
 #!/usr/bin/env python
 '''
-Code for isotope diffusion.
+Code for storing the model outputs during the model run.
 '''
 import numpy as np 
 import json
@@ -8,6 +8,8 @@ import scipy.interpolate as interpolate
 from constants import *
 import os
 import sys
+import h5py
+from writer import output_name, output_dataset_options
 
 class ModelOutputs:
     '''
@@ -22,13 +24,27 @@ class ModelOutputs:
 
         self.c = config
         self.Mout_dict = {}      
+        self.TWlen = TWlen
 
         if 'output_bits' not in self.c:
             self.c['output_bits']='float32'
+        if 'output_compression' not in self.c: # chunking and compression of the outputs; see writer.output_dataset_options
+            self.c['output_compression'] = None
+        if 'output_chunks' not in self.c:
+            self.c['output_chunks'] = None
         if 'grid_outputs' not in self.c:
             self.c['grid_outputs'] = False
         self.MOgrid = self.c['grid_outputs']
 
+        ### 'output_stream': write each output straight to the results file rather than keeping all of them in memory
+        if 'output_stream' not in self.c:
+            self.c['output_stream'] = False
+        self.stream = self.c['output_stream']
+        self.f_out = None
+        if self.stream:
+            os.makedirs(self.c['resultsFolder'], exist_ok=True)
+            self.f_out = h5py.File(os.path.join(self.c['resultsFolder'], self.c['resultsFileName']),'w')
+
         if self.MOgrid:
             self.grid_out = np.arange(MOd['z'][0], MOd['z'][-1], self.c['grid_output_res'])
 
@@ -41,45 +57,36 @@ class ModelOutputs:
                 intkind = 'linear'
             
             if varname == 'DIP':
-                self.Mout_dict[varname] = np.zeros((TWlen+1,8), dtype = self.c['output_bits'])
-                self.Mout_dict[varname][0,:]  = np.append(init_time, MOd[varname])
+                self.new_output(varname, 8, np.append(init_time, MOd[varname]))
             elif varname == 'BCO':
-                self.Mout_dict[varname] = np.zeros((TWlen+1,10), dtype = self.c['output_bits'])
-                self.Mout_dict[varname][0,:]  = np.append(init_time, MOd[varname])
+                self.new_output(varname, 10, np.append(init_time, MOd[varname]))
             elif varname == 'climate': #[time,bdot,Ts,snowmelt,rain,sublim]
-                self.Mout_dict[varname] = np.zeros((TWlen+1,6), dtype = self.c['output_bits'])
-                self.Mout_dict[varname][0,:]  = np.append(init_time, MOd[varname])
+                self.new_output(varname, 6, np.append(init_time, MOd[varname]))
             # elif varname == 'runoff':
             #     self.Mout_dict[varname] = np.zeros((TWlen+1,2), dtype = self.c['output_bits'])
             #     self.Mout_dict[varname][0,:]  = np.append(init_time, MOd[varname])
             #VV (23/03/2021)
             elif varname == 'refreeze':
-                self.Mout_dict[varname] = np.zeros((TWlen+1,2), dtype = self.c['output_bits'])
-                self.Mout_dict[varname][0,:]  = np.append(init_time, MOd[varname])
+                self.new_output(varname, 2, np.append(init_time, MOd[varname]))
             elif varname == 'runoff':
-                self.Mout_dict[varname] = np.zeros((TWlen+1,2), dtype = self.c['output_bits'])
-                self.Mout_dict[varname][0,:]  = np.append(init_time, MOd[varname])
+                self.new_output(varname, 2, np.append(init_time, MOd[varname]))
             elif varname == 'meltvol':
-                self.Mout_dict[varname] = np.zeros((TWlen+1,2), dtype = self.c['output_bits'])
-                self.Mout_dict[varname][0,:]  = np.append(init_time, MOd[varname])
+                self.new_output(varname, 2, np.append(init_time, MOd[varname]))
 
             else:
                 if self.MOgrid: #gridding outputs
                     if varname == 'z':
-                        self.Mout_dict[varname] = np.zeros((len(self.grid_out)+1),dtype=self.c['output_bits'])
                         self.Mout_dict[varname] = np.append(init_time,self.grid_out)
+                        if self.stream:
+                            self.f_out.create_dataset(output_name(varname), data = self.Mout_dict[varname], **output_dataset_options(self.c, output_name(varname), np.shape(self.Mout_dict[varname]), self.Mout_dict[varname].dtype))
+                    elif varname == 'LWC':
+                        self.new_output(varname, len(self.grid_out)+1, np.append(init_time,self.RGfun(MOd['z'], MOd[varname], self.grid_out)))
                     else:
-                        self.Mout_dict[varname] = np.zeros((TWlen+1,len(self.grid_out)+1),dtype=self.c['output_bits'])
-
-                    if varname == 'LWC':
-                        self.Mout_dict[varname][0,:] = np.append(init_time,self.RGfun(MOd['z'], MOd[varname], self.grid_out))
-                    elif varname != 'z':
                         Ifun = interpolate.interp1d(MOd['z'], MOd[varname], kind = intkind, fill_value='extrapolate')         
-                        self.Mout_dict[varname][0,:] = np.append(init_time,Ifun(self.grid_out))
+                        self.new_output(varname, len(self.grid_out)+1, np.append(init_time,Ifun(self.grid_out)))
                 
                 else: #not gridding outputs
-                    self.Mout_dict[varname]       = np.zeros((TWlen+1,Glen+1),dtype=self.c['output_bits'])
-                    self.Mout_dict[varname][0,:]  = np.append(init_time, MOd[varname])
+                    self.new_output(varname, Glen+1, np.append(init_time, MOd[varname]))
 
     def updateMO(self, MOd, mtime, Wtracker):
         '''
@@ -94,19 +101,70 @@ class ModelOutputs:
 
             if self.MOgrid:
                 if varname == 'LWC':
-                    self.Mout_dict[varname][Wtracker,:] = np.append(mtime,self.RGfun(MOd['z'], MOd[varname], self.grid_out))
+                    self.write_row(varname, Wtracker, np.append(mtime,self.RGfun(MOd['z'], MOd[varname], self.grid_out)))
                 elif ((varname == 'BCO') or (varname == 'DIP') or (varname == 'climate') or (varname == 'runoff') or (varname == 'refreeze') or (varname == 'meltvol')):
-                    self.Mout_dict[varname][Wtracker,:] = np.append(mtime,MOd[varname])
+                    self.write_row(varname, Wtracker, np.append(mtime,MOd[varname]))
                 elif varname == 'z':
                     continue
                 else:
                     Ifun = interpolate.interp1d(MOd['z'], MOd[varname], kind = intkind,bounds_error=False,fill_value=np.nan)           
-                    self.Mout_dict[varname][Wtracker,:] = np.append(mtime,Ifun(self.grid_out))
+                    self.write_row(varname, Wtracker, np.append(mtime,Ifun(self.grid_out)))
 
             else:
-                self.Mout_dict[varname][Wtracker,:] = np.append(mtime,MOd[varname])
+                self.write_row(varname, Wtracker, np.append(mtime,MOd[varname]))
                 
 
+    def new_output(self, varname, width, row0):
+        '''
+        Set up the storage for output varname (TWlen+1 rows of length width)
+        and write the initial row.
+        When streaming, this is a chunked dataset in the results file;
+        otherwise it is an array in Mout_dict.
+        '''
+
+        if self.stream: # rows are written one at a time, so the chunks are always whole rows ('time')
+            shape = (self.TWlen+1, width)
+            opts = output_dataset_options(self.c, output_name(varname), shape, self.c['output_bits'], layout = 'time')
+            self.Mout_dict[varname] = self.f_out.create_dataset(output_name(varname), shape = shape, dtype = self.c['output_bits'], fillvalue = 0, **opts)
+        else:
+            self.Mout_dict[varname] = np.zeros((self.TWlen+1, width), dtype = self.c['output_bits'])
+        self.write_row(varname, 0, row0)
+
+    def write_row(self, varname, Wtracker, row):
+        '''
+        Put one output time (row) of varname into its storage.
+        '''
+
+        if self.stream:
+            row = np.asarray(row, dtype = self.c['output_bits'])
+            if varname == 'age':
+                row = row / S_PER_YEAR # write_nospin_hdf5 does this for the in-memory outputs
+            self.Mout_dict[varname][Wtracker,:] = row
+        else:
+            self.Mout_dict[varname][Wtracker,:] = row
+
+    def __getstate__(self):
+        '''
+        State saved in a checkpoint (checkpoint.py). When streaming, the
+        results file is flushed and its datasets are not saved; __setstate__
+        opens the file again.
+        '''
+
+        state = self.__dict__.copy()
+        if self.f_out is not None:
+            self.f_out.flush()
+            state['f_out'] = None
+            state['Mout_dict'] = {key:(None if isinstance(value, h5py.Dataset) else value) for key, value in self.Mout_dict.items()}
+        return state
+
+    def __setstate__(self, state):
+        self.__dict__.update(state)
+        if self.stream:
+            self.f_out = h5py.File(os.path.join(self.c['resultsFolder'], self.c['resultsFileName']),'r+')
+            for varname, value in self.Mout_dict.items():
+                if value is None:
+                    self.Mout_dict[varname] = self.f_out[output_name(varname)]
+
     def RGfun(self, z, var, grid):
         '''
         Function to regrid the variables that can not be linearly interpolated
@@ -27,7 +27,7 @@ import pandas as pd
 import time
 import calendar
 import hl_analytic as hla
-import cmath
+from fqs import surface_melt, surface_melt_series
 import sys
 
 def toYearFraction(date):
@@ -48,6 +48,27 @@ def toYearFraction(date):
 
     return date.year + fraction
 
+def decimal_year(dates):
+    '''
+    convert many datetimes (e.g. a DatetimeIndex) to decimal dates at once.
+    Same values as [toYearFraction(qq) for qq in dates], without a python
+    loop over the dates.
+    '''
+    try:
+        dti = pd.DatetimeIndex(dates)
+    except TypeError: # e.g. cftime dates from netCDF4.num2date
+        dti = pd.DatetimeIndex([datetime(*qq.timetuple()[:6]) for qq in dates])
+    if dti.tz is not None:
+        dti = dti.tz_localize(None) # toYearFraction uses the clock time of timezone-aware dates
+
+    t   = dti.values.astype('datetime64[s]')
+    y0  = t.astype('datetime64[Y]')
+    y1  = y0 + np.timedelta64(1, 'Y')
+    yearElapsed     = (t - y0).astype(np.int64)
+    yearDuration    = (y1.astype('datetime64[s]') - y0.astype('datetime64[s]')).astype(np.int64)
+
+    return (y0.astype(np.int64) + 1970) + yearElapsed / yearDuration
+
 def decyeartodatetime(din):
     start = din
     year = int(start)
@@ -86,52 +107,11 @@ def calcSEB(SWGNT,LWGAB,HFLUX,EFLUX,TS,tindex,dt,GHTSKIN=0,dz=0.05,rhos=400):
     '''
     
     SBC = 5.67e-8
-    CP_I = 2097.0 
     m = rhos*dz
-    LF_I = 333500.0 #[J kg^-1]
     flux_df1 = (SWGNT + LWGAB + HFLUX + EFLUX + GHTSKIN)
 
-    TcalcH = np.zeros_like(flux_df1)
-    meltmassH = np.zeros_like(flux_df1)
-
-    dts = TS
-
-    # tindex
-    fqs = FQS()
-    for kk,mdate in enumerate(tindex): #loop through all time steps, calculate melt for all lat/lon pairs at that time
-        pmat = np.zeros((5)) # p matrix to put into FQS solver
-        if kk==0:
-            T_0 = dts[kk]
-        else:
-            T_0 = TcalcH[kk-1]
+    TcalcH, meltmassH = surface_melt_series(flux_df1, np.asarray(TS)[0], dt, m, SBC) # each time step starts from the temperature of the step before
 
-        a = SBC*dt/(CP_I*m)
-        b = 0
-        c = 0
-        d = 1
-        e = -1 * (flux_df1[kk]*dt/(CP_I*m)+T_0)
-
-        pmat[0] = a
-        pmat[3] = d
-        pmat[4] = e
-        pmat[np.isnan(pmat)] = 0
-
-        r = fqs.quartic_roots(pmat)
-        Tnew = (r[((np.isreal(r)) & (r>0))].real)
-        Tnew[np.isnan(e)] = np.nan
-
-        if Tnew>=273.15:
-            TcalcH[kk] = 273.15000000000000        
-            meltmassH[kk] = (flux_df1[kk] - SBC*273.15**4) / LF_I * dt #multiply by dt to put in units per time step
-
-        else:
-            try:
-                TcalcH[kk] = Tnew
-            except:
-                print(kk)
-                print(Tnew)
-            meltmassH[kk] = 0
-            
     return TcalcH,meltmassH
 
 def makeSpinFiles(CLIM_name,timeres='1D',Tinterp='mean',spin_date_st = 1980.0, spin_date_end = 1995.0,melt=False,desired_depth = None,SEB=False,rho_bottom=916,calc_melt=False,num_reps=None):
@@ -231,7 +211,7 @@ def makeSpinFiles(CLIM_name,timeres='1D',Tinterp='mean',spin_date_st = 1980.0, s
         df_CLIM_re.TSKIN = df_TS_re.TSKIN
         df_CLIM_ids = list(df_CLIM_re.columns)
 
-        df_CLIM_re['decdate'] = [toYearFraction(qq) for qq in df_CLIM_re.index]
+        df_CLIM_re['decdate'] = decimal_year(df_CLIM_re.index)
         df_CLIM_re = df_CLIM_re.ffill()
 
         # df_TS_re['decdate'] = [toYearFraction(qq) for qq in df_TS_re.index]
@@ -331,54 +311,13 @@ def makeSpinFiles(CLIM_name,timeres='1D',Tinterp='mean',spin_date_st = 1980.0, s
         df_CLIM['ALBEDO'] = df_CLIM['ALBEDO'].ffill()
 
         SBC = 5.67e-8
-        CP_I = 2097.0 
         m = 400*0.08
         dt = df_CLIM.index.to_series().diff().dt.total_seconds().mean()
-        LF_I = 333500.0 #[J kg^-1]
         flux_df1 = ((df_CLIM['SW_d'] * (1 - df_CLIM['ALBEDO'])) + df_CLIM['LW_d'] + df_CLIM['QH'] + df_CLIM['QL']) #make sure that merra2 QH and QL are multiplied by -1 to make them 'into' the layer
-        flux_df1_r = flux_df1.values#.reshape(flux_df1.shape[0],-1)
-        # oshape = np.shape(flux_df1.values)
-        
-        Tcalc = np.zeros_like(flux_df1_r)
-        meltmass = np.zeros_like(flux_df1_r)
-
         dts = df_CLIM.TSKIN.values
-        # dts_r = dts.reshape(dts.shape[0],-1)
-        # dsha = dts_r.shape[-1]
+        T_0 = np.concatenate(([dts[0]], dts[:-1])) # each time step starts from the previous time step's TSKIN
 
-        # tindex = df_CLIM.time.data
-        tindex = df_CLIM.index
-        for kk,mdate in enumerate(tindex): #loop through all time steps, calculate melt for all lat/lon pairs at that time
-            pmat = np.zeros(5) # p matrix to put into FQS solver
-
-            if kk==0:
-                T_0 = dts[kk]
-            else:
-                T_0 = dts[kk-1]
-
-            a = SBC * dt / (CP_I*m)
-            b = 0
-            c = 0
-            d = 1
-            e = -1 * (flux_df1_r[kk]*dt/(CP_I*m)+T_0)
-
-            pmat[0] = a
-            pmat[3] = d
-            pmat[4] = e
-            pmat[np.isnan(pmat)] = 0
-
-            fqs = FQS()
-            r = fqs.quartic_roots(pmat)
-            Tnew = (r[((np.isreal(r)) & (r>0))].real)
-            Tnew[np.isnan(e)] = np.nan
-
-            if Tnew>=273.15:
-                Tcalc[kk] = 273.15000000000000        
-                meltmass[kk] = (flux_df1[kk] - SBC*273.15**4) / LF_I * dt #multiply by dt to put in units per time step
-
-            else:
-                Tcalc[kk] = Tnew
-                meltmass[kk] = 0
+        Tcalc, meltmass = surface_melt(flux_df1.values, T_0, dt, m, SBC) # all time steps in one call
 
         Tcalc_out = Tcalc
         meltmass_out = meltmass
@@ -416,7 +355,7 @@ def makeSpinFiles(CLIM_name,timeres='1D',Tinterp='mean',spin_date_st = 1980.0, s
         df_CLIM_re.TSKIN = df_TS_re.TSKIN
         df_CLIM_ids = list(df_CLIM_re.columns)
 
-        df_CLIM_re['decdate'] = [toYearFraction(qq) for qq in df_CLIM_re.index]
+        df_CLIM_re['decdate'] = decimal_year(df_CLIM_re.index)
         # df_CLIM_re = df_CLIM_re.fillna(method='pad')
         df_CLIM_re = df_CLIM_re.ffill()
 
@@ -513,14 +452,14 @@ def makeSpinFiles(CLIM_name,timeres='1D',Tinterp='mean',spin_date_st = 1980.0, s
         df_CLIM_re = df_CLIM.resample(timeres).agg(res_dict) #Energy fluxes remain W/m2, mass fluxes are in /time step
         df_CLIM_ids = list(df_CLIM_re.columns)
 
-        df_CLIM_re['decdate'] = [toYearFraction(qq) for qq in df_CLIM_re.index]
+        df_CLIM_re['decdate'] = decimal_year(df_CLIM_re.index)
         # df_CLIM_re = df_CLIM_re.fillna(method='pad')
         df_CLIM_re = df_CLIM_re.ffill()
 
         df_CLIM_seb = df_CLIM[res_dict.keys()]
         df_CLIM_seb.drop(['BDOT','RAIN'],axis=1)
         df_CLIM_seb_ids = list(df_CLIM_seb.columns)
-        df_CLIM_seb['decdate'] = [toYearFraction(qq) for qq in df_CLIM_seb.index]
+        df_CLIM_seb['decdate'] = decimal_year(df_CLIM_seb.index)
 
         dtRATIO = df_CLIM_re.index.to_series().diff().mean().total_seconds()/df_CLIM_seb.index.to_series().diff().mean().total_seconds()
 
@@ -616,341 +555,3 @@ def makeSpinFiles(CLIM_name,timeres='1D',Tinterp='mean',spin_date_st = 1980.0, s
 
 
     return CD, stepsperyear, depth_S1, depth_S2, desired_depth, SEBfluxes
-
-class FQS:
-    '''
-    Fast Quartic Solver: analytically solves quartic equations (needed to calculate melt)
-    Takes methods from fqs package (@author: NKrvavica)
-    full documentation: https://github.com/NKrvavica/fqs/blob/master/fqs.py
-    '''
-    def __init__(self):
-        pass
-
-    # @jit(nopython=True)``
-    def single_quadratic(self, a0, b0, c0):
-        ''' 
-        Analytical solver for a single quadratic equation
-        '''
-        a, b = b0 / a0, c0 / a0
-
-        # Some repating variables
-        a0 = -0.5*a
-        delta = a0*a0 - b
-        sqrt_delta = cmath.sqrt(delta)
-
-        # Roots
-        r1 = a0 - sqrt_delta
-        r2 = a0 + sqrt_delta
-
-        return r1, r2
-
-
-    # @jit(nopython=True)
-    def single_cubic(self, a0, b0, c0, d0):
-        ''' 
-        Analytical closed-form solver for a single cubic equation
-        '''
-        a, b, c = b0 / a0, c0 / a0, d0 / a0
-
-        # Some repeating constants and variables
-        third = 1./3.
-        a13 = a*third
-        a2 = a13*a13
-        sqr3 = math.sqrt(3)
-
-        # Additional intermediate variables
-        f = third*b - a2
-        g = a13 * (2*a2 - b) + c
-        h = 0.25*g*g + f*f*f
-
-        def cubic_root(x):
-            ''' Compute cubic root of a number while maintaining its sign'''
-            if x.real >= 0:
-                return x**third
-            else:
-                return -(-x)**third
-
-        if f == g == h == 0:
-            r1 = -cubic_root(c)
-            return r1, r1, r1
-
-        elif h <= 0:
-            j = math.sqrt(-f)
-            k = math.acos(-0.5*g / (j*j*j))
-            m = math.cos(third*k)
-            n = sqr3 * math.sin(third*k)
-            r1 = 2*j*m - a13
-            r2 = -j * (m + n) - a13
-            r3 = -j * (m - n) - a13
-            return r1, r2, r3
-
-        else:
-            sqrt_h = cmath.sqrt(h)
-            S = cubic_root(-0.5*g + sqrt_h)
-            U = cubic_root(-0.5*g - sqrt_h)
-            S_plus_U = S + U
-            S_minus_U = S - U
-            r1 = S_plus_U - a13
-            r2 = -0.5*S_plus_U - a13 + S_minus_U*sqr3*0.5j
-            r3 = -0.5*S_plus_U - a13 - S_minus_U*sqr3*0.5j
-            return r1, r2, r3
-
-
-    # @jit(nopython=True)
-    def single_cubic_one(self, a0, b0, c0, d0):
-        ''' 
-        Analytical closed-form solver for a single cubic equation
-        '''
-        a, b, c = b0 / a0, c0 / a0, d0 / a0
-
-        # Some repeating constants and variables
-        third = 1./3.
-        a13 = a*third
-        a2 = a13*a13
-
-        # Additional intermediate variables
-        f = third*b - a2
-        g = a13 * (2*a2 - b) + c
-        h = 0.25*g*g + f*f*f
-
-        def cubic_root(x):
-            ''' Compute cubic root of a number while maintaining its sign
-            '''
-            if x.real >= 0:
-                return x**third
-            else:
-                return -(-x)**third
-
-        if f == g == h == 0:
-            return -cubic_root(c)
-
-        elif h <= 0:
-            j = math.sqrt(-f)
-            k = math.acos(-0.5*g / (j*j*j))
-            m = math.cos(third*k)
-            return 2*j*m - a13
-
-        else:
-            sqrt_h = cmath.sqrt(h)
-            S = cubic_root(-0.5*g + sqrt_h)
-            U = cubic_root(-0.5*g - sqrt_h)
-            S_plus_U = S + U
-            return S_plus_U - a13
-
-
-    # @jit(nopython=True)
-    def single_quartic(self, a0, b0, c0, d0, e0):
-        '''
-        Analytical closed-form solver for a single quartic equation
-        '''
-        a, b, c, d = b0/a0, c0/a0, d0/a0, e0/a0
-
-        # Some repeating variables
-        a0 = 0.25*a
-        a02 = a0*a0
-
-        # Coefficients of subsidiary cubic euqtion
-        p = 3*a02 - 0.5*b
-        q = a*a02 - b*a0 + 0.5*c
-        r = 3*a02*a02 - b*a02 + c*a0 - d
-
-        # One root of the cubic equation
-        z0 = self.single_cubic_one(1, p, r, p*r - 0.5*q*q)
-
-        # Additional variables
-        s = cmath.sqrt(2*p + 2*z0.real + 0j)
-        if s == 0:
-            t = z0*z0 + r
-        else:
-            t = -q / s
-
-        # Compute roots by quadratic equations
-        r0, r1 = self.single_quadratic(1, s, z0 + t)
-        r2, r3 = self.single_quadratic(1, -s, z0 - t)
-
-        return r0 - a0, r1 - a0, r2 - a0, r3 - a0
-
-
-    def multi_quadratic(self, a0, b0, c0):
-        ''' 
-        Analytical solver for multiple quadratic equations
-        '''
-        a, b = b0 / a0, c0 / a0
-
-        # Some repating variables
-        a0 = -0.5*a
-        delta = a0*a0 - b
-        sqrt_delta = np.sqrt(delta + 0j)
-
-        # Roots
-        r1 = a0 - sqrt_delta
-        r2 = a0 + sqrt_delta
-
-        return r1, r2
-
-
-    def multi_cubic(self, a0, b0, c0, d0, all_roots=True):
-        '''
-        Analytical closed-form solver for multiple cubic equations
-        '''
-        a, b, c = b0 / a0, c0 / a0, d0 / a0
-
-        # Some repeating constants and variables
-        third = 1./3.
-        a13 = a*third
-        a2 = a13*a13
-        sqr3 = math.sqrt(3)
-
-        # Additional intermediate variables
-        f = third*b - a2
-        g = a13 * (2*a2 - b) + c
-        h = 0.25*g*g + f*f*f
-
-        # Masks for different combinations of roots
-        m1 = (f == 0) & (g == 0) & (h == 0)     # roots are real and equal
-        m2 = (~m1) & (h <= 0)                   # roots are real and distinct
-        m3 = (~m1) & (~m2)                      # one real root and two complex
-
-        def cubic_root(x):
-            ''' Compute cubic root of a number while maintaining its sign
-            '''
-            root = np.zeros_like(x)
-            positive = (x >= 0)
-            negative = ~positive
-            root[positive] = x[positive]**third
-            root[negative] = -(-x[negative])**third
-            return root
-
-        def roots_all_real_equal(c):
-            ''' Compute cubic roots if all roots are real and equal
-            '''
-            r1 = -cubic_root(c)
-            if all_roots:
-                return r1, r1, r1
-            else:
-                return r1
-
-        def roots_all_real_distinct(a13, f, g, h):
-            ''' Compute cubic roots if all roots are real and distinct
-            '''
-            j = np.sqrt(-f)
-            k = np.arccos(-0.5*g / (j*j*j))
-            m = np.cos(third*k)
-            r1 = 2*j*m - a13
-            if all_roots:
-                n = sqr3 * np.sin(third*k)
-                r2 = -j * (m + n) - a13
-                r3 = -j * (m - n) - a13
-                return r1, r2, r3
-            else:
-                return r1
-
-        def roots_one_real(a13, g, h):
-            ''' Compute cubic roots if one root is real and other two are complex
-            '''
-            sqrt_h = np.sqrt(h)
-            S = cubic_root(-0.5*g + sqrt_h)
-            U = cubic_root(-0.5*g - sqrt_h)
-            S_plus_U = S + U
-            r1 = S_plus_U - a13
-            if all_roots:
-                S_minus_U = S - U
-                r2 = -0.5*S_plus_U - a13 + S_minus_U*sqr3*0.5j
-                r3 = -0.5*S_plus_U - a13 - S_minus_U*sqr3*0.5j
-                return r1, r2, r3
-            else:
-                return r1
-
-        # Compute roots
-        if all_roots:
-            roots = np.zeros((3, len(a))).astype(complex)
-            roots[:, m1] = roots_all_real_equal(c[m1])
-            roots[:, m2] = roots_all_real_distinct(a13[m2], f[m2], g[m2], h[m2])
-            roots[:, m3] = roots_one_real(a13[m3], g[m3], h[m3])
-        else:
-            roots = np.zeros(len(a))  # .astype(complex)
-            roots[m1] = roots_all_real_equal(c[m1])
-            roots[m2] = roots_all_real_distinct(a13[m2], f[m2], g[m2], h[m2])
-            roots[m3] = roots_one_real(a13[m3], g[m3], h[m3])
-
-        return roots
-
-
-    def multi_quartic(self, a0, b0, c0, d0, e0):
-        ''' 
-        Analytical closed-form solver for multiple quartic equations
-        '''
-        a, b, c, d = b0/a0, c0/a0, d0/a0, e0/a0
-
-        # Some repeating variables
-        a0 = 0.25*a
-        a02 = a0*a0
-
-        # Coefficients of subsidiary cubic euqtion
-        p = 3*a02 - 0.5*b
-        q = a*a02 - b*a0 + 0.5*c
-        r = 3*a02*a02 - b*a02 + c*a0 - d
-
-        # One root of the cubic equation
-        z0 = self.multi_cubic(1, p, r, p*r - 0.5*q*q, all_roots=False)
-
-        # Additional variables
-        s = np.sqrt(2*p + 2*z0.real + 0j)
-        t = np.zeros_like(s)
-        mask = (s == 0)
-        t[mask] = z0[mask]*z0[mask] + r[mask]
-        t[~mask] = -q[~mask] / s[~mask]
-
-        # Compute roots by quadratic equations
-        r0, r1 = self.multi_quadratic(1, s, z0 + t) - a0
-        r2, r3 = self.multi_quadratic(1, -s, z0 - t) - a0
-
-        return r0, r1, r2, r3
-
-
-    def cubic_roots(self, p):
-        '''
-        A caller function for a fast cubic root solver (3rd order polynomial).
-        '''
-        # Convert input to array (if input is a list or tuple)
-        p = np.asarray(p)
-
-        # If only one set of coefficients is given, add axis
-        if p.ndim < 2:
-            p = p[np.newaxis, :]
-
-        # Check if four coefficients are given
-        if p.shape[1] != 4:
-            raise ValueError('Expected 3rd order polynomial with 4 '
-                             'coefficients, got {:d}.'.format(p.shape[1]))
-
-        if p.shape[0] < 100:
-            roots = [self.single_cubic(*pi) for pi in p]
-            return np.array(roots)
-        else:
-            roots = self.multi_cubic(*p.T)
-            return np.array(roots).T
-
-
-    def quartic_roots(self, p):
-        '''
-        A caller function for a fast quartic root solver (4th order polynomial).
-        '''
-        # Convert input to an array (if input is a list or tuple)
-        p = np.asarray(p)
-
-        # If only one set of coefficients is given, add axis
-        if p.ndim < 2:
-            p = p[np.newaxis, :]
-
-        # Check if all five coefficients are given
-        if p.shape[1] != 5:
-            raise ValueError('Expected 4th order polynomial with 5 '
-                             'coefficients, got {:d}.'.format(p.shape[1]))
-
-        if p.shape[0] < 100:
-            roots = [self.single_quartic(*pi) for pi in p]
-            return np.array(roots)
-        else:
-            roots = self.multi_quartic(*p.T)
-            return np.array(roots).T
\ No newline at end of file
@@ -6,8 +6,8 @@ from scipy import optimize
 from constants import *
 # import os
 # import sys
-import math
 import pandas as pd
+from fqs import surface_temperature, surface_melt_series
 
 class SurfaceEnergyBudget:
     '''
@@ -81,6 +81,7 @@ class SurfaceEnergyBudget:
             self.df_CLIM = pd.DataFrame({'SW_d':self.SW_d,'LW_d':self.LW_d,'ALBEDO':self.ALBEDO, 'T2m':self.T2m, 
                 'TSKIN':self.TSKIN, 'QH':self.QH, 'QL':self.QL, 'RAIN':self.RAIN},index=self.time_in)
             self.df_CLIM['flux'] = ((self.df_CLIM['SW_d'] * (1 - self.df_CLIM['ALBEDO'])) + self.df_CLIM['LW_d'] + self.df_CLIM['QH'] + self.df_CLIM['QL'])
+            self.flux_sub = self.df_CLIM['flux'].values # sub-step fluxes as an array, so SEB_fqs_subdt does not slice the dataframe every time step
 
         else:       
             self.time_in = climateTS['time'][start_ind:]
@@ -182,21 +183,7 @@ class SurfaceEnergyBudget:
             Qnet = Q_SW_net + Q_LW_d + self.QH[iii] + self.QL[iii] + Qrain_i + G
             # fqs = FQS()
 
-            pmat = np.zeros(5)
-
-            a = self.emissivity_snow * self.SBC * dt/(CP_I*m)
-            b = 0
-            c = 0
-            d = 1
-            e = -1 * (Qnet*dt/(CP_I*m)+TTL)
-
-            pmat[0] = a
-            pmat[3] = d
-            pmat[4] = e
-            pmat[np.isnan(pmat)] = 0
-
-            r = quartic_roots(pmat)
-            Tsurface = (r[((np.isreal(r)) & (r>0))].real)
+            Tsurface = surface_temperature(Qnet, TTL, dt, m, self.emissivity_snow * self.SBC)
             
             if Tsurface>=273.15:
                 Tsurface = 273.15
@@ -253,51 +240,13 @@ class SurfaceEnergyBudget:
         # G = 0
 
         iiisub = (iii)*self.dtRATIO
-        
-        flux_df1 = self.df_CLIM.iloc[iiisub:iiisub+self.dtRATIO]
-        flux_df1_r = flux_df1.flux.values + G
+        flux_sub = self.flux_sub[iiisub:iiisub+self.dtRATIO] + G
 
-        Tcalc = np.zeros_like(flux_df1_r)
-        meltmass = np.zeros_like(flux_df1_r)
-
-        dts = flux_df1.TSKIN.values
-
-        tindex = flux_df1.index
-
-        dTL = np.cumsum(dz)[iTL]
         m = np.cumsum(mass)[iTL] #mass of the TL
         
         TTL = np.cumsum(mass*Tz)[iTL]/m # Temp Top Layer, mean temperature of top X cm (weighted mean)
 
-        for kk,mdate in enumerate(tindex): #loop through all time steps, calculate melt for all lat/lon pairs at that time
-            pmat = np.zeros(5) # p matrix to put into FQS solver
-            if kk==0:
-                T_0 = TTL
-            else:
-                T_0 = Tcalc[kk-1]
-
-            a = self.SBC * dt / (CP_I*m)
-            b = 0
-            c = 0
-            d = 1
-            e = -1 * (flux_df1_r[kk]*dt/(CP_I*m)+T_0)
-
-            pmat[0] = a
-            pmat[3] = d
-            pmat[4] = e
-            pmat[np.isnan(pmat)] = 0
-
-            r = quartic_roots(pmat)
-            Tnew = (r[((np.isreal(r)) & (r>0))].real)
-            Tnew[np.isnan(e)] = np.nan
-
-            if Tnew>=273.15:
-                Tcalc[kk] = 273.15000000000000        
-                meltmass[kk] = (flux_df1_r[kk] - self.SBC*273.15**4) / LF_I * dt #multiply by dt to put in units per time step
-
-            else:
-                Tcalc[kk] = Tnew
-                meltmass[kk] = 0
+        Tcalc, meltmass = surface_melt_series(flux_sub, TTL, dt, m, self.SBC)
 
         Tsurface_out = np.mean(Tcalc)
         meltmass_out = np.sum(meltmass) #if you sum the mass, there will be a too much melt because model resolution does not also calculate the temperature profile during the colder hours
@@ -462,522 +411,6 @@ class SurfaceEnergyBudget:
 
         return Tsurface, Tz, melt_mass
 
-### FQS below ###########
-'''
-# Fast Quartic Solver: analytically solves quartic equations (needed to calculate melt)
-# Takes methods from fqs package (@author: NKrvavica)
-# full documentation: https://github.com/NKrvavica/fqs/blob/master/fqs.py
-'''    
-def single_quadratic(a0, b0, c0):
-    ''' 
-    Analytical solver for a single quadratic equation
-    '''
-    a, b = b0 / a0, c0 / a0
-
-    # Some repating variables
-    a0 = -0.5*a
-    delta = a0*a0 - b
-    sqrt_delta = np.sqrt(delta)
-
-    # Roots
-    r1 = a0 - sqrt_delta
-    r2 = a0 + sqrt_delta
-
-    return r1, r2
-
-def single_cubic(a0, b0, c0, d0):
-    ''' 
-    Analytical closed-form solver for a single cubic equation
-    '''
-    a, b, c = b0 / a0, c0 / a0, d0 / a0
-
-    # Some repeating constants and variables
-    third = 1./3.
-    a13 = a*third
-    a2 = a13*a13
-    sqr3 = np.sqrt(3)
-
-    # Additional intermediate variables
-    f = third*b - a2
-    g = a13 * (2*a2 - b) + c
-    h = 0.25*g*g + f*f*f
-
-    def cubic_root(x):
-        ''' Compute cubic root of a number while maintaining its sign'''
-        if x.real >= 0:
-            return x**third
-        else:
-            return -(-x)**third
-
-    if f == g == h == 0:
-        r1 = -cubic_root(c)
-        return r1, r1, r1
-
-    elif h <= 0:
-        j = np.sqrt(-f)
-        k = np.arccos(-0.5*g / (j*j*j))
-        m = np.cos(third*k)
-        n = sqr3 * np.sin(third*k)
-        r1 = 2*j*m - a13
-        r2 = -j * (m + n) - a13
-        r3 = -j * (m - n) - a13
-        return r1, r2, r3
-
-    else:
-        sqrt_h = np.sqrt(h)
-        S = cubic_root(-0.5*g + sqrt_h)
-        U = cubic_root(-0.5*g - sqrt_h)
-        S_plus_U = S + U
-        S_minus_U = S - U
-        r1 = S_plus_U - a13
-        r2 = -0.5*S_plus_U - a13 + S_minus_U*sqr3*0.5j
-        r3 = -0.5*S_plus_U - a13 - S_minus_U*sqr3*0.5j
-        return r1, r2, r3
-
-
-
-def single_cubic_one(a0, b0, c0, d0):
-    ''' 
-    Analytical closed-form solver for a single cubic equation
-    '''
-    a, b, c = b0 / a0, c0 / a0, d0 / a0
-
-    # Some repeating constants and variables
-    third = 1./3.
-    a13 = a*third
-    a2 = a13*a13
-
-    # Additional intermediate variables
-    f = third*b - a2
-    g = a13 * (2*a2 - b) + c
-    h = 0.25*g*g + f*f*f
-
-    def cubic_root(x):
-        ''' Compute cubic root of a number while maintaining its sign
-        '''
-        if x.real >= 0:
-            return x**third
-        else:
-            return -(-x)**third
-
-    if f == g == h == 0:
-        return -cubic_root(c)
-
-    elif h <= 0:
-        j = np.sqrt(-f)
-        k = np.arccos(-0.5*g / (j*j*j))
-        m = np.cos(third*k)
-        return 2*j*m - a13
-
-    else:
-        sqrt_h = np.sqrt(h)
-        S = cubic_root(-0.5*g + sqrt_h)
-        U = cubic_root(-0.5*g - sqrt_h)
-        S_plus_U = S + U
-        return S_plus_U - a13
-
-def single_quartic(a0, b0, c0, d0, e0):
-    '''
-    Analytical closed-form solver for a single quartic equation
-    '''
-    a, b, c, d = b0/a0, c0/a0, d0/a0, e0/a0
-
-    # Some repeating variables
-    a0 = 0.25*a
-    a02 = a0*a0
-
-    # Coefficients of subsidiary cubic euqtion
-    p = 3*a02 - 0.5*b
-    q = a*a02 - b*a0 + 0.5*c
-    r = 3*a02*a02 - b*a02 + c*a0 - d
-
-    # One root of the cubic equation
-    z0 = single_cubic_one(1, p, r, p*r - 0.5*q*q)
-
-    # Additional variables
-    s = np.sqrt(2*p + 2*z0.real + 0j)
-    if s == 0:
-        t = z0*z0 + r
-    else:
-        t = -q / s
-
-    # Compute roots by quadratic equations
-    r0, r1 = single_quadratic(1, s, z0 + t)
-    r2, r3 = single_quadratic(1, -s, z0 - t)
-
-    return r0 - a0, r1 - a0, r2 - a0, r3 - a0
-
-def multi_quadratic(a0, b0, c0):
-    ''' 
-    Analytical solver for multiple quadratic equations
-    '''
-    a, b = b0 / a0, c0 / a0
-
-    # Some repating variables
-    a0 = -0.5*a
-    delta = a0*a0 - b
-    sqrt_delta = np.sqrt(delta + 0j)
-
-    # Roots
-    r1 = a0 - sqrt_delta
-    r2 = a0 + sqrt_delta
-
-    return r1, r2
-
-
-def multi_cubic(a0, b0, c0, d0, all_roots=True):
-    '''
-    Analytical closed-form solver for multiple cubic equations
-    '''
-    a, b, c = b0 / a0, c0 / a0, d0 / a0
-
-    # Some repeating constants and variables
-    third = 1./3.
-    a13 = a*third
-    a2 = a13*a13
-    sqr3 = np.sqrt(3)
-
-    # Additional intermediate variables
-    f = third*b - a2
-    g = a13 * (2*a2 - b) + c
-    h = 0.25*g*g + f*f*f
-
-    # Masks for different combinations of roots
-    m1 = (f == 0) & (g == 0) & (h == 0)     # roots are real and equal
-    m2 = (~m1) & (h <= 0)                   # roots are real and distinct
-    m3 = (~m1) & (~m2)                      # one real root and two complex
-
-    def cubic_root(x):
-        ''' Compute cubic root of a number while maintaining its sign
-        '''
-        root = np.zeros_like(x)
-        positive = (x >= 0)
-        negative = ~positive
-        root[positive] = x[positive]**third
-        root[negative] = -(-x[negative])**third
-        return root
-
-    def roots_all_real_equal(c):
-        ''' Compute cubic roots if all roots are real and equal
-        '''
-        r1 = -cubic_root(c)
-        if all_roots:
-            return r1, r1, r1
-        else:
-            return r1
-
-    def roots_all_real_distinct(a13, f, g, h):
-        ''' Compute cubic roots if all roots are real and distinct
-        '''
-        j = np.sqrt(-f)
-        k = np.arccos(-0.5*g / (j*j*j))
-        m = np.cos(third*k)
-        r1 = 2*j*m - a13
-        if all_roots:
-            n = sqr3 * np.sin(third*k)
-            r2 = -j * (m + n) - a13
-            r3 = -j * (m - n) - a13
-            return r1, r2, r3
-        else:
-            return r1
-
-    def roots_one_real(a13, g, h):
-        ''' Compute cubic roots if one root is real and other two are complex
-        '''
-        sqrt_h = np.sqrt(h)
-        S = cubic_root(-0.5*g + sqrt_h)
-        U = cubic_root(-0.5*g - sqrt_h)
-        S_plus_U = S + U
-        r1 = S_plus_U - a13
-        if all_roots:
-            S_minus_U = S - U
-            r2 = -0.5*S_plus_U - a13 + S_minus_U*sqr3*0.5j
-            r3 = -0.5*S_plus_U - a13 - S_minus_U*sqr3*0.5j
-            return r1, r2, r3
-        else:
-            return r1
-
-    # Compute roots
-    if all_roots:
-        roots = np.zeros((3, len(a))).astype(complex)
-        roots[:, m1] = roots_all_real_equal(c[m1])
-        roots[:, m2] = roots_all_real_distinct(a13[m2], f[m2], g[m2], h[m2])
-        roots[:, m3] = roots_one_real(a13[m3], g[m3], h[m3])
-    else:
-        roots = np.zeros(len(a))  # .astype(complex)
-        roots[m1] = roots_all_real_equal(c[m1])
-        roots[m2] = roots_all_real_distinct(a13[m2], f[m2], g[m2], h[m2])
-        roots[m3] = roots_one_real(a13[m3], g[m3], h[m3])
-
-    return roots
-
-
-def multi_quartic(a0, b0, c0, d0, e0):
-    ''' 
-    Analytical closed-form solver for multiple quartic equations
-    '''
-    a, b, c, d = b0/a0, c0/a0, d0/a0, e0/a0
-
-    # Some repeating variables
-    a0 = 0.25*a
-    a02 = a0*a0
-
-    # Coefficients of subsidiary cubic euqtion
-    p = 3*a02 - 0.5*b
-    q = a*a02 - b*a0 + 0.5*c
-    r = 3*a02*a02 - b*a02 + c*a0 - d
-
-    # One root of the cubic equation
-    z0 = multi_cubic(1, p, r, p*r - 0.5*q*q, all_roots=False)
-
-    # Additional variables
-    s = np.sqrt(2*p + 2*z0.real + 0j)
-    t = np.zeros_like(s)
-    mask = (s == 0)
-    t[mask] = z0[mask]*z0[mask] + r[mask]
-    t[~mask] = -q[~mask] / s[~mask]
-
-    # Compute roots by quadratic equations
-    r0, r1 = multi_quadratic(1, s, z0 + t) - a0
-    r2, r3 = multi_quadratic(1, -s, z0 - t) - a0
-
-    return r0, r1, r2, r3
-
-
-def cubic_roots(p):
-    '''
-    A caller function for a fast cubic root solver (3rd order polynomial).
-    '''
-    # Convert input to array (if input is a list or tuple)
-    p = np.asarray(p)
-
-    # If only one set of coefficients is given, add axis
-    if p.ndim < 2:
-        p = p[np.newaxis, :]
-
-    # Check if four coefficients are given
-    if p.shape[1] != 4:
-        raise ValueError('Expected 3rd order polynomial with 4 '
-                         'coefficients, got {:d}.'.format(p.shape[1]))
-
-    if p.shape[0] < 100:
-        roots = [single_cubic(*pi) for pi in p]
-        return np.array(roots)
-    else:
-        roots = multi_cubic(*p.T)
-        return np.array(roots).T
-
-
-def quartic_roots(p):
-    '''
-    A caller function for a fast quartic root solver (4th order polynomial).
-    p[0]*x^4 + p[1]*x^3 + p[2]*x^2 + p[3]*x + p[4] = 0
-    '''
-    # Convert input to an array (if input is a list or tuple)
-    p = np.asarray(p)
-
-    # If only one set of coefficients is given, add axis
-    if p.ndim < 2:
-        p = p[np.newaxis, :]
-
-    # Check if all five coefficients are given
-    if p.shape[1] != 5:
-        raise ValueError('Expected 4th order polynomial with 5 '
-                         'coefficients, got {:d}.'.format(p.shape[1]))
-
-    if p.shape[0] < 100:
-        roots = [single_quartic(*pi) for pi in p]
-        return np.array(roots)
-    else:
-        roots = multi_quartic(*p.T)
-        return np.array(roots).T
-
-def multi_quadratic(a0, b0, c0):
-    ''' 
-    Analytical solver for multiple quadratic equations
-    '''
-    a, b = b0 / a0, c0 / a0
-
-    # Some repating variables
-    a0 = -0.5*a
-    delta = a0*a0 - b
-    sqrt_delta = np.sqrt(delta + 0j)
-
-    # Roots
-    r1 = a0 - sqrt_delta
-    r2 = a0 + sqrt_delta
-
-    return r1, r2
-
-
-def multi_cubic(a0, b0, c0, d0, all_roots=True):
-    '''
-    Analytical closed-form solver for multiple cubic equations
-    '''
-    a, b, c = b0 / a0, c0 / a0, d0 / a0
-
-    # Some repeating constants and variables
-    third = 1./3.
-    a13 = a*third
-    a2 = a13*a13
-    sqr3 = math.sqrt(3)
-
-    # Additional intermediate variables
-    f = third*b - a2
-    g = a13 * (2*a2 - b) + c
-    h = 0.25*g*g + f*f*f
-
-    # Masks for different combinations of roots
-    m1 = (f == 0) & (g == 0) & (h == 0)     # roots are real and equal
-    m2 = (~m1) & (h <= 0)                   # roots are real and distinct
-    m3 = (~m1) & (~m2)                      # one real root and two complex
-
-    def cubic_root(x):
-        ''' Compute cubic root of a number while maintaining its sign
-        '''
-        root = np.zeros_like(x)
-        positive = (x >= 0)
-        negative = ~positive
-        root[positive] = x[positive]**third
-        root[negative] = -(-x[negative])**third
-        return root
-
-    def roots_all_real_equal(c):
-        ''' Compute cubic roots if all roots are real and equal
-        '''
-        r1 = -cubic_root(c)
-        if all_roots:
-            return r1, r1, r1
-        else:
-            return r1
-
-    def roots_all_real_distinct(a13, f, g, h):
-        ''' Compute cubic roots if all roots are real and distinct
-        '''
-        j = np.sqrt(-f)
-        k = np.arccos(-0.5*g / (j*j*j))
-        m = np.cos(third*k)
-        r1 = 2*j*m - a13
-        if all_roots:
-            n = sqr3 * np.sin(third*k)
-            r2 = -j * (m + n) - a13
-            r3 = -j * (m - n) - a13
-            return r1, r2, r3
-        else:
-            return r1
-
-    def roots_one_real(a13, g, h):
-        ''' Compute cubic roots if one root is real and other two are complex
-        '''
-        sqrt_h = np.sqrt(h)
-        S = cubic_root(-0.5*g + sqrt_h)
-        U = cubic_root(-0.5*g - sqrt_h)
-        S_plus_U = S + U
-        r1 = S_plus_U - a13
-        if all_roots:
-            S_minus_U = S - U
-            r2 = -0.5*S_plus_U - a13 + S_minus_U*sqr3*0.5j
-            r3 = -0.5*S_plus_U - a13 - S_minus_U*sqr3*0.5j
-            return r1, r2, r3
-        else:
-            return r1
-
-    # Compute roots
-    if all_roots:
-        roots = np.zeros((3, len(a))).astype(complex)
-        roots[:, m1] = roots_all_real_equal(c[m1])
-        roots[:, m2] = roots_all_real_distinct(a13[m2], f[m2], g[m2], h[m2])
-        roots[:, m3] = roots_one_real(a13[m3], g[m3], h[m3])
-    else:
-        roots = np.zeros(len(a))  # .astype(complex)
-        roots[m1] = roots_all_real_equal(c[m1])
-        roots[m2] = roots_all_real_distinct(a13[m2], f[m2], g[m2], h[m2])
-        roots[m3] = roots_one_real(a13[m3], g[m3], h[m3])
-
-    return roots
-
-
-def multi_quartic(a0, b0, c0, d0, e0):
-    ''' 
-    Analytical closed-form solver for multiple quartic equations
-    '''
-    a, b, c, d = b0/a0, c0/a0, d0/a0, e0/a0
-
-    # Some repeating variables
-    a0 = 0.25*a
-    a02 = a0*a0
-
-    # Coefficients of subsidiary cubic euqtion
-    p = 3*a02 - 0.5*b
-    q = a*a02 - b*a0 + 0.5*c
-    r = 3*a02*a02 - b*a02 + c*a0 - d
-
-    # One root of the cubic equation
-    z0 = multi_cubic(1, p, r, p*r - 0.5*q*q, all_roots=False)
-
-    # Additional variables
-    s = np.sqrt(2*p + 2*z0.real + 0j)
-    t = np.zeros_like(s)
-    mask = (s == 0)
-    t[mask] = z0[mask]*z0[mask] + r[mask]
-    t[~mask] = -q[~mask] / s[~mask]
-
-    # Compute roots by quadratic equations
-    r0, r1 = multi_quadratic(1, s, z0 + t) - a0
-    r2, r3 = multi_quadratic(1, -s, z0 - t) - a0
-
-    return r0, r1, r2, r3
-
-
-def cubic_roots(p):
-    '''
-    A caller function for a fast cubic root solver (3rd order polynomial).
-    '''
-    # Convert input to array (if input is a list or tuple)
-    p = np.asarray(p)
-
-    # If only one set of coefficients is given, add axis
-    if p.ndim < 2:
-        p = p[np.newaxis, :]
-
-    # Check if four coefficients are given
-    if p.shape[1] != 4:
-        raise ValueError('Expected 3rd order polynomial with 4 '
-                         'coefficients, got {:d}.'.format(p.shape[1]))
-
-    if p.shape[0] < 100:
-        roots = [single_cubic(*pi) for pi in p]
-        return np.array(roots)
-    else:
-        roots = multi_cubic(*p.T)
-        return np.array(roots).T
-
-
-def quartic_roots(p):
-    '''
-    A caller function for a fast quartic root solver (4th order polynomial).
-    p[0]*x^4 + p[1]*x^3 + p[2]*x^2 + p[3]*x + p[4] = 0
-    '''
-    # Convert input to an array (if input is a list or tuple)
-    p = np.asarray(p)
-
-    # If only one set of coefficients is given, add axis
-    if p.ndim < 2:
-        p = p[np.newaxis, :]
-
-    # Check if all five coefficients are given
-    if p.shape[1] != 5:
-        raise ValueError('Expected 4th order polynomial with 5 '
-                         'coefficients, got {:d}.'.format(p.shape[1]))
-
-    if p.shape[0] < 100:
-        roots = [single_quartic(*pi) for pi in p]
-        return np.array(roots)
-    else:
-        roots = multi_quartic(*p.T)
-        return np.array(roots).T
-
-
 '''
 References
 Cuffey and Paterson, p. 140-150
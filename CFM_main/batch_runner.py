@@ -0,0 +1,226 @@
+#!/usr/bin/env python
+'''
+batch_runner.py
+===============
+
+Run firnbatch_generic.run_CFM for a list of sites with a pool of worker
+processes.
+
+This is an alternative to running firnbatch_generic.py with GNU parallel.
+Each worker imports the CFM (and xarray, pandas, scipy...) once and then runs
+many sites, rather than starting a new python for every site.
+
+Each finished site is written to a manifest (a .csv with one line per
+attempt: site, status, attempt, minutes, error). When the batch is started
+again with the same manifest, sites that are already 'done' are skipped, so a
+large batch can be restarted after a crash without redoing those sites. Sites
+that fail are tried again, up to 'retries' more times.
+
+With prefetch, the forcing of all of the sites to run is first read from the
+RCM files in one pass (siteClimate_from_RCM.getClimate_sites), which saves
+each site's forcing to a pickle; the workers then load those pickles instead
+of each reading the whole RCM archive for one site.
+
+to run:
+>>> python batch_runner.py CFMsites.txt
+
+where CFMsites.txt has one lat/lon pair per line (the same file used with
+GNU parallel). The settings for run_CFM, the number of processes, and the
+number of retries are set under __main__.
+'''
+
+import os
+import sys
+import csv
+import time
+import traceback
+import multiprocessing
+
+MANIFEST_FIELDS = ['site', 'status', 'attempt', 'minutes', 'error']
+
+_run_CFM = None # run_CFM in each worker, set by _init_worker
+
+def read_sites(sitefile):
+    '''
+    Read the site list: one lat/lon pair per line (e.g. 72.5 -38.5).
+    Blank lines and lines starting with # are skipped.
+
+    :return sites: list of lat/lon strings, with the whitespace made uniform
+    '''
+
+    sites = []
+    with open(sitefile, 'r') as f:
+        for line in f:
+            line = line.strip()
+            if line and not line.startswith('#'):
+                sites.append(site_name(line))
+    return sites
+
+def site_name(LLpair):
+    '''
+    Site name used in the manifest: the lat/lon pair with single spaces.
+    '''
+    return ' '.join(LLpair.replace(',', ' ').split())
+
+def read_manifest(manifest):
+    '''
+    Read the manifest of a batch.
+
+    :return status: dictionary of the last status ('done' or 'failed') and
+    attempt number of each site in the manifest
+    '''
+
+    status = {}
+    if not os.path.isfile(manifest):
+        return status
+
+    with open(manifest, 'r', newline = '') as f:
+        for row in csv.DictReader(f):
+            status[row['site']] = (row['status'], int(row['attempt']))
+    return status
+
+def _init_worker():
+    '''
+    Pool initializer: import the model once per worker process.
+    '''
+    global _run_CFM
+    try:
+        from firnbatch_generic import run_CFM
+        _run_CFM = run_CFM
+    except (Exception, SystemExit): # an error in the initializer would make the pool restart the worker forever; report it for each site instead
+        _run_CFM = None
+
+def _run_site(task):
+    '''
+    Run one site in a worker. Errors are caught and returned, so that one
+    failed site does not stop the batch. This includes SystemExit: the model
+    calls sys.exit() when it stops a run (e.g. a .json error), and an
+    uncaught SystemExit in a pool worker loses the task, so the batch would
+    wait for it forever.
+
+    :return: site, status, attempt, minutes, error
+    '''
+
+    global _run_CFM
+    site, attempt, json_base, kwargs = task
+    tnow = time.time()
+    try:
+        if _run_CFM is None: # the import failed in _init_worker: try again (raises the import error if it fails again)
+            from firnbatch_generic import run_CFM
+            _run_CFM = run_CFM
+        _run_CFM(site, json_base, **kwargs)
+        status  = 'done'
+        error   = ''
+    except SystemExit as e:
+        status  = 'failed'
+        error   = 'the model stopped the run (sys.exit({})); see the output of the site for the reason'.format('' if e.code is None else repr(e.code))
+    except Exception:
+        status  = 'failed'
+        error   = traceback.format_exc().strip().splitlines()[-1]
+    minutes = (time.time() - tnow) / 60
+    return site, status, attempt, minutes, error
+
+def run_batch(sites, json_base, manifest = 'CFMbatch_manifest.csv', processes = None, retries = 1, maxtasksperchild = None, prefetch = False, **kwargs):
+    '''
+    Run run_CFM for each site in a pool of worker processes.
+
+    Parameters
+    ----------
+    sites: list of strings
+        lat/lon pairs, e.g. ['72.5 -38.5', '75.3 -34.8']
+    json_base: string
+        the 'base' .json passed to run_CFM
+    manifest: string
+        .csv file recording each attempt; sites that are 'done' in it are
+        skipped
+    processes: int
+        number of worker processes (default: number of CPUs)
+    retries: int
+        number of times a failed site is tried again
+    maxtasksperchild: int
+        if set, workers are replaced after this many sites (to return memory)
+    prefetch: boolean
+        if True, read the forcing of all sites from the RCM files in one pass
+        before the runs
+    kwargs:
+        passed to run_CFM (timeres, Tinterp, MELT, runtype, datatype, store, ...).
+        With a store, the workers only write the parts of the store, and they
+        are merged into the store at the end of the batch (see sitestore.py).
+
+    Returns
+    -------
+    status: dictionary
+        (status, attempt) of every site in the manifest
+    '''
+
+    status  = read_manifest(manifest)
+    sites   = list(dict.fromkeys(site_name(s) for s in sites)) # remove duplicates, keep order
+    pending = [s for s in sites if status.get(s, ('', 0))[0] != 'done']
+    print('{} sites, {} already done, {} to run'.format(len(sites), len(sites) - len(pending), len(pending)))
+
+    if prefetch and pending:
+        from siteClimate_from_RCM import getClimate_sites
+        from firnbatch_generic import MAR_DSOURCE
+        datatype = kwargs.get('datatype', 'MERRA')
+        latlon = [[float(x) for x in s.split()] for s in pending]
+        getClimate_sites([ll[0] for ll in latlon], [ll[1] for ll in latlon], writer = True, datatype = datatype,
+            runtype = kwargs.get('runtype', 'local'), dsource = MAR_DSOURCE if datatype == 'MAR' else None)
+
+    store = kwargs.get('store')
+    if store is not None:
+        kwargs['merge_store'] = False # merged once, below
+
+    new_file = not os.path.isfile(manifest)
+    with open(manifest, 'a', newline = '') as mf:
+        writer = csv.writer(mf)
+        if new_file:
+            writer.writerow(MANIFEST_FIELDS)
+            mf.flush()
+
+        with multiprocessing.Pool(processes = processes, initializer = _init_worker, maxtasksperchild = maxtasksperchild) as pool:
+            for rr in range(retries + 1):
+                if not pending:
+                    break
+                tasks = [(s, status.get(s, ('', 0))[1] + 1, json_base, kwargs) for s in pending]
+                failed = []
+                for site, stat, attempt, minutes, error in pool.imap_unordered(_run_site, tasks):
+                    writer.writerow([site, stat, attempt, '%.2f' % minutes, error])
+                    mf.flush() # the manifest is up to date if the batch is killed
+                    status[site] = (stat, attempt)
+                    if stat == 'failed':
+                        failed.append(site)
+                        print('site {} failed (attempt {}): {}'.format(site, attempt, error))
+                pending = failed
+
+    if store is not None:
+        from sitestore import merge_parts
+        print('merged {} sites into {}'.format(merge_parts(store), store))
+
+    print('batch done: {} sites failed'.format(len(pending)))
+    return status
+
+if __name__ == '__main__':
+    sitefile = sys.argv[1]
+    #############################
+    ### THINGS TO CHANGE HERE ###
+    ### See firnbatch_generic ###
+    timeres = '1D'
+    Tinterp = 'mean' # [mean, effective, weighted]
+    runtype = 'local'
+    datatype = 'MERRA'
+    movefiles = False
+    RCdrive = 'drive_name:'
+    json_base = 'example.json'
+    MELT = True
+    store = None # e.g. 'CFMstore.hdf5' to put the results of all sites in one file (see sitestore.py)
+    processes = None # None uses all CPUs
+    retries = 1
+    prefetch = True # read the forcing of all sites in one pass before the runs
+    manifest = os.path.splitext(os.path.basename(sitefile))[0] + '_manifest.csv'
+    #############################
+    ### THINGS TO CHANGE HERE ###
+
+    tic = time.time()
+    run_batch(read_sites(sitefile), json_base, manifest = manifest, processes = processes, retries = retries, prefetch = prefetch,
+        timeres = timeres, Tinterp = Tinterp, MELT = MELT, runtype = runtype, datatype = datatype, movefiles = movefiles, RCdrive = RCdrive, store = store)
+    print('batch run time =', time.time() - tic, 'seconds')
@@ -0,0 +1,310 @@
+#!/usr/bin/env python
+'''
+benchmark.py
+============
+
+Benchmarks of the CFM for a set of model configurations, to catch performance
+regressions (e.g. when upgrading the CFM or its packages) and to compare the
+cost of different configurations.
+
+Each case is example.json (with the forcing in CFMinput_example) with a few
+settings changed, e.g. a different physRho or liquid scheme, doublegrid off,
+or firn air on (see make_cases). Each case is run with a new spin up in its own
+python process, and the report has, for each case:
+
+- status: 'ok' or 'failed' (and the error, for failed cases)
+- steps: number of time steps of the main run
+- loop_seconds: time in the time-stepping loop of the main run
+- steps_per_second: steps / loop_seconds
+- wall_seconds: run time of the whole case (spin up and main run)
+- peak_rss_mb: peak memory use of the process (MB; not available on Windows)
+- output_mb: size of the results file (MB)
+- phases: time in each phase of the time step (see timing.py)
+
+The report also has the time to import the CFM run path (the modules that
+main.py imports) in a new python process, and any of the optional modules
+(OPTIONAL_MODULES: the SEB, firn air, isotope, and snowpack liquid schemes,
+the spin up, pandas, matplotlib, xarray) that were imported with it; these
+are only imported when a run uses them, so the list should be empty.
+
+The report is a .json file, which also records the python, numpy, and CFM
+versions and the git commit. A report can be used as the baseline for a later
+run: cases that are slower (steps per second) or use more memory than the
+baseline by more than the tolerance are listed as regressions, as is a slower
+import of the run path. An import time budget (seconds) can also be set.
+
+to run:
+>>> python benchmark.py report.json
+
+or, to compare with a previous report:
+>>> python benchmark.py report.json baseline.json
+
+The cases to run and the tolerance are set under __main__. The exit code is
+1 if there are regressions.
+'''
+
+import os
+import sys
+import json
+import time
+import platform
+import subprocess
+import tempfile
+import traceback
+import numpy as np
+import h5py
+from physics import PHYSICS_METHODS
+from runplan import LIQUID_SCHEMES
+
+CFM_DIR = os.path.dirname(os.path.abspath(__file__))
+
+LIQUID = LIQUID_SCHEMES
+
+### modules that importing the run path should not import (they are imported when a run uses them)
+OPTIONAL_MODULES = ['firn_density_spin', 'SEB', 'firn_air', 'isotopeDiffusion', 're_snowpack', 'prefflow_snowpack',
+    'RCMpkl_to_spin', 'pandas', 'matplotlib', 'xarray']
+
+def make_cases(groups = ('base', 'physics', 'melt', 'grid', 'SEB', 'FirnAir', 'isotopes')):
+    '''
+    The benchmark cases: settings that are changed from example.json.
+    Each setting is changed on its own (not every combination).
+
+    :param groups: which groups of cases to include
+
+    :return cases: dictionary; key is the case name, value is a dictionary of
+    .json settings
+    '''
+
+    cases = {}
+    if 'base' in groups:
+        cases['base'] = {}
+    if 'physics' in groups:
+        for physRho in PHYSICS_METHODS:
+            cases['physRho_' + physRho] = {'physRho': physRho}
+    if 'melt' in groups:
+        cases['MELT_off'] = {'MELT': False}
+        for liquid in LIQUID:
+            cases['liquid_' + liquid] = {'MELT': True, 'liquid': liquid}
+    if 'grid' in groups:
+        cases['doublegrid_off'] = {'doublegrid': False}
+        cases['merging_off'] = {'merging': False}
+    if 'SEB' in groups:
+        cases['SEB_on'] = {'input_type': 'dataframe', 'SEB': True}
+    if 'FirnAir' in groups:
+        cases['FirnAir_on'] = {'FirnAir': True}
+    if 'isotopes' in groups:
+        cases['isoDiff_off'] = {'isoDiff': False}
+    return cases
+
+def case_config(settings, folder):
+    '''
+    .json configuration for a case: example.json with the case settings, the
+    results in folder, and the input paths made absolute (the case is not run
+    from CFM_DIR). The timing of the time step is turned on.
+    '''
+
+    with open(os.path.join(CFM_DIR, 'example.json'), 'r') as f:
+        c = json.load(f)
+    c.update(settings)
+    c['resultsFolder']      = folder
+    c['InputFileFolder']    = os.path.join(CFM_DIR, c['InputFileFolder'])
+    c['timing']             = True
+    c.pop('spinCache', None)
+    if 'AirConfigName' in c:
+        c['AirConfigName']  = os.path.join(CFM_DIR, c['AirConfigName'])
+    return c
+
+def run_case(configName):
+    '''
+    Run a case in this process (this is called in the child process started by
+    benchmark) and print its results as json on the last line of stdout.
+    '''
+
+    tic = time.time()
+    result = {}
+    try:
+        sys.argv = ['main.py', configName, '-n']
+        import runpy
+        g = runpy.run_path(os.path.join(CFM_DIR, 'main.py'), run_name = '__main__')
+        firn = g['firn']
+        result['status']            = 'ok'
+        result['steps']             = int(firn.stp)
+        result['loop_seconds']      = float(np.sum(firn.timer.total))
+        result['steps_per_second']  = result['steps'] / max(result['loop_seconds'], 1e-12)
+        result['phases']            = {p:float(t) for p, t in zip(firn.timer.phases, firn.timer.total) if t > 0}
+        fname = os.path.join(firn.c['resultsFolder'], firn.c['resultsFileName'])
+        result['output_mb']         = os.path.getsize(fname) / 2**20
+    except BaseException:
+        result['status']            = 'failed'
+        result['error']             = traceback.format_exc().strip().splitlines()[-1]
+    result['wall_seconds'] = time.time() - tic
+    try:
+        import resource
+        result['peak_rss_mb'] = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / 1024 # kB on linux
+        if sys.platform == 'darwin':
+            result['peak_rss_mb'] = result['peak_rss_mb'] / 1024 # bytes on macOS
+    except ImportError:
+        result['peak_rss_mb'] = None
+    sys.stdout.flush()
+    print('\n' + json.dumps(result))
+
+def environment():
+    '''
+    Versions of python, numpy, h5py, and the CFM, and the git commit.
+    '''
+
+    env = {'python': platform.python_version(), 'numpy': np.__version__, 'h5py': h5py.__version__,
+        'platform': platform.platform(), 'processor': platform.processor()}
+    with open(os.path.join(CFM_DIR, 'main.py'), 'r') as f:
+        for line in f:
+            if line.startswith('__version__'):
+                env['CFM'] = line.split('=')[1].strip().strip('"\'')
+    try:
+        env['commit'] = subprocess.run(['git', 'rev-parse', 'HEAD'], cwd = CFM_DIR, capture_output = True,
+            text = True, check = True).stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        env['commit'] = None
+    return env
+
+def import_time(repeat = 5):
+    '''
+    Time to import the CFM run path (what main.py imports) in a new python
+    process; the fastest of repeat tries.
+
+    :return: dictionary of the time (seconds) and the OPTIONAL_MODULES that were imported
+    '''
+
+    code = ('import sys, time, json; t = time.perf_counter(); import firn_density_nospin, checkpoint; '
+        't = time.perf_counter() - t; print(json.dumps([t, [m for m in {} if m in sys.modules]]))'.format(OPTIONAL_MODULES))
+    best = None
+    for rr in range(repeat):
+        proc = subprocess.run([sys.executable, '-c', code], cwd = CFM_DIR, capture_output = True, text = True, check = True)
+        t, loaded = json.loads(proc.stdout.strip().splitlines()[-1])
+        best = t if best is None else min(best, t)
+    return {'seconds': best, 'optional_loaded': loaded}
+
+def benchmark(cases, report = None, workdir = None, keep = False):
+    '''
+    Run each case in its own python process.
+
+    :param cases: dictionary of cases (see make_cases)
+    :param report: if set, the .json file the report is written to
+    :param workdir: folder for the case configurations and results (default: a temporary folder)
+    :param keep: if False, the results of each case are deleted after the case is run
+
+    :return results: the report (dictionary)
+    '''
+
+    tmp = None
+    if workdir is None:
+        tmp = tempfile.TemporaryDirectory(prefix = 'CFMbenchmark_')
+        workdir = tmp.name
+
+    results = {'environment': environment(), 'date': time.strftime('%Y-%m-%d %H:%M:%S'), 'cases': {}}
+    results['import'] = import_time()
+    print('import of the run path: {:.3f} s'.format(results['import']['seconds']))
+    if results['import']['optional_loaded']:
+        print('  optional modules imported:', ', '.join(results['import']['optional_loaded']))
+    for name, settings in cases.items():
+        folder = os.path.join(workdir, name)
+        os.makedirs(folder, exist_ok = True)
+        configName = os.path.join(workdir, name + '.json') # not in folder: main.py copies the .json to the results folder
+        with open(configName, 'w') as f:
+            json.dump(case_config(settings, folder), f, indent = 4)
+
+        print('running case', name)
+        proc = subprocess.run([sys.executable, os.path.abspath(__file__), '--case', configName],
+            cwd = CFM_DIR, capture_output = True, text = True)
+        try:
+            res = json.loads(proc.stdout.strip().splitlines()[-1])
+        except (IndexError, ValueError):
+            res = {'status': 'failed', 'error': (proc.stderr.strip().splitlines() or ['no output'])[-1]}
+        res['settings'] = settings
+        results['cases'][name] = res
+        if res['status'] == 'ok':
+            print('  {:.0f} steps/s, {:.0f} MB, {:.1f} s'.format(res['steps_per_second'], res['peak_rss_mb'] or 0, res['wall_seconds']))
+        else:
+            print('  failed:', res['error'])
+
+        if not keep:
+            for fname in os.listdir(folder):
+                if fname.endswith('.hdf5'):
+                    os.remove(os.path.join(folder, fname))
+
+        if report: # write after each case, so a long benchmark that is stopped keeps its results
+            with open(report, 'w') as f:
+                json.dump(results, f, indent = 2)
+
+    if tmp is not None:
+        tmp.cleanup()
+    return results
+
+def compare(results, baseline, tolerance = 0.2):
+    '''
+    Compare a report with a baseline report.
+
+    :param results: report (dictionary)
+    :param baseline: baseline report (dictionary)
+    :param tolerance: fraction by which a case can be slower (steps per second) or use more memory before it is a regression
+
+    :return regressions: list of (case, measure, baseline value, new value)
+    '''
+
+    regressions = []
+    if ('import' in results) and ('import' in baseline):
+        print('import of the run path: {:.3f} s (baseline {:.3f} s)'.format(results['import']['seconds'], baseline['import']['seconds']))
+        if results['import']['seconds'] > (1 + tolerance) * baseline['import']['seconds']:
+            regressions.append(('import', 'seconds', baseline['import']['seconds'], results['import']['seconds']))
+        if results['import']['optional_loaded']:
+            regressions.append(('import', 'optional_loaded', baseline['import']['optional_loaded'], results['import']['optional_loaded']))
+
+    print('{:<28}{:>14}{:>14}{:>10}'.format('case', 'baseline', 'new', 'ratio'))
+    for name, res in results['cases'].items():
+        base = baseline['cases'].get(name)
+        if base is None:
+            continue
+        if base['status'] == 'ok' and res['status'] != 'ok':
+            regressions.append((name, 'status', base['status'], res['status']))
+            continue
+        if res['status'] != 'ok' or base['status'] != 'ok':
+            continue
+        ratio = res['steps_per_second'] / base['steps_per_second']
+        print('{:<28}{:>14.1f}{:>14.1f}{:>10.2f}'.format(name, base['steps_per_second'], res['steps_per_second'], ratio))
+        if ratio < 1 - tolerance:
+            regressions.append((name, 'steps_per_second', base['steps_per_second'], res['steps_per_second']))
+        if (res.get('peak_rss_mb') and base.get('peak_rss_mb') and res['peak_rss_mb'] > (1 + tolerance) * base['peak_rss_mb']):
+            regressions.append((name, 'peak_rss_mb', base['peak_rss_mb'], res['peak_rss_mb']))
+
+    for reg in regressions:
+        print('regression: {} {} {} -> {}'.format(*reg))
+    return regressions
+
+if __name__ == '__main__':
+    if '--case' in sys.argv: # a single case, in the process started by benchmark()
+        run_case(sys.argv[sys.argv.index('--case') + 1])
+        sys.exit()
+
+    if len(sys.argv) < 2:
+        print('usage: python benchmark.py report.json [baseline.json]')
+        sys.exit()
+    #############################
+    ### THINGS TO CHANGE HERE ###
+    groups = ['base', 'physics', 'melt', 'grid', 'SEB', 'FirnAir', 'isotopes']
+    tolerance = 0.2 # fraction slower (or more memory) than the baseline that counts as a regression
+    workdir = None # None uses a temporary folder
+    keep = False # keep the results files of each case
+    import_budget = None # seconds allowed to import the run path (None: no budget)
+    #############################
+
+    results = benchmark(make_cases(groups), report = sys.argv[1], workdir = workdir, keep = keep)
+    failed = False
+    if import_budget and results['import']['seconds'] > import_budget:
+        print('regression: import of the run path took {:.3f} s (budget {} s)'.format(results['import']['seconds'], import_budget))
+        failed = True
+    if len(sys.argv) > 2:
+        with open(sys.argv[2], 'r') as f:
+            baseline = json.load(f)
+        if compare(results, baseline, tolerance):
+            failed = True
+    if failed:
+        sys.exit(1)
@@ -0,0 +1,82 @@
+#!/usr/bin/env python
+'''
+checkpoint.py
+=============
+
+Checkpoints of the full state of a FirnDensityNoSpin run, so that a run that
+is stopped (e.g. on a preemptible node) can be continued from where it was
+instead of starting again.
+
+SpinUpdate_res only saves the fields needed to start a new run from the spin
+file. A checkpoint is the whole model instance (every attribute: the column,
+the forcing, the Goujon Gamma values, firn air, isotopes, the melt budget
+arrays, the output arrays that have been filled so far, ...), so the resumed
+run gives the same results as a run that was not stopped.
+
+To use it, set "checkpointInterval" (time steps) and/or "checkpointMinutes"
+(wall-clock minutes) in the .json. The checkpoint is written to
+resultsFolder/checkpointFileName at the end of a time step, replacing the
+previous one, and it is deleted when the run finishes. To continue a run:
+
+>>> python main.py example.json -r
+
+or, from a script:
+
+>>> firn = checkpoint.load_checkpoint(filename)
+>>> firn.time_evolve()
+
+The checkpoint is a python pickle: resume it with the same CFM code.
+'''
+
+import os
+import pickle
+
+def checkpoint_file(config):
+    '''
+    Name of the checkpoint file of a run.
+    '''
+    return os.path.join(config['resultsFolder'], config['checkpointFileName'])
+
+def write_checkpoint(firn, iii):
+    '''
+    Save the state of the model at the end of time step iii.
+
+    :param firn: FirnDensityNoSpin instance
+    :param iii: index of the time step that was just completed
+    '''
+
+    state = {key:value for key, value in firn.__dict__.items() if key != 'LB'} # the layer buffer only holds views of the fields, which are saved anyway
+    fname = checkpoint_file(firn.c)
+    tmp = fname + '.tmp'
+    with open(tmp, 'wb') as f: # write then rename, so a run stopped while writing keeps the previous checkpoint
+        pickle.dump({'step':iii, 'state':state}, f, protocol = pickle.HIGHEST_PROTOCOL)
+    os.replace(tmp, fname)
+
+def load_checkpoint(fname):
+    '''
+    Rebuild a FirnDensityNoSpin instance from a checkpoint. Its time_evolve
+    continues from the time step after the checkpoint.
+
+    :param fname: checkpoint file
+
+    :return firn: FirnDensityNoSpin instance
+    '''
+
+    from firn_density_nospin import FirnDensityNoSpin
+
+    with open(fname, 'rb') as f:
+        cp = pickle.load(f)
+
+    firn = FirnDensityNoSpin.__new__(FirnDensityNoSpin)
+    firn.__dict__.update(cp['state'])
+    firn.resume_step = cp['step'] + 1
+    print('Resuming from checkpoint at time step {} of {} (model time {})'.format(firn.resume_step, firn.stp, firn.modeltime[cp['step']]))
+    return firn
+
+def remove_checkpoint(config):
+    '''
+    Delete the checkpoint of a run (when the run is finished).
+    '''
+    fname = checkpoint_file(config)
+    if os.path.isfile(fname):
+        os.remove(fname)
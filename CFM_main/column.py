@@ -0,0 +1,152 @@
+#!/usr/bin/env python
+'''
+Preallocated storage for the per-layer fields of the firn column.
+
+Each time step with accumulation, every per-layer field gets a new layer on
+top and loses the bottom layer, i.e. x = np.concatenate(([new], x[:-1])).
+Doing that with np.concatenate allocates and copies a new array for every
+field at every time step.
+
+LayerBuffer instead keeps each field in a preallocated buffer that is longer
+than the column. The column is a window (a view) into that buffer, and adding
+a surface layer just moves the top of the window up by one: no allocation and,
+if the field was not replaced by a new array since the last push, no copy.
+When the window reaches the start of the buffer it is copied back to the end,
+so the cost of that copy is spread over many time steps.
+
+Regridding (regrid22) goes the other way: it replaces a few layers near the
+top and the bottom layer with new ones and the layers in between move up. With
+shift, the window moves down instead, so those layers are not copied.
+'''
+
+import numpy as np
+
+class LayerBuffer:
+    '''
+    Per-layer field storage for the firn column.
+
+    Fields are added on their first push. Each field has its own buffer (so
+    that it keeps its own dtype and each column view is contiguous), all of
+    them are moved together by the time loop.
+
+    Usage, in place of self.rho = np.concatenate(([rhos0], self.rho[:-1])):
+
+        self.rho = self.LB.push('rho', rhos0, self.rho)
+
+    The arrays returned by push are views into the buffer. They can be
+    modified in place and passed anywhere a regular array is used. If the
+    model replaces the field with a new array (e.g. self.rho = self.rho + x),
+    the next push copies it into the buffer (still without allocating).
+    '''
+
+    def __init__(self, spare=1000):
+        '''
+        :param spare: number of pushes between the copies that move the
+        window back to the end of the buffer (at least the column length is
+        used)
+        '''
+        self.spare  = spare
+        self.buf    = {} # preallocated buffer for each field
+        self.head   = {} # index of the top (surface) layer in the buffer
+        self.view   = {} # the current column for each field
+
+    def push(self, name, new, x):
+        '''
+        Add a new surface layer to field 'name' and drop its bottom layer.
+
+        :param name: field name
+        :param new: value for the new surface layer
+        :param x: current column of the field
+
+        :return: the updated column; same values and dtype as
+        np.concatenate(([new], x[:-1]))
+        '''
+
+        n       = len(x)
+        dtype   = np.result_type(np.asarray([new]), x)
+        buf     = self.buf.get(name)
+
+        if (buf is None) or (buf.dtype != dtype) or (len(buf) < 3 * n):
+            buf = self._allocate(name, n, dtype)
+
+        if x is self.view[name]: # the field is still the window; move the top up
+            head = self.head[name]
+            if head == 0: # no room above: copy the column back to the end of the buffer
+                head = len(buf) - n
+                buf[head:] = x
+            head -= 1
+        else: # the field was replaced by a new array; copy it in
+            head = len(buf) - n
+            if self.view[name] is not None: # do not write over the current window, which may still be referenced
+                old = self.head[name]
+                if old + len(self.view[name]) > head:
+                    head = old - n
+                if head < 0:
+                    buf     = self._allocate(name, n, dtype)
+                    head    = len(buf) - n
+            buf[head + 1:head + n] = x[:-1]
+
+        buf[head]           = new
+        self.head[name]     = head
+        self.view[name]     = buf[head:head + n]
+
+        return self.view[name]
+
+    def shift(self, name, x, d, top, bottom):
+        '''
+        Move the layers of field 'name' below the top d layers down the
+        column, for regridding: the column becomes
+        np.concatenate((top, x[len(top) + d:n - len(bottom) + d], bottom)).
+
+        The window moves down by d instead, so the layers in the middle stay
+        where they are in the buffer and only top and bottom are written.
+
+        :param name: field name
+        :param x: current column of the field
+        :param d: number of layers the middle part moves up the column (at
+        most len(bottom))
+        :param top: new layers at the top of the column
+        :param bottom: new layers at the bottom of the column
+
+        :return: the updated column (dtype of x, as for x changed in place)
+        '''
+
+        n       = len(x)
+        t, b    = len(top), len(bottom)
+        buf     = self.buf.get(name)
+
+        if (buf is None) or (buf.dtype != x.dtype) or (len(buf) < 3 * n):
+            buf = self._allocate(name, n, x.dtype)
+
+        if x is self.view[name]: # the field is still the window; move it down
+            head = self.head[name] + d
+            if head + n > len(buf): # no room below: copy the middle back to the end of the buffer
+                old     = head
+                head    = len(buf) - n
+                buf[head + t:head + n - b] = buf[old + t:old + n - b]
+        else: # the field was replaced by a new array; copy the middle in
+            head = len(buf) - n
+            if self.view[name] is not None: # do not write over the current window, which may still be referenced
+                old = self.head[name]
+                if old + len(self.view[name]) > head:
+                    head = old - n
+                if head < 0:
+                    buf     = self._allocate(name, n, x.dtype)
+                    head    = len(buf) - n
+            buf[head + t:head + n - b] = x[t + d:n - b + d]
+
+        buf[head:head + t]          = top
+        buf[head + n - b:head + n]  = bottom
+        self.head[name]     = head
+        self.view[name]     = buf[head:head + n]
+
+        return self.view[name]
+
+    def _allocate(self, name, n, dtype):
+        '''
+        New buffer for field 'name' with a column length of n.
+        '''
+        buf             = np.empty(2 * n + max(self.spare, n), dtype = dtype)
+        self.buf[name]  = buf
+        self.view[name] = None
+        return buf
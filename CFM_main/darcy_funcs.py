@@ -180,6 +180,188 @@ def flux_newtonraphson(gc,LWCav,glwcacm,th_i,th_s,lwc,dz,avG,nvG,mvG,eps_cvg):
     return(gc)
 
 
+def pair_feq(gc,pair,lwc0,lwc1,dltz):
+    '''
+    Equilibrium variable (f_eq, Eq.(20) of Hirashima et al. (2010)) at the interface between
+    two neighbouring nodes for a water flux gc, and the effective saturation of the two nodes.
+    Same operations as thetae_update and phead_vG, for the two nodes of one interface with
+    scalars; the powers are done on 2-element arrays so that they give the same values as
+    the array functions.
+    pair: (th_i, th_s, dz, alpha, n, m) of the upper node, then the same for the lower node
+    '''
+    th_i0,th_s0,dz0,a0,n0,m0,th_i1,th_s1,dz1,a1,n1,m1 = pair
+    stab_e = np.float64(1e-9) #stabilisation theta_e
+    th_e0  = (((lwc0+0.)-gc)/dz0-th_i0)/(th_s0-th_i0) #effective water saturatin, Hirashima 2010 (5)
+    th_e1  = (((lwc1+gc)-0.)/dz1-th_i1)/(th_s1-th_i1)
+    th_e0  = stab_e if th_e0<stab_e else th_e0 #avoid negative effective saturation
+    th_e1  = stab_e if th_e1<stab_e else th_e1
+    th_e0  = 1-stab_e if th_e0>1-stab_e else th_e0 #avoid effective saturation equal to 1
+    th_e1  = 1-stab_e if th_e1>1-stab_e else th_e1
+    pw     = np.power(np.array((th_e0,th_e1)),np.array((-1/m0,-1/m1)))
+    pw     = np.power(np.array((pw[0]-1,pw[1]-1)),np.array((1/n0,1/n1)))
+    f_eq   = 1/a0*pw[0]-1/a1*pw[1]-dltz #Hirashima 2010 Eq.(20) evaluated at interface
+    return(f_eq,th_e0,th_e1)
+
+def thetaeff_equaliser_pair(pair,lwc0,lwc1):
+    '''
+    thetaeff_equaliser for the two nodes of one interface, with scalars
+    '''
+    th_i0,th_s0,dz0,a0,n0,m0,th_i1,th_s1,dz1,a1,n1,m1 = pair
+    th_e00 = (lwc0/dz0-th_i0)/(th_s0-th_i0) #effective water saturatin, Hirashima 2010 (5)
+    th_e01 = (lwc1/dz1-th_i1)/(th_s1-th_i1)
+    lwflux = ((dz0*(th_s0-th_i0))**(-1)+(dz1*(th_s1-th_i1))**(-1))**(-1) * (th_e00-th_e01)
+    return(lwflux)
+
+def dfdg_derivative_pair(pair,th_e0,th_e1):
+    '''
+    dfdg_derivative for the two nodes of one interface, with scalars
+    '''
+    th_i0,th_s0,dz0,a0,n0,m0,th_i1,th_s1,dz1,a1,n1,m1 = pair
+    pw  = np.power(np.array((th_e0,th_e0,th_e1,th_e1)),np.array((-1*(1+1/m0),-1/m0,-1*(1+1/m1),-1/m1)))
+    pw2 = np.power(np.array((pw[1]-1,pw[3]-1)),np.array(((1-n0)/n0,(1-n1)/n1)))
+    dfdg = 1/((th_s0-th_i0)*a0*n0*m0*dz0) * pw[0] * pw2[0] + \
+        1/((th_s1-th_i1)*a1*n1*m1*dz1) * pw[2] * pw2[1]
+    return(dfdg)
+
+def flux_bisection_pair(gc,g1,pair,lwc0,lwc1,eps_cvg):
+    '''
+    flux_bisection for the two nodes of one interface, with scalars
+    g1: upper bisection bound
+    '''
+    bisitmax = 100 #maximum number of iteration for bisection algorithm
+    bisit    = 0 #iteration number for bisection algorithm
+    cvg_bis  = False #convergence criterion for Bisection
+    dltz     = 1/2*(pair[2]+pair[8]) #distance between the centres of the two nodes
+    f_eq,gth_e0,gth_e1 = pair_feq(gc,pair,lwc0,lwc1,dltz)
+    g0       = 0. #lower bisection bound
+    while (cvg_bis==False and bisit<bisitmax): #start Bisection (if cvg_bis is False)
+        gprev0 = gc #flux guess at previous iteration
+        if f_eq<0: #hd[0] too low -> increase outgoing flux
+            g0 = gc #updated lower bound
+            gc = (g1+g0)/2 #updated guess
+        elif f_eq>0: #hd[j1] too high -> decrease outgoing flux
+            g1 = gc #updated lower bound
+            gc = (g1+g0)/2 #updated guess
+        f_eq,gth_e0,gth_e1 = pair_feq(gc,pair,lwc0,lwc1,dltz)
+        if (f_eq<0 and gth_e0<1e-8):
+            # Equilibrium requires higher outflow but max outflow already prescribed (CV[0] dried) #
+            cvg_bis = True
+        elif (f_eq<0 and gth_e1>0.95):
+            # Equilibrium requires higher outflow but underlying node is aturated (CV[j1+1] saturated) #
+            cvg_bis = True
+        elif (f_eq>0 and gc<=1e-6):
+            # Equilibrium requires less outflow but min outflow already prescribed
+            gc = 0. #set outlfow to 0
+            cvg_bis = True
+        if abs(f_eq)<eps_cvg or abs(gc-gprev0)<1e-6:
+            # Flux estimate has converged
+            cvg_bis = True
+        bisit += 1 #increase iteration number
+        if bisit==bisitmax:
+            print('Maximum iteration number reached in bisection algorithm')
+    return(gc)
+
+def flux_newtonraphson_pair(gc,g1,pair,lwc0,lwc1,eps_cvg):
+    '''
+    flux_newtonraphson for the two nodes of one interface, with scalars
+    g1: upper bound for the bisection algorithm if Newton-Raphson diverges
+    '''
+    nritmax = 20 #maximum number of iteration for Newton-Raphson algorithm
+    nrit    = 0 #iteration number for Newton-Raphson algorithm
+    cvg_nr  = False #convergence criterion for Newton-Raphson
+    dltz    = 1/2*(pair[2]+pair[8]) #distance between the centres of the two nodes
+    f_eq,gth_e0,gth_e1 = pair_feq(gc,pair,lwc0,lwc1,dltz)
+    while ((cvg_nr==False) and nrit<nritmax):
+        # Values of previous iteration #
+        gprev0 = gc
+        fprev0 = f_eq
+
+        if (f_eq<0 and gth_e0<1e-8):
+            # Equilibrium requires higher outflow but max outflow already prescribed (CV[0] dried) #
+            cvg_nr = True
+        elif (f_eq<0 and gth_e1>0.95):
+            # Equilibrium requires higher outflow but underlying node is aturated (CV[j1+1] saturated) #
+            cvg_nr = True
+        elif (f_eq>0 and gc<=1e-6):
+            # Equilibrium requires less outflow but min outflow already prescribed
+            gc = 0. #set outlfow to 0
+            cvg_nr = True
+
+        else: #Newton-Raphson to improve current guess of glw
+            #Computation for derivative d(f_eq)/d(glw[j1])
+            dfdg = dfdg_derivative_pair(pair,gth_e0,gth_e1)
+            deltaglw = -1*fprev0/dfdg #step in glw guess
+            gc = gprev0+deltaglw #adjust glw guess
+            f_eq,gth_e0,gth_e1 = pair_feq(gc,pair,lwc0,lwc1,dltz)
+            if ((abs(f_eq)>abs(fprev0)) or (abs(dfdg)>1e6)):
+                #Newton-Raphson diverges: use bisection algorithm #
+                gc = flux_bisection_pair(gprev0,g1,pair,lwc0,lwc1,eps_cvg)
+                cvg_nr = True
+
+        nrit += 1
+        if abs(f_eq)<eps_cvg or abs(gc-gprev0)<1e-6:
+            # Flux estimate has converged
+            cvg_nr = True
+        if nrit==nritmax:
+            print('Maximum iteration number reached in Newton-Raphson algorithm')
+    return(gc)
+
+def flux_interfaces(i11,unsteady,glwflux_d1,dtsub,LWC,LWCav,LWCacm,imp,th_i,th_s,dz,avG,nvG,mvG,dltz,eps_cvg):
+    '''
+    Computes the water flux glw (equivalent of qlim in Hirashima et al. (2010)) at each interface
+    in i11, starting from the bottom-most interface. The flux at each interface equalises the
+    head pressures of the two nodes, given the fluxes already found below it.
+
+    This is the interface loop of melt.darcyscheme, done with scalars for each interface
+    (instead of 2-element arrays) and updating only the two nodes that change after each
+    interface (instead of the whole column), with the same results.
+
+    i11:        indices of the interfaces (upper node) that can have outflow, increasing
+    unsteady:   for each interface, True if the first guess should equalise saturation
+                (glw flux not in steady state), False to start from the previous flux glwflux_d1
+    imp:        indices of the impermeable nodes
+    '''
+    ncv      = len(LWC)
+    glw      = np.zeros(ncv-1) #initialise guess of downward transported lwc (equivalent of qlim in Hirashima 2010)
+    glwc     = np.copy(LWC) #initialise updated lwc after glw has been transported
+    glwcacm  = np.copy(LWCacm) #initialise updated lwcacm after glw has been transported
+    isimp    = np.zeros(ncv,dtype=bool)
+    isimp[imp] = True
+
+    for j1 in np.flip(i11): #find qlim at each interface in turn starting from bottom-most interface
+        j2   = j1+1
+        pair = (th_i[j1],th_s[j1],dz[j1],avG[j1],nvG[j1],mvG[j1],th_i[j2],th_s[j2],dz[j2],avG[j2],nvG[j2],mvG[j2])
+        lwc0 = glwc[j1]
+        lwc1 = glwc[j2]
+        # First guess value for glw[j1] #
+        if unsteady[j1]:
+            # glw flux is not in steady state: first guess equalises saturation[j1] and saturation[j1+1] #
+            gc = thetaeff_equaliser_pair(pair,lwc0,lwc1)
+            gc = max(gc,0) #avoid negative guess values
+            gc = min(gc,min(LWCav[j1],glwcacm[j2])) #guess values cannot exceed available LWC
+        else:
+            # glw flux is stable: initial guess keeps previous value #
+            gc = dtsub*glwflux_d1[j1] #glw set to flux corresponding to glw calculated at previous Darcy step
+            gc = min(gc,min(LWCav[j1],glwcacm[j2])) #guess values cannot exceed available LWC
+        glw[j1] = gc
+
+        # Calculate equilibrium #
+        f_eq = pair_feq(glw[j1],pair,lwc0,lwc1,dltz[j1])[0]
+        g1   = min(LWCav[0],glwcacm[1]) #upper bisection bound, as in flux_bisection
+        if f_eq>1.:
+            # Initial guess gives f_eq far from 0: Bisection algorithm #
+            glw[j1] = flux_bisection_pair(glw[j1],g1,pair,lwc0,lwc1,eps_cvg)
+        else:
+            # Initial guess gives f_eq close to 0: Newton-Raphson algorithm #
+            glw[j1] = flux_newtonraphson_pair(glw[j1],g1,pair,lwc0,lwc1,eps_cvg)
+
+        # Update glwc and glwcacm of the two nodes according to updated flow (to compute gtheta_e when dealing with upper nodes) #
+        for kk in (j1,j2):
+            glwc[kk]    = (LWC[kk]+(glw[kk-1] if kk>0 else 0.))-(glw[kk] if kk<ncv-1 else 0.)
+            glwcacm[kk] = 0. if isimp[kk] else dz[kk]*th_s[kk]-glwc[kk] #do not allow for water storage in impermeable ice lenses
+
+    return(glw)
+
 def runoffZuoOerlemans(dt,slope,lwcexcess,inds):
     '''
     Computes runoff according to the Zuo and Oerlemans (1996) parameterisation
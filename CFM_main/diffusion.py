@@ -129,12 +129,8 @@ def heatDiff(self,iii):
     c_firn          = 152.5 + 7.122 * phi_0 # specific heat, Cuffey and Paterson, eq. 9.1 (page 400)
     # c_firn        = CP_I # If you prefer a constant specific heat.
 
-    if self.c['MELT']:
-        try:
-            if self.c['LWCheat']=='lowK':
-                K_firn[self.LWC>0]=K_firn[self.LWC>0]/1.e4
-        except:
-            pass
+    if ((self.plan.MELT) and (self.plan.LWCheat=='lowK')):
+        K_firn[self.LWC>0]=K_firn[self.LWC>0]/1.e4
 
     Gamma_P         = K_firn
 
@@ -149,8 +145,8 @@ def heatDiff(self,iii):
         print(f'domain depth is {self.z[-1]}, so T10m does not exist')
         self.T10m = np.nan
 
-    if self.c['MELT']:
-        if self.c['LWCheat']=='effectiveT':
+    if self.plan.MELT:
+        if self.plan.LWCheat=='effectiveT':
             pass
 
         elif np.any(self.Tz>273.1500001):
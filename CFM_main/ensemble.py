@@ -0,0 +1,417 @@
+#!/usr/bin/env python
+'''
+ensemble.py
+===========
+Class to run an ensemble of firn columns (e.g. many ice-sheet grid cells) in
+a single process. The state of all of the columns is held in 2-D
+(column x layer) arrays, and densification, grain growth, accumulation, and
+heat diffusion are done as array operations on the whole ensemble at each
+time step rather than stepping each column separately. Densification and
+grain growth use physics.FirnPhysics (the same code as a single-column run)
+on the 2-D arrays.
+
+Each member of the ensemble is set up as a regular FirnDensityNoSpin instance
+(so forcing, spin up, and model outputs are handled exactly as they are for a
+single-column run), and each member writes its own results file.
+
+Columns do not need to have the same number of layers; shorter columns are
+padded at the bottom, and the padding is ignored.
+
+The ensemble currently supports dry-firn runs: MELT, doublegrid, merging,
+FirnAir, isoDiff, SEB, manualT, THist, spinUpdate and the strain modules must
+be off, and physRho must be one of the physics in ENSEMBLE_PHYSICS.
+
+Copyright © 2021 C. Max Stevens
+
+Distributed under terms of the MIT license.
+'''
+
+import numpy as np
+import sys
+import json
+from firn_density_nospin import FirnDensityNoSpin
+from physics import FirnPhysics
+from diffusion import firnConductivity
+from solver import solver_batch
+from writer import write_nospin_hdf5
+from constants import *
+
+ENSEMBLE_PHYSICS = ['HLdynamic','Li2004','Helsen2008','Arthern2010S','Arthern2010T','Ligtenberg2011','KuipersMunneke2015']
+
+### defaults (set in FirnDensityNoSpin) of the settings that must be the same for all members
+SHARED_DEFAULTS = {'conductivity': 'Calonne2019', 'no_densification': False}
+
+class FirnDensityEnsemble:
+    '''
+    Class for running many firn columns at once.
+
+    Parameters
+    ----------
+    : configNames: list of json config files, one for each column
+    : climateTS: list of climateTS dictionaries (one for each column), or None for csv inputs
+    : NewSpin: passed to FirnDensityNoSpin
+    : SEBfluxes: list of SEBfluxes dictionaries, or None
+
+    Everything that varies with depth is stored as an array with shape
+    (nens, gridLen), where nens is the number of columns and gridLen is the
+    length of the longest column. Forcing is stored as (nens, stp).
+    '''
+
+    def __init__(self, configNames, climateTS = None, NewSpin = False, SEBfluxes = None):
+        '''
+        Initializes each member of the ensemble and stacks their states.
+        '''
+
+        self.nens = len(configNames)
+        if climateTS is None:
+            climateTS = [None] * self.nens
+        if SEBfluxes is None:
+            SEBfluxes = [None] * self.nens
+
+        ### check the configurations before the members are set up (each one runs its spin up)
+        configs = []
+        for configName in configNames:
+            with open(configName, "r") as f:
+                configs.append(json.load(f))
+        self.check_config(configs)
+
+        self.members = [FirnDensityNoSpin(configNames[kk], climateTS = climateTS[kk], NewSpin = NewSpin, SEBfluxes = SEBfluxes[kk]) for kk in range(self.nens)]
+        self.c = self.members[0].c
+
+        m0          = self.members[0]
+        self.stp    = m0.stp
+        self.dt     = m0.dt
+        self.t      = m0.t
+        self.modeltime = m0.modeltime
+        for mm in self.members:
+            if ((mm.stp != self.stp) or (not np.array_equal(mm.dt, self.dt))):
+                print('All ensemble members must have the same model time steps. Exiting.')
+                sys.exit()
+
+        ### forcing, (nens, stp)
+        self.bdotSec    = np.array([mm.bdotSec for mm in self.members])
+        self.Ts         = np.array([mm.Ts for mm in self.members])
+        self.T_mean     = np.array([mm.T_mean for mm in self.members])
+        self.bdot_av    = np.array([mm.bdot_av for mm in self.members])
+        self.rhos0      = np.array([mm.rhos0 for mm in self.members])
+
+        ### grid, (nens, gridLen)
+        self.lens       = np.array([mm.gridLen for mm in self.members])
+        self.gridLen    = np.max(self.lens)
+        self.last       = self.lens - 1 # index of the bottom layer of each column
+        self.rows       = np.arange(self.nens)
+        self.valid      = np.arange(self.gridLen)[None,:] < self.lens[:,None]
+
+        self.rho        = self.stack('rho')
+        self.Tz         = self.stack('Tz')
+        self.age        = self.stack('age')
+        self.dz         = self.stack('dz')
+        self.mass       = self.stack('mass')
+        self.Dcon       = self.stack('Dcon').astype(float)
+        self.dx         = np.ones_like(self.dz)
+        self.LWC        = np.zeros_like(self.dz)
+        if self.c['physGrain']:
+            self.r2     = self.stack('r2')
+        else:
+            self.r2     = None
+
+        self.z          = self.dz.cumsum(axis = 1)
+        self.z          = np.concatenate((np.zeros((self.nens,1)), self.z[:,:-1]), axis = 1)
+        for kk, mm in enumerate(self.members): # keep the spin-up depths exactly
+            self.z[kk,:self.lens[kk]] = mm.z
+        self.sigma      = (self.mass + (self.LWC * RHO_W_KGM)) * self.dx * GRAVITY
+        self.sigma      = self.sigma.cumsum(axis = 1)
+        self.mass_sum   = self.mass.cumsum(axis = 1)
+        self.bdot_mean  = self.stack('bdot_mean')
+        self.T10m       = np.array([mm.T10m for mm in self.members])
+
+        ### forcing for the physics, (stp, nens, 1): indexed by time step, it broadcasts along depth
+        self.bdotSec_FP = self.bdotSec.T[:,:,None]
+        self.T_mean_FP  = self.T_mean.T[:,:,None]
+        self.bdot_av_FP = self.bdot_av.T[:,:,None]
+
+        ### one physics instance (physics.FirnPhysics) for all of the columns
+        self.FP             = FirnPhysics({})
+        self.densification  = self.FP.densification(self.c['physRho'])
+
+        ### steps at which each member writes output
+        self.write_steps = np.array([mm.TWindex >= 0 for mm in self.members])
+
+    ####################
+    ##### END INIT #####
+    ####################
+
+    def check_config(self, configs):
+        '''
+        Make sure that all members use a configuration that the ensemble
+        supports, and that the settings that are shared by the whole ensemble
+        are the same for each member.
+
+        :param configs: list of the .json configurations (dictionaries) of the members
+        '''
+
+        off_keys = ['doublegrid', 'merging', 'FirnAir', 'isoDiff', 'SEB', 'manualT', 'spinUpdate', 'strain_softening', 'horizontal_divergence', 'THist']
+        shared_keys = ['physRho', 'bdot_type', 'physGrain', 'calcGrainSize', 'r2s0', 'heatDiff', 'conductivity', 'no_densification']
+
+        c0 = configs[0]
+        for c in configs:
+            if c.get('MELT', False):
+                print('Ensemble runs do not support MELT. Exiting.')
+                sys.exit()
+            for key in off_keys:
+                if ((key in c) and (c[key])):
+                    print(f'Ensemble runs do not support "{key}". Exiting.')
+                    sys.exit()
+            for key in shared_keys:
+                if c.get(key, SHARED_DEFAULTS.get(key)) != c0.get(key, SHARED_DEFAULTS.get(key)):
+                    print(f'"{key}" must be the same for all ensemble members. Exiting.')
+                    sys.exit()
+
+        if c0.get('physRho') not in ENSEMBLE_PHYSICS:
+            print(f'physRho {c0.get("physRho")} is not available for ensemble runs.')
+            print(f'Choose one of {ENSEMBLE_PHYSICS}. Exiting.')
+            sys.exit()
+        if c0.get('bdot_type') not in ['mean', 'instant']:
+            print('bdot_type must be "mean" or "instant" for ensemble runs. Exiting.')
+            sys.exit()
+        if ((c0['physRho']=='Arthern2010T') and (not c0.get('physGrain'))):
+            print('Grain growth should be on for Arthern Transient. Exiting.')
+            sys.exit()
+
+    def stack(self, varname):
+        '''
+        Stack a depth variable from each member into a (nens, gridLen) array,
+        padding short columns with the value of their bottom layer.
+        '''
+        out = np.zeros((self.nens, self.gridLen))
+        for kk, mm in enumerate(self.members):
+            vv = getattr(mm, varname)
+            out[kk,:self.lens[kk]] = vv
+            out[kk,self.lens[kk]:] = vv[-1]
+        return out
+
+    def pad(self, var):
+        '''
+        Reset the padding below the bottom layer of each column
+        '''
+        return np.where(self.valid, var, var[self.rows, self.last][:,None])
+
+    def time_evolve(self):
+        '''
+        Evolve all of the columns through time. This mirrors the dry-firn path
+        of FirnDensityNoSpin.time_evolve.
+        '''
+
+        self.steps = 1 / np.mean(self.t) # steps per year
+        dt_mean = np.mean(S_PER_YEAR/self.dt)
+        zero_col = np.zeros((self.nens,1))
+
+        ### entries of PhysParams that are the same at every time step
+        phys_static = {
+            'bdot_type':        self.c['bdot_type'],
+            'physGrain':        self.c['physGrain'],
+            'calcGrainSize':    self.c['calcGrainSize'],
+            'r2s0':             self.c['r2s0'],
+            'steps':            self.steps,
+            'MELT':             False,
+            'FirnAir':          False,
+            'bdotSec':          self.bdotSec_FP,
+            'T_mean':           self.T_mean_FP,
+            'bdot_av':          self.bdot_av_FP,
+        }
+
+        print('modeltime',self.modeltime[0],self.modeltime[-1])
+        print('ensemble members:', self.nens)
+        for iii in range(self.stp):
+            mtime = self.modeltime[iii]
+
+            ### densification
+            PhysParams = {
+                **phys_static,
+                'iii':          iii,
+                'gridLen':      self.rho.shape, # np.zeros(gridLen) in FirnPhysics gives a (nens, gridLen) array
+                'bdot_mean':    self.bdot_mean,
+                'Tz':           self.Tz,
+                'rho':          self.rho,
+                'sigma':        self.sigma,
+                'dt':           self.dt[iii],
+                'r2':           self.r2,
+            }
+            self.FP.update(PhysParams)
+            RD      = self.densification()
+            drho_dt = RD['drho_dt']
+            if self.c['no_densification']:
+                drho_dt = np.zeros_like(drho_dt)
+            self.viscosity = RD['viscosity']
+
+            self.rho_old    = np.copy(self.rho)
+            self.rho        = self.rho + self.dt[iii] * drho_dt
+            self.dz_old     = np.copy(self.dz)
+            self.sdz_old    = np.sum(self.dz * self.valid, axis = 1)
+            self.z_old      = np.copy(self.z)
+            self.dz         = self.mass / self.rho * self.dx
+            self.z          = self.dz.cumsum(axis = 1)
+            self.z          = np.concatenate((zero_col, self.z[:,:-1]), axis = 1)
+
+            self.sdz_new    = np.sum(self.dz * self.valid, axis = 1)
+            ddz             = self.dz_old - self.dz
+
+            ### grain growth
+            if self.c['physGrain']:
+                self.r2 = self.FP.graincalc(iii)
+
+            ### accumulation: columns with new snow get a new layer on top
+            acc = (self.bdotSec[:,iii] > 0)
+            acc2 = acc[:,None]
+            self.dzNew  = np.where(acc, self.bdotSec[:,iii] * RHO_I / self.rhos0[:,iii] * S_PER_YEAR, 0.0)
+            self.dh_acc = self.dzNew
+            massNew     = self.bdotSec[:,iii] * S_PER_YEAR * RHO_I
+
+            self.age    = np.where(acc2, np.concatenate((zero_col, self.age[:,:-1]), axis = 1), self.age) + self.dt[iii]
+            self.dz     = np.where(acc2, np.concatenate((self.dzNew[:,None], self.dz[:,:-1]), axis = 1), self.dz)
+            self.rho    = np.where(acc2, np.concatenate((self.rhos0[:,iii,None], self.rho[:,:-1]), axis = 1), self.rho)
+            self.mass   = np.where(acc2, np.concatenate((massNew[:,None], self.mass[:,:-1]), axis = 1), self.mass)
+            self.Dcon   = np.where(acc2, np.concatenate((iii * np.ones((self.nens,1)), self.Dcon[:,:-1]), axis = 1), self.Dcon)
+            self.compaction = np.where(acc2, np.concatenate((zero_col, ddz[:,:-1]), axis = 1), ddz)
+            if self.c['physGrain']:
+                r2surface = self.FP.surfacegrain() * np.ones((self.nens,1))
+                self.r2 = np.where(acc2, np.concatenate((r2surface, self.r2[:,:-1]), axis = 1), self.r2)
+            Tnew        = np.concatenate((self.Ts[:,iii,None], self.Tz[:,:-1]), axis = 1)
+            Tdry        = self.Tz.copy()
+            Tdry[:,0]   = self.Ts[:,iii]
+            self.Tz     = np.where(acc2, Tnew, Tdry)
+
+            self.age    = self.pad(self.age)
+            self.dz     = self.pad(self.dz)
+            self.rho    = self.pad(self.rho)
+            self.mass   = self.pad(self.mass)
+            self.Dcon   = self.pad(self.Dcon)
+            self.Tz     = self.pad(self.Tz)
+            if self.c['physGrain']:
+                self.r2 = self.pad(self.r2)
+
+            znew        = np.where(acc2, np.concatenate((zero_col, self.dz.cumsum(axis = 1)[:,:-1]), axis = 1), self.z)
+            self.z      = znew
+            self.w_firn = (znew - self.z_old) / self.dt[iii]
+
+            self.sigma      = (self.mass + (self.LWC * RHO_W_KGM)) * self.dx * GRAVITY
+            self.sigma      = self.sigma.cumsum(axis = 1)
+            self.mass_sum   = self.mass.cumsum(axis = 1)
+            self.bdot_mean  = (np.concatenate((self.mass_sum[:,:1] / (RHO_I * S_PER_YEAR), self.mass_sum[:,1:] * self.t[iii] / (self.age[:,1:] * RHO_I)), axis = 1)) * dt_mean * S_PER_YEAR
+
+            ### heat diffusion
+            if self.c['heatDiff']:
+                self.Tz, self.T10m = self.heatDiff(iii)
+            else:
+                self.Tz = self.Ts[:,iii,None] * np.ones_like(self.Tz)
+                if iii==0:
+                    print('warning: heat diffusion off, setting temp to Ts[iii]')
+
+            self.rho[self.rho>RHO_I] = RHO_I
+
+            ### write results for each member that writes at this time step
+            for kk in np.where(self.write_steps[:,iii])[0]:
+                self.sync_member(kk)
+                self.members[kk].update_outputs(iii, mtime)
+
+        ##################################
+        ##### END TIME-STEPPING LOOP #####
+        ##################################
+
+        for kk, mm in enumerate(self.members):
+            self.sync_member(kk)
+            write_nospin_hdf5(mm, mm.MOutputs.Mout_dict, mm.forcing_dict)
+
+    ###########################
+    ##### END time_evolve #####
+    ###########################
+
+    def sync_member(self, kk):
+        '''
+        Copy the state of column kk into its FirnDensityNoSpin instance so
+        that the regular output routines can be used.
+        '''
+        mm = self.members[kk]
+        nn = self.lens[kk]
+
+        for varname in ['rho', 'Tz', 'z', 'dz', 'age', 'mass', 'sigma', 'mass_sum', 'bdot_mean', 'Dcon', 'compaction', 'viscosity', 'w_firn', 'LWC']:
+            setattr(mm, varname, getattr(self, varname)[kk,:nn].copy())
+        if self.c['physGrain']:
+            mm.r2 = self.r2[kk,:nn].copy()
+
+        mm.T10m     = self.T10m[kk]
+        mm.T50      = np.mean(mm.Tz[mm.z<50])
+        mm.sdz_old  = self.sdz_old[kk]
+        mm.sdz_new  = self.sdz_new[kk]
+        mm.dh_acc   = self.dh_acc[kk]
+        mm.dzNew    = self.dzNew[kk]
+        mm.dh_melt  = 0
+
+    def heatDiff(self, iii):
+        '''
+        Heat diffusion for all columns; this is diffusion.heatDiff with the
+        finite-volume coefficients built as (nens, gridLen) arrays and all
+        columns solved in one call to solver_batch.
+
+        The bottom boundary (zero gradient) is applied at the bottom layer of
+        each column; the padding below it is held fixed.
+        '''
+
+        ### edges: add a dummy point below the bottom layer of each column
+        z_edges = np.concatenate((self.z, self.z[:,-1:]), axis = 1)
+        z_edges[self.rows, self.last+1] = self.z[self.rows, self.last] + (self.z[self.rows, self.last] - self.z[self.rows, self.last-1])
+        Z_P     = (z_edges[:,1:] + z_edges[:,:-1]) / 2
+
+        phi_s   = self.Tz[:,0]
+        phi_0   = self.Tz
+
+        K_ice   = 9.828 * np.exp(-0.0057 * phi_0) # thermal conductivity, Cuffey and Paterson, eq. 9.2 (Yen 1981)
+        K_firn  = firnConductivity(self, iii, K_ice)
+        c_firn  = 152.5 + 7.122 * phi_0 # specific heat, Cuffey and Paterson, eq. 9.1 (page 400)
+        Gamma_P = K_firn
+        c_vol   = self.rho * c_firn
+
+        with np.errstate(divide = 'ignore', invalid = 'ignore'): # padding can give zero-width volumes
+            dZ          = np.diff(z_edges, axis = 1)
+            dZ_P        = np.diff(Z_P, axis = 1)
+            deltaZ_u    = np.concatenate((dZ_P[:,:1], dZ_P), axis = 1)
+            deltaZ_d    = np.concatenate((dZ_P, dZ_P[:,-1:]), axis = 1)
+
+            f_u = 1 - (Z_P - z_edges[:,0:-1]) / deltaZ_u
+            f_d = 1 - (z_edges[:,1:] - Z_P) / deltaZ_d
+
+            Gamma_U = np.concatenate((Gamma_P[:,:1], Gamma_P[:,0:-1]), axis = 1)
+            Gamma_D = np.concatenate((Gamma_P[:,1:], Gamma_P[:,-1:]), axis = 1)
+            Gamma_u = 1 / ((1 - f_u) / Gamma_P + f_u / Gamma_U) # Patankar eq. 4.9
+            Gamma_d = 1 / ((1 - f_d) / Gamma_P + f_d / Gamma_D)
+
+            a_U     = Gamma_u / deltaZ_u
+            a_D     = Gamma_d / deltaZ_d
+            a_P_0   = c_vol * dZ / self.dt[iii]
+            a_P     = a_U + a_D + a_P_0
+            b       = a_P_0 * phi_0
+
+        ### upper boundary: specified temperature
+        a_P[:,0]    = 1
+        a_U[:,0]    = 0
+        a_D[:,0]    = 0
+        b[:,0]      = phi_s
+
+        ### padding: phi stays as it is
+        a_P[~self.valid] = 1
+        a_U[~self.valid] = 0
+        a_D[~self.valid] = 0
+        b[~self.valid]   = phi_0[~self.valid]
+
+        ### lower boundary: zero gradient at the bottom layer of each column
+        a_P[self.rows, self.last] = 1
+        a_D[self.rows, self.last] = 0
+        a_U[self.rows, self.last] = 1
+        b[self.rows, self.last]   = 0
+
+        Tz = solver_batch(a_U, a_D, a_P, b)
+
+        deep    = (self.z >= 10.0) & self.valid
+        T10m    = np.where(np.any(deep, axis = 1), Tz[self.rows, np.argmax(deep, axis = 1)], np.nan)
+
+        return Tz, T10m
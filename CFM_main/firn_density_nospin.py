@@ -20,9 +20,11 @@ from physics import *
 from constants import *
 from melt import *
 from strain import *
-from isotopeDiffusion import isotopeDiffusion
-from SEB import SurfaceEnergyBudget
-from firn_density_spin import FirnDensitySpin
+from column import LayerBuffer
+from spincache import spin_key, get_cached_spin, store_spin
+from checkpoint import write_checkpoint, remove_checkpoint
+from timing import PhaseTimer, NullTimer
+from runplan import check_config, RunPlan
 import numpy as np
 import csv
 import json
@@ -30,27 +32,18 @@ import sys
 import math
 from shutil import rmtree
 import os
-import psutil
 import shutil
 import time
-import inspect
 import h5py
 import scipy.interpolate as interpolate
-from firn_air import FirnAir
 from regrid import *
-try:
-    import pandas as pd
-except:
-    print('You do not have the pandas python package installed.')
-    print('It is used to create a running mean temperature.')
-
 from merge import mergeall #VV
 from merge import mergesurf #VV
 from merge import mergenotsurf #VV
-from re_snowpack import resingledomain #VV
-from prefflow_snowpack import prefflow #VV
 from sublim import sublim #VV
 from ModelOutputs import ModelOutputs
+### The spin up, SEB, firn air, isotope, and snowpack liquid schemes (and pandas)
+### are imported where they are used, so runs that do not use them do not import them.
 
 class FirnDensityNoSpin:
     '''
@@ -104,6 +97,9 @@ class FirnDensityNoSpin:
             jsonString      = f.read()
             self.c          = json.loads(jsonString)
 
+        ### stop now if the .json has errors, rather than after the spin up or during the run
+        check_config(self.c)
+
         self.SEBfluxes = SEBfluxes
 
         spinner = os.path.exists(os.path.join(self.c['resultsFolder'], self.c['spinFileName']))
@@ -121,11 +117,22 @@ class FirnDensityNoSpin:
                     self.c['stpsPerYear'] = 1/np.mean(np.diff(climateTS['time']))
                     print('stepsperyear:', self.c['stpsPerYear'])
                 else:
-                    input_bdot, input_year_bdot, input_bdot_full, input_year_bdot_full = read_input(os.path.join(self.c['InputFileFolder'],self.c['InputFileNamebdot']))
+                    input_bdot, input_year_bdot, input_bdot_full, input_year_bdot_full = read_input(os.path.join(self.c['InputFileFolder'],self.c['InputFileNamebdot']),varname='BDOT')
                     self.c['stpsPerYear'] = 1/np.mean(np.diff(input_year_bdot))
 
-            firnS = FirnDensitySpin(self.c, climateTS = climateTS)
-            firnS.time_evolve()
+            ### spin-up cache: reuse a stored spin up with the same configuration and forcing
+            if (('spinCache' in self.c) and self.c['spinCache']):
+                spinKey = spin_key(self.c, climateTS)
+                cached  = get_cached_spin(self.c, spinKey)
+            else:
+                cached  = False
+
+            if not cached:
+                from firn_density_spin import FirnDensitySpin
+                firnS = FirnDensitySpin(self.c, climateTS = climateTS)
+                firnS.time_evolve()
+                if (('spinCache' in self.c) and self.c['spinCache']):
+                    store_spin(self.c, spinKey)
         else:
             pass
         
@@ -238,6 +245,7 @@ class FirnDensityNoSpin:
                         print('SEB module only works with "timesetup"=exact')
                         print('Exiting.')
                         sys.exit()
+                    from SEB import SurfaceEnergyBudget
                     self.SEB = SurfaceEnergyBudget(self.c,climateTS,self.start_ind, self.SEBfluxes, self.start_ind_EF)
                     Tkey = 'T2m'
                 else:
@@ -248,7 +256,7 @@ class FirnDensityNoSpin:
                 input_year_temp_full = climateTS['time']
                 
             else: # Input data comes from a .csv
-                input_temp, input_year_temp, input_temp_full, input_year_temp_full = read_input(os.path.join(self.c['InputFileFolder'],self.c['InputFileNameTemp']), updatedStartDate)
+                input_temp, input_year_temp, input_temp_full, input_year_temp_full = read_input(os.path.join(self.c['InputFileFolder'],self.c['InputFileNameTemp']), updatedStartDate, 'TSKIN')
             if input_temp[0] < 0.0:
                 input_temp      = input_temp + K_TO_C
             input_temp[input_temp>T_MELT] = T_MELT
@@ -265,7 +273,7 @@ class FirnDensityNoSpin:
             input_bdot_full = climateTS['BDOT']
 
         else: # Input data comes from a .csv
-            input_bdot, input_year_bdot,input_bdot_full, input_year_bdot_full = read_input(os.path.join(self.c['InputFileFolder'],self.c['InputFileNamebdot']), updatedStartDate)
+            input_bdot, input_year_bdot,input_bdot_full, input_year_bdot_full = read_input(os.path.join(self.c['InputFileFolder'],self.c['InputFileNamebdot']), updatedStartDate, 'BDOT')
         self.forcing_dict['BDOT'] = input_bdot_full
         #####################
 
@@ -289,7 +297,7 @@ class FirnDensityNoSpin:
             elif ((climateTS==None) and ('InputFileNameSublim' in self.c)):
                 ## to get sublim flux from csv, you need to add 'InputFileNameSublim' to .json
                 print(f'SUBLIM coming from {self.c["InputFileNameSublim"]}')
-                input_sublim, input_year_sublim,input_sublim_full, input_year_sublim_full = read_input(os.path.join(self.c['InputFileFolder'],self.c['InputFileNameSublim']), updatedStartDate) 
+                input_sublim, input_year_sublim,input_sublim_full, input_year_sublim_full = read_input(os.path.join(self.c['InputFileFolder'],self.c['InputFileNameSublim']), updatedStartDate, 'SUBLIM') 
             ## option 3: sublim is implied by negative values in bdot
             else:
                 print('SUBLIM is calculated using negative values of bdot')
@@ -332,7 +340,7 @@ class FirnDensityNoSpin:
                 input_year_snowmelt = climateTS['time'][self.start_ind:]
                 input_snowmelt_full = climateTS['SMELT']
             else:
-                input_snowmelt, input_year_snowmelt, input_snowmelt_full, input_year_snowmelt_full = read_input(os.path.join(self.c['InputFileFolder'],self.c['InputFileNamemelt']), updatedStartDate)
+                input_snowmelt, input_year_snowmelt, input_snowmelt_full, input_year_snowmelt_full = read_input(os.path.join(self.c['InputFileFolder'],self.c['InputFileNamemelt']), updatedStartDate, 'SMELT')
 
             self.forcing_dict['SMELT'] = input_snowmelt_full
             self.MELT           = True
@@ -357,7 +365,7 @@ class FirnDensityNoSpin:
                     input_year_rain = climateTS['time'][self.start_ind:]
                     input_rain_full = climateTS['RAIN']
                 else:
-                    input_rain, input_year_rain, input_rain_full, input_year_rain_full = read_input(os.path.join(self.c['InputFileFolder'],self.c['InputFileNameRain']), updatedStartDate)
+                    input_rain, input_year_rain, input_rain_full, input_year_rain_full = read_input(os.path.join(self.c['InputFileFolder'],self.c['InputFileNameRain']), updatedStartDate, 'RAIN')
                 self.forcing_dict['RAIN'] = input_rain_full
             
             if 'liquid' not in self.c:
@@ -509,6 +517,7 @@ class FirnDensityNoSpin:
             Nyears = 10 #number of years to average for T_mean
             NN = int(np.mean(S_PER_YEAR/self.dt)*Nyears)
             # NN = int(self.c['stpsPerYear']*Nyears)
+            import pandas as pd
             self.T_mean = pd.Series(self.Ts).rolling(window=NN+1,win_type='hamming').mean().values
             self.T_mean[np.isnan(self.T_mean)] = self.T_mean[NN]
             self.bdot_av = pd.Series(self.bdot).rolling(window=NN+1,win_type='hamming').mean().values
@@ -581,7 +590,7 @@ class FirnDensityNoSpin:
                     input_srho_full = climateTS['SRHO']
                     input_year_srho_full = climateTS['time']
                 else:
-                    input_srho, input_year_srho, input_srho_full, input_year_srho_full = read_input(os.path.join(self.c['InputFileFolder'],self.c['InputFileNamerho']), updatedStartDate)
+                    input_srho, input_year_srho, input_srho_full, input_year_srho_full = read_input(os.path.join(self.c['InputFileFolder'],self.c['InputFileNamerho']), updatedStartDate, 'SRHO')
                 
                 Rsf             = interpolate.interp1d(input_year_srho,input_srho,int_type,fill_value='extrapolate') # interpolation function
                 self.rhos0      = Rsf(self.modeltime) # surface density interpolated to model time
@@ -590,6 +599,7 @@ class FirnDensityNoSpin:
                 self.rhos0      = 481.0 + 4.834 * (self.T_av - T_MELT) # Kuipers Munneke, 2015
 
             elif (self.c['srho_type']=='Brils22'):
+                import pandas as pd
                 mtdf = pd.DataFrame({'dectime':self.modeltime,'Ts':self.Ts})
                 mtdf['yri'] = np.modf(mtdf.dectime.values)[1]
                 df_Tmean = mtdf.groupby('yri')[['Ts']].mean()
@@ -657,6 +667,10 @@ class FirnDensityNoSpin:
         TWlen               = len(self.TWrite) #- 1
         self.WTracker       = 1
 
+        ### index in TWrite for each time step (-1 if there is no write at that step), so the time loop does not need to search TWrite
+        TWind               = np.minimum(np.searchsorted(self.TWrite, self.modeltime), TWlen - 1)
+        self.TWindex        = np.where(self.TWrite[TWind] == self.modeltime, TWind, -1)
+
         ### set up initial mass, stress, and mean accumulation rate
         self.mass           = self.rho * self.dz
         self.sigma          = (self.mass + (self.LWC * RHO_W_KGM)) * self.dx * GRAVITY
@@ -740,10 +754,14 @@ class FirnDensityNoSpin:
             self.Gamma_old_Gou  = 0
             self.Gamma_old2_Gou = 0
             self.ind1_old       = 0
+        if 'GoujonGamma' not in self.c:
+            self.c['GoujonGamma'] = 'iterate' # how Gamma is found; 'iterate' or 'analytic'
         #######################
 
         ### Isotopes ########
         if self.c['isoDiff']:
+            from isotopeDiffusion import isotopeDiffusion, isoDiff_multi
+            self.isoDiff_multi = isoDiff_multi # used in the time loop
             self.spin = False
             print('Isotope Diffusion is initialized')
             if 'site_pressure' not in self.c:
@@ -772,6 +790,7 @@ class FirnDensityNoSpin:
         is stored in a dictionary
         '''
         if self.c['FirnAir']:
+            from firn_air import FirnAir
             print('Firn air initialized')
             with open(self.c['AirConfigName'], "r") as f:
                 jsonString    = f.read()
@@ -828,12 +847,26 @@ class FirnDensityNoSpin:
         else:
             self.DIPhorizon = np.floor(self.z[-1]*0.8)
 
-        self.dHAll      = []
-        self.dHAllcorr  = []
+        ### running totals of the elevation change (see update_dH)
+        self.dHtot      = 0.0
+        self.dHtotcorr  = 0.0
+        ### optionally, keep the elevation change at each write step: columns are time, dH, dHcorr
+        if 'dHhistory' not in self.c:
+            self.c['dHhistory'] = False
+        if self.c['dHhistory']:
+            self.dHhist = np.zeros((len(self.TWrite),3), dtype='float64')
+        ### periodic checkpoints of the full model state, so that a stopped run can be resumed (see checkpoint.py)
+        if 'checkpointInterval' not in self.c:
+            self.c['checkpointInterval'] = 0 # time steps; 0 for no step-based checkpoints
+        if 'checkpointMinutes' not in self.c:
+            self.c['checkpointMinutes'] = 0 # wall-clock minutes; 0 for no time-based checkpoints
+        if 'checkpointFileName' not in self.c:
+            self.c['checkpointFileName'] = 'CFMcheckpoint.pkl'
+        ### time spent in each phase of the time step (see timing.py)
+        if 'timing' not in self.c:
+            self.c['timing'] = False
         intPhi, self.DIPc, z_co = self.update_DIP()
         ind_z = np.where(self.z>=self.DIPhorizon)[0][0]        
-        self.dHAll.append(0)
-        self.dHAllcorr.append(0)
         dHOut       = 0 # surface elevation change since last time step
         dHOutC      = 0 # cumulative surface elevation change since start of model run
         compOut     = 0 # compaction of just the firn at each time step; no ice dynamics or accumulation
@@ -917,6 +950,9 @@ class FirnDensityNoSpin:
         self.acc_sum = 0
         self.dsdz_sum = 0
         self.ddz_bdot = 0
+
+        ### the settings used by the time loop, read once (see runplan.py)
+        self.plan = RunPlan(self.c)
         ######################################
         ######################################
 
@@ -933,22 +969,28 @@ class FirnDensityNoSpin:
         '''
         self.steps = 1 / np.mean(self.t) # steps per year
         start_time=time.time() # this is a timer to keep track of how long the model run takes.
+        plan = self.plan
 
-        if self.c['spinUpdate']:
+        if plan.spinUpdate:
             spinUpdate_final = self.c['spinUpdateDate']
             spinUpdate_interval = 100 # years
             indUpdate_vec = np.where(np.mod(self.modeltime,spinUpdate_interval)==0)[0]
             indUpdate_final = np.where(self.modeltime>=spinUpdate_final)[0][0]
             indUpdate = np.append(indUpdate_vec[indUpdate_vec<indUpdate_final],indUpdate_final) # timesteps (iii values) at which to update spin file
 
+        ### when continuing from a checkpoint (checkpoint.load_checkpoint), start after the saved time step; the state is already set
+        resume_step = getattr(self, 'resume_step', 0)
+
         ### Keep track of total refreeze and runoff for mass conservation
         if self.MELT:
-            refreezing2check = np.zeros(self.stp)
-            runoff2check     = np.zeros(self.stp)
-            meltvol2check    = np.zeros(self.stp)
-            rainvol2check    = np.zeros(self.stp)
-            dml2check        = np.zeros(self.stp)
-            sublwc2check     = np.zeros(self.stp)
+            if resume_step == 0:
+                self.melt_check = {key:np.zeros(self.stp) for key in ['refreezing','runoff','meltvol','rainvol','dml','sublwc']}
+            refreezing2check = self.melt_check['refreezing']
+            runoff2check     = self.melt_check['runoff']
+            meltvol2check    = self.melt_check['meltvol']
+            rainvol2check    = self.melt_check['rainvol']
+            dml2check        = self.melt_check['dml']
+            sublwc2check     = self.melt_check['sublwc']
             self.mismatch = 0
             LFdiffsum = 0
 
@@ -956,8 +998,39 @@ class FirnDensityNoSpin:
         ##### START TIME-STEPPING LOOP #####
         ####################################
 
+        ### one physics instance for the whole run; its state is refreshed each time step
+        if resume_step == 0:
+            self.FP     = FirnPhysics({})
+        densification   = self.FP.densification(plan.physRho)
+
+        ### preallocated storage for the layer fields, used when a new layer is added
+        self.LB         = LayerBuffer()
+
+        checkpoint_time = time.time()
+
+        ### entries of PhysParams that are the same at every time step
+        phys_static = dict(plan.phys_params, steps = self.steps, MELT = self.MELT, FirnAir = plan.FirnAir)
+        if plan.FirnAir:
+            phys_static['AirRunType']   = self.cg['runtype']
+            phys_static['steady_T']     = self.cg['steady_T']
+
+        if ((self.MELT) and (plan.liquid in ['prefsnowpack', 'resingledomain'])):
+            print('WARNING: prefsnowpack and resingledomain liquid schemes are still in development. email Max for more details.')
+            if plan.liquid == 'prefsnowpack':
+                from prefflow_snowpack import prefflow
+                self.prefflow = prefflow # used in the time loop
+            else:
+                from re_snowpack import resingledomain
+                self.resingledomain = resingledomain # used in the time loop
+
+        ### timers for the phases of the time step (kept in a checkpoint, so a resumed run has the totals for the whole run)
+        if resume_step == 0:
+            self.timer  = PhaseTimer() if plan.timing else NullTimer()
+        timer           = self.timer
+
         print('modeltime',self.modeltime[0],self.modeltime[-1])
-        for iii in range(self.stp):
+        for iii in range(resume_step, self.stp):
+            timer.start_step()
             mtime = self.modeltime[iii]
             zbot_old = self.z[-1]
 
@@ -966,7 +1039,7 @@ class FirnDensityNoSpin:
 
             self.D_surf[iii] = iii # This gives each layer a tracking number that is just iteration number.
             if iii==1000:
-                if ((self.MELT) and (self.c['liquid']=='darcy')):
+                if ((self.MELT) and (plan.liquid=='darcy')):
                     pass
                 else:
                     ntime = time.time()
@@ -974,24 +1047,24 @@ class FirnDensityNoSpin:
 
             ### Merging process #VV ###
 
-            if self.c['merging']: # merging may be deprecated (check with VV)
+            if plan.merging: # merging may be deprecated (check with VV)
                 lwcPreMerge = np.sum(self.LWC)
-                if ((self.dz[1] < self.c['merge_min']) or (self.dz[0] < 1e-10)): # Start with surface merging                     
+                if ((self.dz[1] < plan.merge_min) or (self.dz[0] < 1e-10)): # Start with surface merging                     
                     self.dz,self.z,self.gridLen,self.dx,self.rho,self.age,self.LWC,self.PLWC_mem,self.mass,self.mass_sum,self.sigma,self.bdot_mean,\
-                        self.Dcon,self.T_mean,self.T10m,self.r2,self.gridtrack = mergesurf(self,self.c['merge_min'],iii)                    
-                if (np.any(self.dz[2:] < self.c['merge_min'])): # Then merge rest of the firn column                   
+                        self.Dcon,self.T_mean,self.T10m,self.r2,self.gridtrack = mergesurf(self,plan.merge_min,iii)                    
+                if (np.any(self.dz[2:] < plan.merge_min)): # Then merge rest of the firn column                   
                     self.dz,self.z,self.gridLen,self.dx,self.rho,self.age,self.LWC,self.PLWC_mem,self.mass,self.mass_sum,self.sigma,self.bdot_mean,\
-                        self.Dcon,self.T_mean,self.T10m,self.r2,self.gridtrack = mergenotsurf(self,self.c['merge_min'],iii)
+                        self.Dcon,self.T_mean,self.T10m,self.r2,self.gridtrack = mergenotsurf(self,plan.merge_min,iii)
+                timer.lap('merge')
 
             ### dictionary of the parameters that get passed to physics
             PhysParams = {
+                **phys_static,
                 'iii':          iii,
-                'steps':        self.steps,
                 'gridLen':      self.gridLen,
                 'bdotSec':      self.bdotSec,
                 'bdot_mean':    self.bdot_mean,
                 'bdot_av':      self.bdot_av,
-                'bdot_type':    self.c['bdot_type'],
                 'Tz':           self.Tz,
                 'T_mean':       self.T_mean,
                 'T10m':         self.T10m,
@@ -1003,82 +1076,50 @@ class FirnDensityNoSpin:
                 'Ts':           self.Ts,
                 'r2':           self.r2,
                 'age':          self.age,
-                'physGrain':    self.c['physGrain'],
-                'calcGrainSize':self.c['calcGrainSize'],
-                'r2s0':         self.c['r2s0'],
-                'GrGrowPhysics':self.c['GrGrowPhysics'],
                 'z':            self.z,
                 'rhos0':        self.rhos0[iii],
                 'dz':           self.dz,
                 'LWC':          self.LWC,
-                'MELT':         self.MELT,
-                'FirnAir':      self.c['FirnAir']
             }
             
-            if self.c['THist']:
+            if plan.THist:
                 PhysParams['Hx'] = self.Hx
 
-            if self.c['physRho']=='Morris2014':
-                PhysParams['QMorris'] = self.c['QMorris']
-
-            if self.c['FirnAir']:
-                PhysParams['AirRunType'] = self.cg['runtype']
-                PhysParams['steady_T'] = self.cg['steady_T']
-
-            if self.c['physRho']=='Goujon2003':
+            if plan.goujon2003:
                 PhysParams['Gamma_Gou']      = self.Gamma_Gou
                 PhysParams['Gamma_old_Gou']  = self.Gamma_old_Gou
                 PhysParams['Gamma_old2_Gou'] = self.Gamma_old2_Gou
                 PhysParams['ind1_old']       = self.ind1_old
 
-            ### choose densification-physics based on user input
-            physicsd = {
-                'HLdynamic':            FirnPhysics(PhysParams).HL_dynamic,
-                'HLSigfus':             FirnPhysics(PhysParams).HL_Sigfus,
-                'Barnola1991':          FirnPhysics(PhysParams).Barnola_1991,
-                'Li2004':               FirnPhysics(PhysParams).Li_2004,
-                'Li2011':               FirnPhysics(PhysParams).Li_2011,
-                'Li2015':               FirnPhysics(PhysParams).Li_2015,
-                'Ligtenberg2011':       FirnPhysics(PhysParams).Ligtenberg_2011,
-                'Arthern2010S':         FirnPhysics(PhysParams).Arthern_2010S,
-                'Simonsen2013':         FirnPhysics(PhysParams).Simonsen_2013,
-                'Morris2014':           FirnPhysics(PhysParams).Morris_HL_2014,
-                'Helsen2008':           FirnPhysics(PhysParams).Helsen_2008,
-                'Arthern2010T':         FirnPhysics(PhysParams).Arthern_2010T,
-                'Goujon2003':           FirnPhysics(PhysParams).Goujon_2003,
-                'KuipersMunneke2015':   FirnPhysics(PhysParams).KuipersMunneke_2015,
-                'Brils2022':            FirnPhysics(PhysParams).Brils_2022,
-                'Veldhuijsen2023':      FirnPhysics(PhysParams).Veldhuijsen_2023,
-                'Crocus':               FirnPhysics(PhysParams).Crocus,
-                'GSFC2020':             FirnPhysics(PhysParams).GSFC2020,
-                'MaxSP':                FirnPhysics(PhysParams).MaxSP,
-                'Breant2017':           FirnPhysics(PhysParams).Breant2017
-            }
-
-            RD      = physicsd[self.c['physRho']]()
+            self.FP.update(PhysParams)
+            RD      = densification()
             drho_dt = RD['drho_dt']
-            if self.c['no_densification']:
+            if plan.no_densification:
                 drho_dt = np.zeros_like(drho_dt)
             self.viscosity = RD['viscosity']
+            timer.lap('physics')
 
             ### Strain modules
-            if self.c['strain_softening']:
+            if plan.strain_softening:
                 drho_dt, self.viscosity = strain_softening(self, drho_dt, iii)
-            if self.c['horizontal_divergence']:
+                timer.lap('strain')
+            if plan.horizontal_divergence:
                 self.mass = horizontal_divergence(self,iii)
+                timer.lap('strain')
 
-            if ((self.c['physRho']=='Goujon2003') or (self.c['physRho']=='Breant2017')):
+            if plan.goujon:
                 self.Gamma_Gou      = RD['Gamma_Gou'] 
                 self.Gamma_old_Gou  = RD['Gamma_old_Gou']
                 self.Gamma_old2_Gou = RD['Gamma_old2_Gou']
                 self.ind1_old       = RD['ind1_old']
 
             ### update density and age of firn
-            self.rho_old    = np.copy(self.rho)
+            ### (rho, dz, and z are replaced by new arrays below, so the _old fields do not need to be copies)
+            self.rho_old    = self.rho
             self.rho        = self.rho + self.dt[iii] * drho_dt
-            self.dz_old     = np.copy(self.dz) # model volume thicknesses before the compaction
+            self.dz_old     = self.dz # model volume thicknesses before the compaction
             self.sdz_old    = np.sum(self.dz) # old total column thickness (s for sum)
-            self.z_old      = np.copy(self.z)
+            self.z_old      = self.z
             self.dz         = self.mass / self.rho * self.dx # new dz after compaction
             self.z          = self.dz.cumsum(axis = 0)
             # znew = np.copy(self.z) 
@@ -1087,10 +1128,12 @@ class FirnDensityNoSpin:
             sdz_new = np.sum(self.dz)
             dsdz = sdz_new - self.sdz_old
             self.dsdz_sum = self.dsdz_sum + dsdz
+            timer.lap('physics')
 
             ### Surface energy balance #####
-            if self.c['SEB']:
+            if plan.SEB:
                 PhysParams.update(dz=self.dz,rho=self.rho,mtime=mtime) # update dict, will be used for SEB
+                self.FP.update(PhysParams)
 
                 if iii == 0:
                     T_old = self.Tz[0]
@@ -1111,6 +1154,7 @@ class FirnDensityNoSpin:
                 # self.snowmelt[iii] = self.snowmeltSec[iii] * S_PER_YEAR * (S_PER_YEAR/self.dt[iii])
                 # self.snowmeltSec    = self.snowmelt / S_PER_YEAR / (S_PER_YEAR/self.dt) # melt for each time step (meters i.e. per second)
                 self.forcing_dict['SMELT'][self.start_ind+iii] = self.snowmelt[iii]
+                timer.lap('SEB')
 
             ############################
             
@@ -1120,10 +1164,7 @@ class FirnDensityNoSpin:
             ######################
             ### MELT #############
             if self.MELT:
-                if ((iii==0) and ((self.c['liquid'] == 'prefsnowpack') or (self.c['liquid'] == 'resingledomain'))):
-                    print('WARNING: prefsnowpack and resingledomain liquid schemes are still in development. email Max for more details.')
-                
-                if self.c['liquid'] == 'bucket':
+                if plan.liquid == 'bucket':
                     if (self.snowmeltSec[iii]>0) or (np.any(self.LWC > 0.)) or (self.rainSec[iii] > 0.): #i.e. there is liquid water
 
                         LWC_vol_pre = np.sum(self.LWC) #mass of liquid in porosity before bucket
@@ -1155,58 +1196,64 @@ class FirnDensityNoSpin:
                         self.refreeze, self.runoff, self.meltvol, self.rainvol, self.dh_melt = 0.,0.,0.,0.,0.
                 ### end bucket ##################
 
-                elif self.c['liquid'] == 'darcy':
+                elif plan.liquid == 'darcy':
                     if (self.snowmeltSec[iii]>0) or (np.any(self.LWC > 0.)) or (self.rainSec[iii] > 0.): #i.e. there is water
                         ### Use Darcy scheme only after spin-up period to reduce computational time ###
                         if self.modeltime[iii]<1980:
-                            self.rho, self.age, self.dz, self.Tz, self.r2, self.z, self.mass, self.dzn, self.LWC, meltgridtrack, self.refreeze, self.runoff = bucket(self,iii)
+                            self.rho, self.age, self.dz, self.Tz, self.r2, self.z, self.mass, self.dzn, self.LWC, meltgridtrack, self.refreeze, self.runoff, self.dh_melt = bucket(self,iii)
                         elif self.modeltime[iii]>=1980:
-                            self.rho, self.age, self.dz, self.Tz, self.r2, self.z, self.mass, self.dzn, self.LWC, meltgridtrack, self.refreeze, self.runoff = darcyscheme(self,iii)
+                            self.rho, self.age, self.dz, self.Tz, self.r2, self.z, self.mass, self.dzn, self.LWC, meltgridtrack, self.refreeze, self.runoff, self.dh_melt = darcyscheme(self,iii)
                         if self.doublegrid==True: # if we use doublegrid -> use the gridtrack corrected for melting
                             self.gridtrack = np.copy(meltgridtrack)
                         self.meltvol = self.snowmeltSec[iii]*S_PER_YEAR*0.917 #[m w.e.]
                         self.rainvol = self.rainSec[iii]*S_PER_YEAR*0.917 #[m w.e.]
                     else: # Dry firn column and no input of meltwater                       
-                        self.refreeze, self.runoff,self.meltvol,self.rainvol = 0.,0.,0.,0.
+                        self.refreeze, self.runoff,self.meltvol,self.rainvol,self.dh_melt = 0.,0.,0.,0.,0.
                         self.dzn     = self.dz[0:self.compboxes] # Not sure this is necessary
                 ### end darcy ##################               
 
-                elif self.c['liquid'] == 'prefsnowpack':
+                elif plan.liquid == 'prefsnowpack':
                     #VV You can choose a date to switch from bucket to prefflow, this should be easy to use from the json file
                     if self.modeltime[iii] >= 1980: # Apply dualperm from a certain date
                         if ((self.snowmeltSec[iii]>0.) or (np.any(self.LWC > 0.)) or (self.rainSec[iii] > 0.)): #i.e. there is water
-                            self.rho, self.age, self.dz, self.Tz, self.z, self.mass, self.dzn, self.LWC, self.PLWC_mem, self.r2, self.refrozen, self.Trunoff = prefflow(self,iii)
+                            self.rho, self.age, self.dz, self.Tz, self.z, self.mass, self.dzn, self.LWC, self.PLWC_mem, self.r2, self.refrozen, self.Trunoff = self.prefflow(self,iii)
+                            self.dh_melt = 0. # not computed by this scheme
                         else: #Dry firn column and no input of meltwater                            
                             self.Trunoff     = np.array([0.]) #VV no runoff
                             self.refrozen   = np.zeros_like(self.dz) #VV no refreezing
+                            self.dh_melt    = 0.
                             self.dzn        = self.dz[0:self.compboxes] # Not sure this is necessary
                     elif self.modeltime[iii] < 1980: # Apply bVV until a certain date
                         if (self.snowmeltSec[iii]>0) or (np.any(self.LWC > 0.) or (self.rainSec[iii] > 0.)): #i.e. there is water
-                            self.rho, self.age, self.dz, self.Tz, self.r2, self.z, self.mass, self.dzn, self.LWC, self.refrozen, self.Trunoff, self.lwcerror = bucket(self,iii)
+                            self.rho, self.age, self.dz, self.Tz, self.r2, self.z, self.mass, self.dzn, self.LWC, meltgridtrack, self.refrozen, self.Trunoff, self.dh_melt = bucket(self,iii)
                         else:
                             #Dry firn column and no input of meltwater
                             self.Trunoff     = np.array([0.]) #VV no runoff
                             self.refrozen   = np.zeros_like(self.dz) #VV no refreezing
+                            self.dh_melt    = 0.
                             self.dzn        = self.dz[0:self.compboxes] # Not sure this is necessary
                 ### end prefsnowpack ##################
 
-                elif self.c['liquid'] == 'resingledomain':
+                elif plan.liquid == 'resingledomain':
                     #VV You can choose a date to switch from bucket to prefflow, this should be easy to use from the json file
                     if self.modeltime[iii] >= 1980: # Apply dualperm from a certain date
                         if ((self.snowmeltSec[iii]>0.) or (np.any(self.LWC > 0.)) or (self.rainSec[iii] > 0.)): #i.e. there is water
-                            self.rho, self.age, self.dz, self.Tz, self.z, self.mass, self.dzn, self.LWC, self.PLWC_mem, self.r2, self.refrozen, self.Trunoff = resingledomain(self,iii)
+                            self.rho, self.age, self.dz, self.Tz, self.z, self.mass, self.dzn, self.LWC, self.PLWC_mem, self.r2, self.refrozen, self.Trunoff = self.resingledomain(self,iii)
+                            self.dh_melt = 0. # not computed by this scheme
                         else:
                             #Dry firn column and no input of meltwater
                             self.Trunoff    = np.array([0.]) #VV no runoff
                             self.refrozen   = np.zeros_like(self.dz) #VV no refreezing
+                            self.dh_melt    = 0.
                             self.dzn        = self.dz[0:self.compboxes] # Not sure this is necessary
                     elif self.modeltime[iii] < 1980: # Apply bVV until a certain date
                         if (self.snowmeltSec[iii]>0) or (np.any(self.LWC > 0.) or (self.rainSec[iii] > 0.)): #i.e. there is water
-                            self.rho, self.age, self.dz, self.Tz, self.r2, self.z, self.mass, self.dzn, self.LWC, self.refrozen, self.Trunoff, self.lwcerror = bucket(self,iii)
+                            self.rho, self.age, self.dz, self.Tz, self.r2, self.z, self.mass, self.dzn, self.LWC, meltgridtrack, self.refrozen, self.Trunoff, self.dh_melt = bucket(self,iii)
                         else:
                             #Dry firn column and no input of meltwater
                             self.Trunoff    = np.array([0.]) #VV no runoff
                             self.refrozen   = np.zeros_like(self.dz) #VV no refreezing
+                            self.dh_melt    = 0.
                             self.dzn        = self.dz[0:self.compboxes] # Not sure this is necessary
                 ### end prefsnowpack ##################
 
@@ -1219,7 +1266,8 @@ class FirnDensityNoSpin:
 
                 if self.PLWC_mem[-1] > 0.: #VV
                     self.PLWC_mem[-2] += self.PLWC_mem[-1] #VV
-                self.PLWC_mem    = np.concatenate(([0], self.PLWC_mem[:-1])) #VV
+                self.PLWC_mem    = self.LB.push('PLWC_mem', 0, self.PLWC_mem) #VV
+                timer.lap('melt')
             
             else: # no melt, dz after compaction
                 self.dzn    = self.dz[0:self.compboxes]
@@ -1228,7 +1276,7 @@ class FirnDensityNoSpin:
             ######################
             
             ### Firn Air ###############
-            if self.c['FirnAir']: # Update firn air
+            if plan.FirnAir: # Update firn air
                 AirParams = {
                     'Tz':           self.Tz,
                     'rho':          self.rho,
@@ -1242,10 +1290,11 @@ class FirnDensityNoSpin:
                 }
                 for gas in self.cg['gaschoice']:        
                     self.Gz[gas], self.diffusivity, self.w_air, self.gas_age = self.FA[gas].firn_air_diffusion(AirParams,iii)
+                timer.lap('firnair')
             ####################
 
             ### Isotopes #######
-            if self.c['isoDiff']: # Update isotopes
+            if plan.isoDiff: # Update isotopes
                 IsoParams = {
                     'Tz':           self.Tz,
                     'rho':          self.rho,
@@ -1257,8 +1306,10 @@ class FirnDensityNoSpin:
                     'bdot':         self.bdotSec[iii]
                 }
 
-                for isotope in self.c['iso']:
-                    self.Isoz[isotope], self.Iso_sig2_z[isotope] = self.Isotopes[isotope].isoDiff(IsoParams,iii)
+                Isoz, Iso_sig2_z = self.isoDiff_multi(self.Isotopes,IsoParams,iii) # all species in one solve
+                self.Isoz.update(Isoz)
+                self.Iso_sig2_z.update(Iso_sig2_z)
+                timer.lap('isotopes')
                 ### new box gets added on within isoDiff function
             ####################
 
@@ -1268,8 +1319,9 @@ class FirnDensityNoSpin:
             # self.Dcon[self.LWC>0] = self.Dcon[self.LWC>0] + 1 # for example, keep track of how many times steps the layer has had water
 
             ### Update grain growth ###
-            if self.c['physGrain']: # update grain radius
-                self.r2 = FirnPhysics(PhysParams).graincalc(iii) # calculate before accumulation b/c new surface layer should not be subject to grain growth yet
+            if plan.physGrain: # update grain radius
+                self.r2 = self.FP.graincalc(iii) # calculate before accumulation b/c new surface layer should not be subject to grain growth yet
+                timer.lap('grain')
             
             ### update model grid, mass, stress, and mean accumulation rate
             ### If SEB, Ts was set in the SEB module - do not update if there is not snow that has temperature T2m.
@@ -1278,45 +1330,45 @@ class FirnDensityNoSpin:
             bd_flag = None
 
             if self.bdotSec[iii]>0: # there is accumulation at this time step       
-                self.age        = np.concatenate(([0], self.age[:-1])) + self.dt[iii]      
+                self.age        = self.LB.push('age', 0, self.age)
+                self.age       += self.dt[iii]
                 self.dzNew      = self.bdotSec[iii] * RHO_I / self.rhos0[iii] * S_PER_YEAR
                 self.dh_acc = self.dzNew
                 
                 dz_bot_old = self.dz[-1]
                 z_bot_old = self.z[-1]
 
-                self.dz         = np.concatenate(([self.dzNew], self.dz[:-1]))
-                self.z          = self.dz.cumsum(axis = 0)
-                znew = np.copy(self.z) 
-                self.z          = np.concatenate(([0], self.z[:-1]))
-                self.rho        = np.concatenate(([self.rhos0[iii]], self.rho[:-1]))
+                self.dz         = self.LB.push('dz', self.dzNew, self.dz)
+                znew            = self.dz.cumsum(axis = 0)
+                self.z          = self.LB.push('z', 0, znew)
+                self.rho        = self.LB.push('rho', self.rhos0[iii], self.rho)
 
                 dz_bot_new = self.dz[-1]
                 z_bot_new = self.z[-1]
 
                 dzb_diff = dz_bot_new - dz_bot_old
 
-                if self.c['physGrain']: # update grain radius
-                    r2surface       = FirnPhysics(PhysParams).surfacegrain() #grain size for new surface layer
-                    self.r2         = np.concatenate(([r2surface], self.r2[:-1]))               
+                if plan.physGrain: # update grain radius
+                    r2surface       = self.FP.surfacegrain() #grain size for new surface layer
+                    self.r2         = self.LB.push('r2', r2surface, self.r2)
                 
-                if not self.c['manualT']: # If SEB, the new snow layer will be T2m
-                    if (self.c['SEB']):
+                if not plan.manualT: # If SEB, the new snow layer will be T2m
+                    if plan.SEB:
                         # newSnowT = np.min((self.T2m[iii],T_MELT))
                         newSnowT = np.min((self.Ts[iii],T_MELT))
                     else:
                         newSnowT = self.Ts[iii]
 
-                    self.Tz         = np.concatenate((np.array([newSnowT],float), self.Tz[:-1]))
+                    self.Tz         = self.LB.push('Tz', float(newSnowT), self.Tz)
                 
-                self.Dcon       = np.concatenate(([self.D_surf[iii]], self.Dcon[:-1]))
+                self.Dcon       = self.LB.push('Dcon', self.D_surf[iii], self.Dcon)
                 massNew         = self.bdotSec[iii] * S_PER_YEAR * RHO_I
                 massremoved     = self.mass[-1]
-                self.mass       = np.concatenate(([massNew], self.mass[:-1]))
+                self.mass       = self.LB.push('mass', massNew, self.mass)
                 self.compaction = np.append(0,(self.dz_old[0:self.compboxes-1]-self.dzn[0:self.compboxes-1]))#/self.dt*S_PER_YEAR)
                 if self.doublegrid:
-                    self.gridtrack = np.concatenate(([1],self.gridtrack[:-1]))
-                self.LWC        = np.concatenate(([0], self.LWC[:-1]))
+                    self.gridtrack = self.LB.push('gridtrack', 1, self.gridtrack)
+                self.LWC        = self.LB.push('LWC', 0, self.LWC)
 
             else: # no accumulation during this time step
                 bd_flag = 'no accumulation'
@@ -1335,13 +1387,14 @@ class FirnDensityNoSpin:
                 znew = np.copy(self.z)                             
                 self.compaction = (self.dz_old[0:self.compboxes]-self.dzn)
                 
-                if ((not self.c['SEB']) or (not self.c['manualT'])):
+                if ((not plan.SEB) or (not plan.manualT)):
                     self.Tz[0] = self.Ts[iii]
                 
                 self.na_count += 1
                 self.na_sum = self.na_sum + (self.z[-1]-zz1[-1])
+            timer.lap('accumulation')
 
-            if self.c['SUBLIM']:
+            if plan.SUBLIM:
                 zz1 = self.z.copy()
                 self.subLWCvol = 0
                 if self.sublimSec[iii]<0:
@@ -1362,6 +1415,7 @@ class FirnDensityNoSpin:
 
                     d_zbot = (self.z[-1]-zz1[-1])
                     self.melt_sum = self.melt_sum + d_zbot
+                timer.lap('sublimation')
 
             self.w_firn = (znew - self.z_old) / self.dt[iii] # advection rate of the firn, m/s
 
@@ -1375,15 +1429,16 @@ class FirnDensityNoSpin:
 
             ### All temperature work happens at the end of the time loop
 
+            timer.lap('other')
             Ts_old = self.Tz[0]
-            if self.c['manualT']: # manual temperature measurements are fed into CFM
+            if plan.manualT: # manual temperature measurements are fed into CFM
                 tif = interpolate.interp1d(self.manualT_dep, self.manualT_temp[:,iii],kind='cubic')
                 self.Tz = tif(self.z)
 
-            elif (self.c['heatDiff'] and not self.MELT): # no melt, so use regular heat diffusion
+            elif (plan.heatDiff and not self.MELT): # no melt, so use regular heat diffusion
                 self.Tz, self.T10m  = heatDiff(self,iii)
 
-            elif (not self.c['heatDiff'] and not self.MELT): # user says no heat diffusion, so just set the temperature of the new box on top.
+            elif (not plan.heatDiff and not self.MELT): # user says no heat diffusion, so just set the temperature of the new box on top.
                 self.Tz = self.Ts[iii]*np.ones_like(self.Tz)
                 if iii==0:
                     print('warning: heat diffusion off, setting temp to Ts[iii]')
@@ -1399,20 +1454,8 @@ class FirnDensityNoSpin:
                 liq_mass_pre_en = np.sum(self.LWC*1000)
 
                 tot_heat_pre = np.sum(CP_I_kJ*self.mass*self.Tz + T_MELT*CP_W/1000*self.LWC*RHO_W_KGM + LF_I_kJ*self.LWC*RHO_W_KGM)
-                if "LWC_heat" not in self.c:
-                    self.c["LWC_heat"] = 'enthalpy'
-
-                if self.c["LWC_heat"]=='enthalpy':
-                    mass_pre = np.sum(self.mass)
-
-                    self.Tz, self.T10m, self.rho, self.mass, self.LWC, dml_sum = enthalpyDiff(self,iii)
-                    mass_post = np.sum(self.mass)
-                elif self.c["LWC_heat"]=='highC':
-                    self.Tz, self.T10m, self.rho, self.mass, self.LWC, dml_sum = heatDiff_highC(self, iii)
-                elif self.c["LWC_heat"]=='Teff':
-                    self.Tz, self.T10m, self.rho, self.mass, self.LWC, dml_sum = heatDiff_Teff(self, iii)
-                elif self.c["LWC_heat"]=='LWCcorr':
-                    self.Tz, self.T10m, self.rho, self.mass, self.LWC, dml_sum = heatDiff_LWCcorr(self, iii, self.c["LWCcorr_subdt"],self.c['correct_therm_prop'])
+                ### LWC_heat scheme (enthalpy, highC, Teff or LWCcorr), chosen in the run plan
+                self.Tz, self.T10m, self.rho, self.mass, self.LWC, dml_sum = plan.LWC_heat_method(self, iii)
 
                 tot_heat_post = np.sum(CP_I_kJ*self.mass*self.Tz + T_MELT*CP_W/1000*self.LWC*RHO_W_KGM + LF_I_kJ*self.LWC*RHO_W_KGM)
 
@@ -1427,70 +1470,28 @@ class FirnDensityNoSpin:
             self.T50     = np.mean(self.Tz[self.z<50]) # Temperature at 50 
             
             self.rho[self.rho>RHO_I] = RHO_I
+            timer.lap('heat')
 
             #############################################################
             ### write results as often as specified in the init method ##
             #############################################################
-            if mtime in self.TWrite:
-                ind         = np.where(self.TWrite == mtime)[0][0]
-                mtime_plus1 = self.TWrite[ind]
-                
+            if self.TWindex[iii] >= 0:
                 if 'viscosity' in self.output_list:
                     self.viscosity = RD['viscosity']
 
-                if not self.c['SEB']:
-                    self.climate = np.array([self.bdot[iii],self.Ts[iii],self.snowmelt[iii],self.rain[iii],self.sublim[iii]])
-                else: #if SEB true
-                    SMBiii = self.bdot[iii] + self.sublim[iii] - self.snowmelt[iii] #sublim negative means mass loss, snowmelt positive is amount lost
-                    # self.climate = np.array([SMBiii,self.Ts[iii],self.snowmelt[iii],self.rain[iii],self.sublim[iii]])
-                    self.climate = np.array([self.bdot[iii],self.Ts[iii],self.snowmelt[iii],self.rain[iii],self.sublim[iii]])
-
-                bcoAgeMart, bcoDepMart, bcoAge830, bcoDep830, LIZAgeMart, LIZDepMart, bcoAge815, bcoDep815  = self.update_BCO(iii)
-
-                intPhi, self.DIPc, z_co  = self.update_DIP()
-                dHOut, dHOutC, compOut, dHOutcorr, dHOutcorrC  = self.update_dH(iii)
-                try:
-                    ind_z = np.where(self.z>=self.DIPhorizon)[0][0]
-                    DIPhz = self.DIPc[ind_z]
-                except Exception:
-                    DIPhz = np.nan
-
-                if mtime==self.TWrite[0]:
-                    self.dHAll  = 0 * self.dHAll
-                    self.dHAllcorr = 0 * self.dHAllcorr
-                    dH          = 0.0
-                    dHtot       = 0.0
-                    comp_firn   = 0.0
-                    dHcorr      = 0.0
-                    dHtotcorr   = 0.0
-
-                self.BCO  = np.array([bcoAgeMart, bcoDepMart, bcoAge830, bcoDep830, LIZAgeMart, LIZDepMart, bcoAge815, bcoDep815, z_co])
-                self.DIP  = np.array([intPhi, dHOut, dHOutC, compOut, dHOutcorr, dHOutcorrC,DIPhz])
-
-                MOd = {key:value for key, value in self.__dict__.items() if key in self.output_list}
-
-                if self.c['FirnAir']:    
-                    for gas in self.cg['gaschoice']:
-                        MOd[gas] = self.Gz[gas]
-
-                if self.c['isoDiff']:
-                    for isotope in self.c['iso']:
-                        MOd['isotopes_{}'.format(isotope)] = self.Isotopes[isotope].del_z
-                        MOd['iso_sig2_{}'.format(isotope)] = self.Isotopes[isotope].iso_sig2_z
-
-                self.MOutputs.updateMO(MOd,mtime_plus1,self.WTracker)
-
-                self.WTracker = self.WTracker + 1
+                self.update_outputs(iii, mtime)
+                timer.lap('output')
             ################################
             ### End write ##################
             ################################
 
-            if (self.c['spinUpdate'] and iii in indUpdate):
+            if (plan.spinUpdate and iii in indUpdate):
                 if iii==0:
                     pass
                 else:
                     print(f'updating spin file at {mtime}')
                     SpinUpdate_res(self,mtime)
+                    timer.lap('output')
             
             if self.doublegrid:
                 #VV changes 09/12/2020
@@ -1499,6 +1500,7 @@ class FirnDensityNoSpin:
                     #self.dz, self.z, self.rho, self.Tz, self.mass, self.sigma, self. mass_sum, self.age, self.bdot_mean, self.LWC, self.gridtrack, self.r2 = regrid(self)
                 if self.gridtrack[-1]!=3: #VV works for whatever the gridtrack value we have
                     self.dz, self.z, self.rho, self.Tz, self.mass, self.sigma, self. mass_sum, self.age, self.bdot_mean, self.LWC, self.gridtrack, self.r2 = regrid22(self) #VV regrid22
+                    timer.lap('regrid')
 
             #VV (23/03/2021) checking that refreeze and runoff work fine
             if self.MELT:
@@ -1516,6 +1518,15 @@ class FirnDensityNoSpin:
                 # LFdiff = Lfluxin - Lfluxout
                 # LFdiffsum = LFdiffsum + LFdiff
 
+            timer.end_step()
+
+            ### checkpoint of the full model state
+            if iii < self.stp - 1:
+                if ((plan.checkpointInterval and ((iii + 1) % plan.checkpointInterval == 0)) or
+                        (plan.checkpointMinutes and (time.time() - checkpoint_time >= 60 * plan.checkpointMinutes))):
+                    write_checkpoint(self, iii)
+                    checkpoint_time = time.time()
+
         ##################################
         ##### END TIME-STEPPING LOOP #####
         ##################################
@@ -1537,12 +1548,72 @@ class FirnDensityNoSpin:
                   f'Refrz + Rnff +LWC:   {sum(runoff2check)+sum(refreezing2check)+sum(self.LWC)+sum(sublwc2check)}\n'
                 #   f'DML:            {sum(dml2check)}'
                 )
+        if plan.timing:
+            print('time in each phase of the time step:')
+            print(self.timer.summary())
         write_nospin_hdf5(self,self.MOutputs.Mout_dict,self.forcing_dict)
+        remove_checkpoint(self.c)
 
     ###########################
     ##### END time_evolve #####
     ###########################
 
+    def update_outputs(self,iii,mtime):
+        '''
+        Updates the diagnostics (climate, BCO, DIP, dH) and passes the current
+        model state to the ModelOutputs instance. Called at each write step.
+        '''
+
+        ind         = self.TWindex[iii]
+        mtime_plus1 = self.TWrite[ind]
+
+        if not self.c['SEB']:
+            self.climate = np.array([self.bdot[iii],self.Ts[iii],self.snowmelt[iii],self.rain[iii],self.sublim[iii]])
+        else: #if SEB true
+            SMBiii = self.bdot[iii] + self.sublim[iii] - self.snowmelt[iii] #sublim negative means mass loss, snowmelt positive is amount lost
+            # self.climate = np.array([SMBiii,self.Ts[iii],self.snowmelt[iii],self.rain[iii],self.sublim[iii]])
+            self.climate = np.array([self.bdot[iii],self.Ts[iii],self.snowmelt[iii],self.rain[iii],self.sublim[iii]])
+
+        bcoAgeMart, bcoDepMart, bcoAge830, bcoDep830, LIZAgeMart, LIZDepMart, bcoAge815, bcoDep815  = self.update_BCO(iii)
+
+        intPhi, self.DIPc, z_co  = self.update_DIP()
+        dHOut, dHOutC, compOut, dHOutcorr, dHOutcorrC  = self.update_dH(iii)
+        try:
+            ind_z = np.where(self.z>=self.DIPhorizon)[0][0]
+            DIPhz = self.DIPc[ind_z]
+        except Exception:
+            DIPhz = np.nan
+
+        if ind == 0:
+            self.dHtot  = 0.0
+            self.dHtotcorr = 0.0
+            dH          = 0.0
+            dHtot       = 0.0
+            comp_firn   = 0.0
+            dHcorr      = 0.0
+            dHtotcorr   = 0.0
+
+        self.BCO  = np.array([bcoAgeMart, bcoDepMart, bcoAge830, bcoDep830, LIZAgeMart, LIZDepMart, bcoAge815, bcoDep815, z_co])
+        self.DIP  = np.array([intPhi, dHOut, dHOutC, compOut, dHOutcorr, dHOutcorrC,DIPhz])
+
+        MOd = {key:value for key, value in self.__dict__.items() if key in self.output_list}
+
+        if self.c['FirnAir']:    
+            for gas in self.cg['gaschoice']:
+                MOd[gas] = self.Gz[gas]
+
+        if self.c['isoDiff']:
+            for isotope in self.c['iso']:
+                MOd['isotopes_{}'.format(isotope)] = self.Isotopes[isotope].del_z
+                MOd['iso_sig2_{}'.format(isotope)] = self.Isotopes[isotope].iso_sig2_z
+
+        self.MOutputs.updateMO(MOd,mtime_plus1,self.WTracker)
+
+        self.WTracker = self.WTracker + 1
+
+    ### end update_outputs ####
+    ###########################
+
     def update_BCO(self,iii):
         '''
         Updates the bubble close-off depth and age based on the Martinerie criteria as well as through assuming the critical density is 815 kg/m^3
@@ -1616,13 +1687,13 @@ class FirnDensityNoSpin:
     def update_dH(self,iii):
         '''
         updates the surface elevation change
+        dHtot and dHtotcorr are running totals (reset at the first write step).
         '''
 
         self.dH     = (self.sdz_new - self.sdz_old) + self.dh_acc + self.dh_melt - (self.iceout*self.t[iii]) # iceout has units m ice/year, t is years per time step. 
 
         # self.dH2 = self.z[-1] - self.z_old[-1] #- (self.iceout*self.t) # alternative method. Should be the same?    
-        self.dHAll.append(self.dH)
-        self.dHtot  = np.sum(self.dHAll)
+        self.dHtot  = self.dHtot + self.dH
         
         ### If the bottom of the domain is not the ice density, there is 
         ### compaction that is not accounted for between the bottom of the 
@@ -1631,10 +1702,12 @@ class FirnDensityNoSpin:
         iceout_corr = self.iceout*RHO_I/self.rho[-1]
         self.dHcorr = (self.sdz_new - self.sdz_old) + self.dh_acc + self.dh_melt - (iceout_corr*self.t[iii]) # iceout has units m ice/year, t is years per time step. 
         
-        self.dHAllcorr.append(self.dHcorr)
-        self.dHtotcorr = np.sum(self.dHAllcorr)
+        self.dHtotcorr = self.dHtotcorr + self.dHcorr
         self.comp_firn = self.sdz_new - self.sdz_old #total compaction of just the firn during the previous time step
 
+        if self.c['dHhistory']:
+            self.dHhist[self.TWindex[iii],:] = [self.TWrite[self.TWindex[iii]], self.dH, self.dHcorr]
+
         return self.dH, self.dHtot, self.comp_firn, self.dHcorr, self.dHtotcorr
 
     ###########################
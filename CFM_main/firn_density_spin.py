@@ -21,8 +21,8 @@ from writer import write_spin_hdf5
 from physics import *
 from constants import *
 from strain import *
-from isotopeDiffusion import isotopeDiffusion
-from SEB import SurfaceEnergyBudget
+from column import LayerBuffer
+from runplan import RunPlan
 import numpy as np
 import scipy.interpolate as interpolate
 import csv
@@ -39,11 +39,7 @@ try:
     from merge import mergeall
 except Exception:
     print('CFMmerge not found; preferential flow will not work')
-try:
-    import pandas as pd
-except:
-    print('You do not have the pandas python package installed. It is')
-    print('only required if you are importing an initial condition.')
+### isotopeDiffusion and pandas (for an initial condition) are imported where they are used
 
 class FirnDensitySpin:
     '''
@@ -142,8 +138,8 @@ class FirnDensitySpin:
             input_year_temp = input_year_bdot = climateTS['time']
        
         else:
-            input_temp, input_year_temp, input_temp_full, input_year_temp_full = read_input(os.path.join(self.c['InputFileFolder'],self.c['InputFileNameTemp']))
-            input_bdot, input_year_bdot, input_bdot_full, input_year_bdot_full = read_input(os.path.join(self.c['InputFileFolder'],self.c['InputFileNamebdot']))
+            input_temp, input_year_temp, input_temp_full, input_year_temp_full = read_input(os.path.join(self.c['InputFileFolder'],self.c['InputFileNameTemp']),varname='TSKIN')
+            input_bdot, input_year_bdot, input_bdot_full, input_year_bdot_full = read_input(os.path.join(self.c['InputFileFolder'],self.c['InputFileNamebdot']),varname='BDOT')
 
         if input_temp[0] < 0.0:
             input_temp              = input_temp + K_TO_C
@@ -233,7 +229,7 @@ class FirnDensitySpin:
                         input_snowmelt_mm = PDDs * fPDD * days_per_timestep # mm w.e. per time step
                         input_snowmelt = input_snowmelt_mm / 1000 / 0.917 * self.c['stpsPerYear'] # m i.e./year
                 else:
-                    input_snowmelt, input_year_snowmelt, input_snowmelt_full, input_year_snowmelt_full = read_input(os.path.join(self.c['InputFileFolder'],self.c['InputFileNamemelt'])) #VV
+                    input_snowmelt, input_year_snowmelt, input_snowmelt_full, input_year_snowmelt_full = read_input(os.path.join(self.c['InputFileFolder'],self.c['InputFileNamemelt']),varname='SMELT') #VV
                 meanmelt = np.mean(input_snowmelt) # mean melt per year [mIE/yr] (units are specified in Reeh 2008)
                 meanacc  = self.bdot0 # mean annual accumulation [mIE/yr]
                 self.SIR = min(meanmelt,0.6*meanacc) # Reeh 1991 and Reeh 2008 PMAX value is set at 0.6 melt becomes superimposed ice until it reaches 0.6 of annual acc, then runoff
@@ -342,6 +338,8 @@ class FirnDensitySpin:
 
         ### Surface isotope values for each time step
         if self.c['isoDiff']:
+            from isotopeDiffusion import isotopeDiffusion, isoDiff_multi
+            self.isoDiff_multi = isoDiff_multi # used in the time loop
             self.spin=True
             self.Isotopes   = {} #dictionary of class instances
             self.iso_out    = {} # outputs for each isotope
@@ -405,6 +403,8 @@ class FirnDensitySpin:
             self.Gamma_old_Gou  = 0
             self.Gamma_old2_Gou = 0
             self.ind1_old       = 0
+        if 'GoujonGamma' not in self.c:
+            self.c['GoujonGamma'] = 'iterate' # how Gamma is found; 'iterate' or 'analytic'
         #######################
 
         #######################
@@ -420,6 +420,9 @@ class FirnDensitySpin:
         if self.c['ReehCorrectedT']:
             self.rho = 900 * np.ones_like(self.rho) # use to just set a solid ice column to initialize
 
+        ### the settings used by the time loop, read once (see runplan.py)
+        self.plan = RunPlan(self.c)
+
 
     ############################
     ##### END INIT #############
@@ -431,20 +434,32 @@ class FirnDensitySpin:
         based on the user specified number of timesteps in the model run. Updates the firn density using a user specified 
         '''
         self.steps = 1 / self.t # this is time steps per year
+        plan = self.plan
 
         ####################################
         ##### START TIME-STEPPING LOOP #####
         ####################################
 
+        ### one physics instance for the whole run; its state is refreshed each time step
+        self.FP         = FirnPhysics({})
+        densification   = self.FP.densification(plan.physRho)
+
+        ### preallocated storage for the layer fields, used when a new layer is added
+        self.LB         = LayerBuffer()
+
+        ### entries of PhysParams that are the same at every time step
+        phys_static = dict(plan.phys_params, steps = self.steps, MELT = self.MELT, FirnAir = False)
+        if plan.physRho=='MaxSP':
+            phys_static['MQ'] = self.c.get('MQ', 60)
+
         for iii in range(self.stp):
             ### create dictionary of the parameters that get passed to physics
             PhysParams = {
+                **phys_static,
                 'iii':          iii,
-                'steps':        self.steps,
                 'gridLen':      self.gridLen,
                 'bdotSec':      self.bdotSec,
                 'bdot_mean':    self.bdot_mean,
-                'bdot_type':    self.c['bdot_type'],
                 'Tz':           self.Tz,
                 'T_mean':       self.T_mean,
                 'T10m':         self.T10m,
@@ -456,91 +471,54 @@ class FirnDensitySpin:
                 'Ts':           self.Ts,
                 'r2':           self.r2,
                 'age':          self.age,
-                'physGrain':    self.c['physGrain'],
-                'calcGrainSize':self.c['calcGrainSize'],
-                'r2s0':         self.c['r2s0'],
-                'GrGrowPhysics':self.c['GrGrowPhysics'],
                 'z':            self.z,
                 'rhos0':        self.rhos0[iii],
                 'dz':           self.dz,
                 'LWC':          self.LWC,
-                'MELT':         self.MELT,
-                'FirnAir':      False,
                 'bdot_av':      self.bdot_av,
             }
 
-            if self.c['physRho']=='MaxSP':
-                try:
-                    PhysParams['MQ'] = self.c['MQ']
-                except:
-                    PhysParams['MQ'] = 60
-
-            if self.c['THist']:
+            if plan.THist:
                 PhysParams['Hx'] = self.Hx
 
-            if self.c['physRho']=='Morris2014':               
-                PhysParams['QMorris'] = self.c['QMorris']
-
-            if self.c['physRho']=='Goujon2003':
+            if plan.goujon2003:
                 PhysParams['Gamma_Gou']      = self.Gamma_Gou
                 PhysParams['Gamma_old_Gou']  = self.Gamma_old_Gou
                 PhysParams['Gamma_old2_Gou'] = self.Gamma_old2_Gou
                 PhysParams['ind1_old']       = self.ind1_old
 
-            ### choose densification-physics based on user input
-            physicsd = {
-                'HLdynamic':            FirnPhysics(PhysParams).HL_dynamic,
-                'HLSigfus':             FirnPhysics(PhysParams).HL_Sigfus,
-                'Barnola1991':          FirnPhysics(PhysParams).Barnola_1991,
-                'Li2004':               FirnPhysics(PhysParams).Li_2004,
-                'Li2011':               FirnPhysics(PhysParams).Li_2011,
-                'Li2015':               FirnPhysics(PhysParams).Li_2015,
-                'Ligtenberg2011':       FirnPhysics(PhysParams).Ligtenberg_2011,
-                'Arthern2010S':         FirnPhysics(PhysParams).Arthern_2010S,
-                'Simonsen2013':         FirnPhysics(PhysParams).Simonsen_2013,
-                'Morris2014':           FirnPhysics(PhysParams).Morris_HL_2014,
-                'Helsen2008':           FirnPhysics(PhysParams).Helsen_2008,
-                'Arthern2010T':         FirnPhysics(PhysParams).Arthern_2010T,
-                'Goujon2003':           FirnPhysics(PhysParams).Goujon_2003,
-                'KuipersMunneke2015':   FirnPhysics(PhysParams).KuipersMunneke_2015,
-                'Brils2022':            FirnPhysics(PhysParams).Brils_2022,
-                'Veldhuijsen2023':      FirnPhysics(PhysParams).Veldhuijsen_2023,
-                'Crocus':               FirnPhysics(PhysParams).Crocus,
-                'GSFC2020':             FirnPhysics(PhysParams).GSFC2020,
-                'MaxSP':                FirnPhysics(PhysParams).MaxSP,
-                'Breant2017':           FirnPhysics(PhysParams).Breant2017
-            }
-
-            RD      = physicsd[self.c['physRho']]()
+            self.FP.update(PhysParams)
+            RD      = densification()
             drho_dt = RD['drho_dt']
-            if self.c['no_densification']:
+            if plan.no_densification:
                 drho_dt = np.zeros_like(drho_dt)
             self.viscosity = RD['viscosity']
 
             # Strain modules
-            if self.c['strain_softening']:
+            if plan.strain_softening:
                 drho_dt, self.viscosity = strain_softening(self, drho_dt, iii)
-            if self.c['horizontal_divergence']:
+            if plan.horizontal_divergence:
                 self.mass = horizontal_divergence(self,iii)
 
-            if self.c['physRho']=='Goujon2003':
+            if plan.goujon2003:
                 self.Gamma_Gou      = RD['Gamma_Gou'] 
                 self.Gamma_old_Gou  = RD['Gamma_old_Gou']
                 self.Gamma_old2_Gou = RD['Gamma_old2_Gou']
                 self.ind1_old       = RD['ind1_old']
 
             ### update density and age of firn
-            self.age = np.concatenate(([0], self.age[:-1])) + self.dt[iii]
+            self.age = self.LB.push('age', 0, self.age)
+            self.age += self.dt[iii]
             self.rho = self.rho + self.dt[iii] * drho_dt
             
             if self.THist:
                 self.Hx = RD['Hx']
 
             ### update temperature grid and isotope grid if user specifies
-            if self.c['heatDiff']:
+            if plan.heatDiff:
                 self.Tz, self.T10m = heatDiff(self,iii)
 
-            if self.c['isoDiff']:
+            if plan.isoDiff:
                 IsoParams = {
                     'Tz':           self.Tz,
                     'rho':          self.rho,
@@ -552,8 +530,9 @@ class FirnDensitySpin:
                     'bdot':         self.bdotSec[iii]
                 }
 
-                for isotope in self.c['iso']:
-                    self.Isoz[isotope], self.Iso_sig2_z[isotope] = self.Isotopes[isotope].isoDiff(IsoParams,iii)
+                Isoz, Iso_sig2_z = self.isoDiff_multi(self.Isotopes,IsoParams,iii) # all species in one solve
+                self.Isoz.update(Isoz)
+                self.Iso_sig2_z.update(Iso_sig2_z)
 
             self.T50     = np.mean(self.Tz[self.z<50])
 
@@ -561,22 +540,21 @@ class FirnDensitySpin:
             dzNew           = self.bdotSec[iii] * RHO_I / self.rhos0[iii] * S_PER_YEAR
             self.dz         = self.mass / self.rho * self.dx
             self.dz_old     = self.dz    
-            self.dz         = np.concatenate(([dzNew], self.dz[:-1]))     
-            self.z          = self.dz.cumsum(axis = 0)
-            self.z          = np.concatenate(([0], self.z[:-1]))
-            self.rho        = np.concatenate(([self.rhos0[iii]], self.rho[:-1]))
+            self.dz         = self.LB.push('dz', dzNew, self.dz)
+            self.z          = self.LB.push('z', 0, self.dz.cumsum(axis = 0))
+            self.rho        = self.LB.push('rho', self.rhos0[iii], self.rho)
             
             ### VV corrected temperature profile with latent heat release from meltwater, 
             ### following Reeh 1991 parameterisation ##
             if self.c['ReehCorrectedT']:
                 upperT = np.min((self.Ts[iii]+26.6*self.SIR,T_MELT))
-                self.Tz         = np.concatenate(([upperT], self.Tz[:-1]))
+                self.Tz         = self.LB.push('Tz', upperT, self.Tz)
             else:
-                self.Tz         = np.concatenate(([self.Ts[iii]], self.Tz[:-1]))
+                self.Tz         = self.LB.push('Tz', self.Ts[iii], self.Tz)
             ##
             
             massNew         = self.bdotSec[iii] * S_PER_YEAR * RHO_I
-            self.mass       = np.concatenate(([massNew], self.mass[:-1]))
+            self.mass       = self.LB.push('mass', massNew, self.mass)
             self.sigma      = self.mass * self.dx * GRAVITY
             self.sigma      = self.sigma.cumsum(axis = 0)
             self.mass_sum   = self.mass.cumsum(axis = 0)
@@ -584,13 +562,13 @@ class FirnDensitySpin:
                           
             ### Update grain growth #VV ###
             #VV calculate this before accumulation (because the new surface layer should not be subject to grain growth yet
-            if self.c['physGrain']:
-                self.r2 = FirnPhysics(PhysParams).graincalc(iii)
-                r2surface = FirnPhysics(PhysParams).surfacegrain() # This considers whether to use a fixed or calculated surface grain size.
-                self.r2 = np.concatenate(([r2surface], self.r2[:-1])) #VV form the new grain size array
+            if plan.physGrain:
+                self.r2 = self.FP.graincalc(iii)
+                r2surface = self.FP.surfacegrain() # This considers whether to use a fixed or calculated surface grain size.
+                self.r2 = self.LB.push('r2', r2surface, self.r2) #VV form the new grain size array
 
             if self.doublegrid:
-                self.gridtrack = np.concatenate(([1],self.gridtrack[:-1]))
+                self.gridtrack = self.LB.push('gridtrack', 1, self.gridtrack)
                 # if self.gridtrack[-1]==2:
                 #     self.dz, self.z, self.rho, self.Tz, self.mass, self.sigma, self. mass_sum, self.age, self.bdot_mean, self.LWC, self.gridtrack, self.r2 = regrid(self)
 
@@ -601,6 +579,7 @@ class FirnDensitySpin:
             if (iii == (self.stp - 1)):
                 if self.c['initprofile']:
                     print('Updating density using init file')
+                    import pandas as pd
                     initfirn = pd.read_csv(self.c['initfirnFile'],delimiter=',') 
                     init_depth      = initfirn['depth'].values
                     self.rho = np.interp(self.z,init_depth,initfirn['density'].values)
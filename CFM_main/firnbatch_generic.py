@@ -27,6 +27,10 @@ Then, you can run:
 
 (you need to have GNU parallel installed)
 
+Or, use batch_runner.py, which runs the sites in a pool of python processes
+and keeps a manifest of finished sites so that a batch can be restarted:
+>>> python batch_runner.py CFMsites.txt
+
 @author: maxstev
 '''
 
@@ -46,10 +50,12 @@ import json
 from functools import partial
 from siteClimate_from_RCM import getClimate
 from RCMpkl_to_spin import makeSpinFiles
-import xarray as xr
+from sitestore import write_site
 import pandas as pd
 
-def run_CFM(LLpair, json_base, timeres = '1D', Tinterp = 'mean', MELT= True, runtype = 'local', datatype = 'MERRA', movefiles=False,RCdrive = None):
+MAR_DSOURCE = 'ERA6k' # MAR product used by run_CFM: [ERA10k, ERA6k, 'NCEP20k']
+
+def run_CFM(LLpair, json_base, timeres = '1D', Tinterp = 'mean', MELT= True, runtype = 'local', datatype = 'MERRA', movefiles=False,RCdrive = None, store = None, merge_store = True):
 
     '''
     Run the CFM for a lat/lon pair. This is a bit of a hack because there are
@@ -79,6 +85,13 @@ def run_CFM(LLpair, json_base, timeres = '1D', Tinterp = 'mean', MELT= True, run
     json_base: string
         path and name of the 'base' .json that will be used for the CFM run;
         it will be edited a bit by this script.
+    store: string
+        if set, the results are put in this site store (see sitestore.py)
+        and the results folder of the site is removed.
+    merge_store: boolean
+        if False, the results are only written to the parts folder of the
+        store, to be merged later with sitestore.merge_parts (as
+        batch_runner does)
     '''
 
     tnow = time.time()
@@ -91,7 +104,7 @@ def run_CFM(LLpair, json_base, timeres = '1D', Tinterp = 'mean', MELT= True, run
     print('lon_int: ',lon_int)
 
     if datatype == 'MAR':
-        dsource = 'ERA6k' # [ERA10k, ERA6k, 'NCEP20k']
+        dsource = MAR_DSOURCE
         dwriter = datatype+'_'+dsource
     else:
         dsource = None
@@ -179,7 +192,11 @@ def run_CFM(LLpair, json_base, timeres = '1D', Tinterp = 'mean', MELT= True, run
 
     shutil.move(configName,re)
 
-    if movefiles:
+    if store is not None:
+        write_site(store, ' '.join(LLpair.replace(',', ' ').split()), lat_int, lon_int, re, data, merge = merge_store)
+        shutil.rmtree(re)
+
+    elif movefiles:
         subprocess.call(['rclone','move', re, RCdrive +'/'+re])
         try:
             os.rmdir(re)
@@ -200,8 +217,9 @@ if __name__ == '__main__':
     RCdrive = 'drive_name:' 
     json_base = 'example.json' 
     MELT = True
+    store = None # e.g. 'CFMstore.hdf5' to put the results of all sites in one file
     #############################
     ### THINGS TO CHANGE HERE ###
     
-    run_CFM(gridlist, json_base, timeres = timeres, Tinterp = Tinterp, MELT= MELT, runtype = runtype, datatype = datatype, movefiles=movefiles,RCdrive=RCdrive)
+    run_CFM(gridlist, json_base, timeres = timeres, Tinterp = Tinterp, MELT= MELT, runtype = runtype, datatype = datatype, movefiles=movefiles,RCdrive=RCdrive, store=store)
 
@@ -0,0 +1,465 @@
+#!/usr/bin/env python
+'''
+fqs.py
+======
+
+Fast Quartic Solver: analytically solves quartic equations (needed to
+calculate melt). Used by SEB.py and RCMpkl_to_spin.py.
+
+Takes methods from fqs package (@author: NKrvavica)
+full documentation: https://github.com/NKrvavica/fqs/blob/master/fqs.py
+
+The surface temperature of the top layer comes from the energy balance
+
+    SBC*dt/(CP_I*m) * T^4 + T - (flux*dt/(CP_I*m) + T_0) = 0
+
+where T_0 is the temperature at the start of the time step, m is the mass of
+the top layer, and flux is the net energy flux into the surface (without the
+outgoing longwave). surface_temperature and surface_melt solve this for any
+number of time steps and/or sites in one call (e.g. a whole forcing time
+series, when T_0 is known for each step). surface_melt_series is for when T_0
+is the temperature found at the step before, so the time steps are solved in
+order (each step can still be solved for many sites at once).
+'''
+
+import numpy as np
+import math
+from constants import *
+
+def single_quadratic(a0, b0, c0):
+    ''' 
+    Analytical solver for a single quadratic equation
+    '''
+    a, b = b0 / a0, c0 / a0
+
+    # Some repating variables
+    a0 = -0.5*a
+    delta = a0*a0 - b
+    sqrt_delta = np.sqrt(delta)
+
+    # Roots
+    r1 = a0 - sqrt_delta
+    r2 = a0 + sqrt_delta
+
+    return r1, r2
+
+def single_cubic(a0, b0, c0, d0):
+    ''' 
+    Analytical closed-form solver for a single cubic equation
+    '''
+    a, b, c = b0 / a0, c0 / a0, d0 / a0
+
+    # Some repeating constants and variables
+    third = 1./3.
+    a13 = a*third
+    a2 = a13*a13
+    sqr3 = np.sqrt(3)
+
+    # Additional intermediate variables
+    f = third*b - a2
+    g = a13 * (2*a2 - b) + c
+    h = 0.25*g*g + f*f*f
+
+    def cubic_root(x):
+        ''' Compute cubic root of a number while maintaining its sign'''
+        if x.real >= 0:
+            return x**third
+        else:
+            return -(-x)**third
+
+    if f == g == h == 0:
+        r1 = -cubic_root(c)
+        return r1, r1, r1
+
+    elif h <= 0:
+        j = np.sqrt(-f)
+        k = np.arccos(-0.5*g / (j*j*j))
+        m = np.cos(third*k)
+        n = sqr3 * np.sin(third*k)
+        r1 = 2*j*m - a13
+        r2 = -j * (m + n) - a13
+        r3 = -j * (m - n) - a13
+        return r1, r2, r3
+
+    else:
+        sqrt_h = np.sqrt(h)
+        S = cubic_root(-0.5*g + sqrt_h)
+        U = cubic_root(-0.5*g - sqrt_h)
+        S_plus_U = S + U
+        S_minus_U = S - U
+        r1 = S_plus_U - a13
+        r2 = -0.5*S_plus_U - a13 + S_minus_U*sqr3*0.5j
+        r3 = -0.5*S_plus_U - a13 - S_minus_U*sqr3*0.5j
+        return r1, r2, r3
+
+
+
+def single_cubic_one(a0, b0, c0, d0):
+    ''' 
+    Analytical closed-form solver for a single cubic equation
+    '''
+    a, b, c = b0 / a0, c0 / a0, d0 / a0
+
+    # Some repeating constants and variables
+    third = 1./3.
+    a13 = a*third
+    a2 = a13*a13
+
+    # Additional intermediate variables
+    f = third*b - a2
+    g = a13 * (2*a2 - b) + c
+    h = 0.25*g*g + f*f*f
+
+    def cubic_root(x):
+        ''' Compute cubic root of a number while maintaining its sign
+        '''
+        if x.real >= 0:
+            return x**third
+        else:
+            return -(-x)**third
+
+    if f == g == h == 0:
+        return -cubic_root(c)
+
+    elif h <= 0:
+        j = np.sqrt(-f)
+        k = np.arccos(-0.5*g / (j*j*j))
+        m = np.cos(third*k)
+        return 2*j*m - a13
+
+    else:
+        sqrt_h = np.sqrt(h)
+        S = cubic_root(-0.5*g + sqrt_h)
+        U = cubic_root(-0.5*g - sqrt_h)
+        S_plus_U = S + U
+        return S_plus_U - a13
+
+def single_quartic(a0, b0, c0, d0, e0):
+    '''
+    Analytical closed-form solver for a single quartic equation
+    '''
+    a, b, c, d = b0/a0, c0/a0, d0/a0, e0/a0
+
+    # Some repeating variables
+    a0 = 0.25*a
+    a02 = a0*a0
+
+    # Coefficients of subsidiary cubic euqtion
+    p = 3*a02 - 0.5*b
+    q = a*a02 - b*a0 + 0.5*c
+    r = 3*a02*a02 - b*a02 + c*a0 - d
+
+    # One root of the cubic equation
+    z0 = single_cubic_one(1, p, r, p*r - 0.5*q*q)
+
+    # Additional variables
+    s = np.sqrt(2*p + 2*z0.real + 0j)
+    if s == 0:
+        t = z0*z0 + r
+    else:
+        t = -q / s
+
+    # Compute roots by quadratic equations
+    r0, r1 = single_quadratic(1, s, z0 + t)
+    r2, r3 = single_quadratic(1, -s, z0 - t)
+
+    return r0 - a0, r1 - a0, r2 - a0, r3 - a0
+
+def multi_quadratic(a0, b0, c0):
+    ''' 
+    Analytical solver for multiple quadratic equations
+    '''
+    a, b = b0 / a0, c0 / a0
+
+    # Some repating variables
+    a0 = -0.5*a
+    delta = a0*a0 - b
+    sqrt_delta = np.sqrt(delta + 0j)
+
+    # Roots
+    r1 = a0 - sqrt_delta
+    r2 = a0 + sqrt_delta
+
+    return r1, r2
+
+
+def multi_cubic(a0, b0, c0, d0, all_roots=True):
+    '''
+    Analytical closed-form solver for multiple cubic equations
+    '''
+    a, b, c = b0 / a0, c0 / a0, d0 / a0
+
+    # Some repeating constants and variables
+    third = 1./3.
+    a13 = a*third
+    a2 = a13*a13
+    sqr3 = math.sqrt(3)
+
+    # Additional intermediate variables
+    f = third*b - a2
+    g = a13 * (2*a2 - b) + c
+    h = 0.25*g*g + f*f*f
+
+    # Masks for different combinations of roots
+    m1 = (f == 0) & (g == 0) & (h == 0)     # roots are real and equal
+    m2 = (~m1) & (h <= 0)                   # roots are real and distinct
+    m3 = (~m1) & (~m2)                      # one real root and two complex
+
+    def cubic_root(x):
+        ''' Compute cubic root of a number while maintaining its sign
+        '''
+        root = np.zeros_like(x)
+        positive = (x >= 0)
+        negative = ~positive
+        root[positive] = x[positive]**third
+        root[negative] = -(-x[negative])**third
+        return root
+
+    def roots_all_real_equal(c):
+        ''' Compute cubic roots if all roots are real and equal
+        '''
+        r1 = -cubic_root(c)
+        if all_roots:
+            return r1, r1, r1
+        else:
+            return r1
+
+    def roots_all_real_distinct(a13, f, g, h):
+        ''' Compute cubic roots if all roots are real and distinct
+        '''
+        j = np.sqrt(-f)
+        k = np.arccos(-0.5*g / (j*j*j))
+        m = np.cos(third*k)
+        r1 = 2*j*m - a13
+        if all_roots:
+            n = sqr3 * np.sin(third*k)
+            r2 = -j * (m + n) - a13
+            r3 = -j * (m - n) - a13
+            return r1, r2, r3
+        else:
+            return r1
+
+    def roots_one_real(a13, g, h):
+        ''' Compute cubic roots if one root is real and other two are complex
+        '''
+        sqrt_h = np.sqrt(h)
+        S = cubic_root(-0.5*g + sqrt_h)
+        U = cubic_root(-0.5*g - sqrt_h)
+        S_plus_U = S + U
+        r1 = S_plus_U - a13
+        if all_roots:
+            S_minus_U = S - U
+            r2 = -0.5*S_plus_U - a13 + S_minus_U*sqr3*0.5j
+            r3 = -0.5*S_plus_U - a13 - S_minus_U*sqr3*0.5j
+            return r1, r2, r3
+        else:
+            return r1
+
+    # Compute roots
+    if all_roots:
+        roots = np.zeros((3, len(a))).astype(complex)
+        roots[:, m1] = roots_all_real_equal(c[m1])
+        roots[:, m2] = roots_all_real_distinct(a13[m2], f[m2], g[m2], h[m2])
+        roots[:, m3] = roots_one_real(a13[m3], g[m3], h[m3])
+    else:
+        roots = np.zeros(len(a))  # .astype(complex)
+        roots[m1] = roots_all_real_equal(c[m1])
+        roots[m2] = roots_all_real_distinct(a13[m2], f[m2], g[m2], h[m2])
+        roots[m3] = roots_one_real(a13[m3], g[m3], h[m3])
+
+    return roots
+
+
+def multi_quartic(a0, b0, c0, d0, e0):
+    ''' 
+    Analytical closed-form solver for multiple quartic equations
+    '''
+    a, b, c, d = b0/a0, c0/a0, d0/a0, e0/a0
+
+    # Some repeating variables
+    a0 = 0.25*a
+    a02 = a0*a0
+
+    # Coefficients of subsidiary cubic euqtion
+    p = 3*a02 - 0.5*b
+    q = a*a02 - b*a0 + 0.5*c
+    r = 3*a02*a02 - b*a02 + c*a0 - d
+
+    # One root of the cubic equation
+    z0 = multi_cubic(1, p, r, p*r - 0.5*q*q, all_roots=False)
+
+    # Additional variables
+    s = np.sqrt(2*p + 2*z0.real + 0j)
+    t = np.zeros_like(s)
+    mask = (s == 0)
+    t[mask] = z0[mask]*z0[mask] + r[mask]
+    t[~mask] = -q[~mask] / s[~mask]
+
+    # Compute roots by quadratic equations
+    r0, r1 = multi_quadratic(1, s, z0 + t) - a0
+    r2, r3 = multi_quadratic(1, -s, z0 - t) - a0
+
+    return r0, r1, r2, r3
+
+
+def cubic_roots(p):
+    '''
+    A caller function for a fast cubic root solver (3rd order polynomial).
+    '''
+    # Convert input to array (if input is a list or tuple)
+    p = np.asarray(p)
+
+    # If only one set of coefficients is given, add axis
+    if p.ndim < 2:
+        p = p[np.newaxis, :]
+
+    # Check if four coefficients are given
+    if p.shape[1] != 4:
+        raise ValueError('Expected 3rd order polynomial with 4 '
+                         'coefficients, got {:d}.'.format(p.shape[1]))
+
+    if p.shape[0] < 100:
+        roots = [single_cubic(*pi) for pi in p]
+        return np.array(roots)
+    else:
+        roots = multi_cubic(*p.T)
+        return np.array(roots).T
+
+
+def quartic_roots(p):
+    '''
+    A caller function for a fast quartic root solver (4th order polynomial).
+    p[0]*x^4 + p[1]*x^3 + p[2]*x^2 + p[3]*x + p[4] = 0
+    '''
+    # Convert input to an array (if input is a list or tuple)
+    p = np.asarray(p)
+
+    # If only one set of coefficients is given, add axis
+    if p.ndim < 2:
+        p = p[np.newaxis, :]
+
+    # Check if all five coefficients are given
+    if p.shape[1] != 5:
+        raise ValueError('Expected 4th order polynomial with 5 '
+                         'coefficients, got {:d}.'.format(p.shape[1]))
+
+    if p.shape[0] < 100:
+        roots = [single_quartic(*pi) for pi in p]
+        return np.array(roots)
+    else:
+        roots = multi_quartic(*p.T)
+        return np.array(roots).T
+
+def _single_positive_root(a, e):
+    '''
+    Positive real root of a*x^4 + x + e = 0 (NaN if there is none).
+    '''
+    for r in single_quartic(a, 0.0, 0.0, 1.0, e):
+        if (r.imag == 0) and (r.real > 0):
+            return r.real
+    return np.nan
+
+def surface_temperature(flux, T_0, dt, m, SBC=5.67e-8):
+    '''
+    Solve the surface energy balance for the top layer temperature (not
+    limited to T_MELT). All inputs can be arrays (e.g. time steps, sites, or
+    time steps x sites) and are broadcast together.
+
+    With fewer than 100 equations each one is solved with single_quartic,
+    otherwise they are all solved at once with multi_quartic (as in
+    quartic_roots).
+
+    :param flux: net energy flux into the surface [W/m2]
+    :param T_0: top layer temperature at the start of the time step [K]
+    :param dt: time step [s]
+    :param m: mass of the top layer [kg/m2]
+    :param SBC: Stefan-Boltzmann constant (times the emissivity, if any)
+
+    :return T: top layer temperature [K]; NaN where the inputs are NaN
+    '''
+
+    a = SBC * dt / (CP_I*m)
+    e = -1 * (flux*dt/(CP_I*m)+T_0)
+    a, e = np.broadcast_arrays(np.asarray(a, dtype=float), np.asarray(e, dtype=float))
+    T = np.full(e.shape, np.nan)
+
+    ok = ~(np.isnan(a) | np.isnan(e))
+    if np.count_nonzero(ok) < 100:
+        for ii in np.ndindex(e.shape):
+            if ok[ii]:
+                T[ii] = _single_positive_root(a[ii], e[ii])
+    else:
+        a_ok = a[ok]
+        zero = np.zeros_like(a_ok)
+        r = np.array(multi_quartic(a_ok, zero, zero, zero + 1, e[ok]))
+        root = (r.imag == 0) & (r.real > 0)
+        T_ok = np.full(a_ok.shape, np.nan)
+        has_root = root.any(axis=0)
+        T_ok[has_root] = r.real[root.argmax(axis=0), np.arange(len(a_ok))][has_root]
+        T[ok] = T_ok
+
+    return T if T.ndim else T[()]
+
+def surface_melt(flux, T_0, dt, m, SBC=5.67e-8):
+    '''
+    Surface temperature and melt from the surface energy balance, for any
+    number of time steps and/or sites at once (see surface_temperature).
+    Where the energy balance gives T >= T_MELT, the temperature is T_MELT and
+    the extra energy goes to melt.
+
+    :return Tcalc: surface temperature [K]
+    :return meltmass: melt [kg/m2/time step]
+    '''
+
+    T = surface_temperature(flux, T_0, dt, m, SBC)
+    melt = T >= 273.15
+    Tcalc = np.where(melt, 273.15, T)
+    meltmass = np.where(melt, (flux - SBC*273.15**4) / LF_I * dt, 0) #multiply by dt to put in units per time step
+
+    return Tcalc, meltmass
+
+def surface_melt_series(flux, T_start, dt, m, SBC=5.67e-8):
+    '''
+    Surface temperature and melt for consecutive time steps, each starting
+    from the temperature of the step before (the first from T_start).
+
+    The time steps are solved in order, because each depends on the one
+    before; each step is solved for all sites at once. The melt of all steps
+    is computed at the end.
+
+    :param flux: net energy flux into the surface [W/m2]; shape (time steps,)
+        or (time steps, sites)
+    :param T_start: temperature at the start of the first step [K]; scalar
+        or one value per site
+    :param dt: time step [s]
+    :param m: mass of the top layer [kg/m2]; scalar or one value per site
+    :param SBC: Stefan-Boltzmann constant
+
+    :return Tcalc: surface temperature for each step [K]
+    :return meltmass: melt for each step [kg/m2/time step]
+    '''
+
+    flux = np.asarray(flux, dtype=float)
+    Tcalc = np.zeros_like(flux)
+    T_0 = T_start
+
+    if flux.ndim == 1 and np.ndim(T_start) == 0 and np.ndim(m) == 0: # a single site; skip the array handling of surface_temperature
+        a = SBC * dt / (CP_I*m)
+        e_flux = flux*dt/(CP_I*m)
+        for kk in range(len(flux)):
+            e = -1 * (e_flux[kk]+T_0)
+            Tnew = np.nan if np.isnan(e) else _single_positive_root(a, e)
+            if Tnew>=273.15:
+                Tcalc[kk] = 273.15000000000000
+            else:
+                Tcalc[kk] = Tnew
+            T_0 = Tcalc[kk]
+    else:
+        for kk in range(len(flux)):
+            Tnew = surface_temperature(flux[kk], T_0, dt, m, SBC)
+            Tcalc[kk] = np.where(Tnew>=273.15, 273.15, Tnew)
+            T_0 = Tcalc[kk]
+
+    meltmass = np.where(Tcalc==273.15, (flux - SBC*273.15**4) / LF_I * dt, 0) #multiply by dt to put in units per time step
+
+    return Tcalc, meltmass
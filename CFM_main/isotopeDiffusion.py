@@ -4,10 +4,10 @@ Code for isotope diffusion.
 '''
 import numpy as np 
 # from solver import solver
-from solver import transient_solve_TR
+from solver import transient_solve_TR, transient_solve_TR_multi, TR_geometry
 # from Gasses import gasses 
 # from Sites import sites 
-from reader import read_input, read_init
+from reader import read_input, read_init, HDF_EXTENSIONS
 import json
 import scipy.interpolate as interpolate
 from constants import *
@@ -52,12 +52,19 @@ class isotopeDiffusion:
                 input_year_iso_full = climateTS['time']
 
             else:
-                fn = os.path.splitext(self.c['InputFileNameIso'])
-                isofile = fn[0] + '_{}'.format(self.isotope) + fn[1]
-                print(isofile)
                 if isotope=='NoDiffusion':
-                    isofile = fn[0] + '_dD' + fn[1]
-                input_iso, input_year_iso, input_iso_full, input_year_iso_full = read_input(os.path.join(self.c['InputFileFolder'],isofile),updatedStartDate)
+                    isokey = 'dD'
+                else:
+                    isokey = isotope
+                fn = os.path.splitext(self.c['InputFileNameIso'])
+                if fn[1].lower() in HDF_EXTENSIONS: # all isotopes are in one forcing file
+                    isofile = self.c['InputFileNameIso']
+                else:
+                    isofile = fn[0] + '_{}'.format(self.isotope) + fn[1]
+                    print(isofile)
+                    if isotope=='NoDiffusion':
+                        isofile = fn[0] + '_dD' + fn[1]
+                input_iso, input_year_iso, input_iso_full, input_year_iso_full = read_input(os.path.join(self.c['InputFileFolder'],isofile),updatedStartDate,isokey)
 
             if spin:
                 if self.c['spinup_climate_type']=='initial':
@@ -129,13 +136,7 @@ class isotopeDiffusion:
         nz_fv       = nz_P - 2      # number of finite volumes in z
         nt          = 1             # number of time steps
 
-        # z_edges_vec = self.z[1:-2] + self.dz[2:-1] / 2                        # uniform edge spacing of volume edges
-        # z_edges_vec = np.concatenate(([self.z[0]], z_edges_vec, [self.z[-1]]))
-        # z_P_vec   = self.z
-
-        z_edges_vec1 = self.z[0:-1] + np.diff(self.z) / 2
-        z_edges_vec = np.concatenate(([self.z[0]], z_edges_vec1, [self.z[-1]]))
-        z_P_vec     = self.z
+        z_edges_vec, z_P_vec = iso_grid(self.z)
 
         ### Node positions
         phi_s       = self.del_z[0] # isotope value at surface
@@ -144,6 +145,27 @@ class isotopeDiffusion:
         #     print('Caution! line 121, isotopeDiffusion.py')
         phi_0       = self.del_z # initial isotope profile
 
+        D = self.diffusivity()
+        c_vol = np.ones_like(self.rho) # Just a filler here to make the diffusion work.
+        if self.diffuses():
+            self.del_z  = transient_solve_TR(z_edges_vec, z_P_vec, nt, self.dt, D, phi_0, nz_P, nz_fv, phi_s, self.rho, c_vol)
+
+        return self.advect(D,iii)
+
+    def diffuses(self):
+        '''
+        False for the 'NoDiffusion' species, which is only advected.
+        '''
+        return self.isotope not in ['NoDiffusion','ND']
+
+    def diffusivity(self):
+        '''
+        Diffusivity of this isotope species for the current temperature and
+        density profiles (set by isoDiff or isoDiff_multi).
+
+        :returns D:
+        '''
+
         ### Define diffusivity for each isotopic species
         ### Establish values needed for diffusivity calculation
         m           = 0.018 # kg/mol; molar mass of water
@@ -168,22 +190,30 @@ class isotopeDiffusion:
         invtau[self.rho >= RHO_I / np.sqrt(b)]  = 0.0
 
         ### Set diffusivity for each isotope
-        c_vol = np.ones_like(self.rho) # Just a filler here to make the diffusion work.
         if ((self.isotope == '18') or (self.isotope == 'd18O')):
             Da_18   = Da / 1.0285 # account for fractionation factor for 18_O, fixed Johnsen typo
             D       = m * pz * invtau * Da_18 * (1 / self.rho - 1 / RHO_I) / (R * self.Tz * alpha_18_z)
             D       = D + 1.5e-15 # Emma added - not sure why? prevent negative?
-            self.del_z  = transient_solve_TR(z_edges_vec, z_P_vec, nt, self.dt, D, phi_0, nz_P, nz_fv, phi_s, self.rho, c_vol)
 
         elif ((self.isotope == 'D') or (self.isotope == 'dD')):
             Da_D    = Da / 1.0251 # account for fractionation factor for D, fixed Johnsen typo
             D       = m * pz * invtau * Da_D * (1 / self.rho - 1 / RHO_I) / (R * self.Tz * alpha_D_z)
             D[D<=0.0]   = 1.0e-20
-            self.del_z  = transient_solve_TR(z_edges_vec, z_P_vec, nt, self.dt, D, phi_0, nz_P, nz_fv, phi_s, self.rho, c_vol)
 
         elif ((self.isotope == 'NoDiffusion') or (self.isotope == 'ND')):
             D = np.zeros_like(self.z)           
 
+        return D
+
+    def advect(self,D,iii):
+        '''
+        Update the diffusion length and advect the profiles down by one box
+        (after the diffusion solve).
+
+        :returns self.del_z:
+        :returns self.iso_sig2_z:
+        '''
+
         dsig2_dt = 2 * (-1*self.drho_dt/self.rho) * self.iso_sig2_z + 2 * D
         self.iso_sig2_z = self.iso_sig2_z + dsig2_dt * self.dt
             
@@ -197,4 +227,63 @@ class isotopeDiffusion:
         # self.del_z[0] = self.del_z[1]
         # print('Caution!!! You are altering the upper isotope value! Line 173, isotopeDiffusion.py')
 
-        return self.del_z, self.iso_sig2_z 
+        return self.del_z, self.iso_sig2_z
+
+def iso_grid(z):
+    '''
+    Volume edges and node positions used for isotope diffusion.
+    '''
+
+    # z_edges_vec = self.z[1:-2] + self.dz[2:-1] / 2                        # uniform edge spacing of volume edges
+    # z_edges_vec = np.concatenate(([self.z[0]], z_edges_vec, [self.z[-1]]))
+    # z_P_vec   = self.z
+
+    z_edges_vec1 = z[0:-1] + np.diff(z) / 2
+    z_edges_vec = np.concatenate(([z[0]], z_edges_vec1, [z[-1]]))
+    z_P_vec     = z
+
+    return z_edges_vec, z_P_vec
+
+def isoDiff_multi(Isotopes,IsoParams,iii):
+    '''
+    Isotope diffusion for all of the isotope species in a run.
+
+    All species are diffused on the same grid, so the grid geometry is
+    calculated once and the species are solved together
+    (transient_solve_TR_multi). The results are the same as calling isoDiff
+    for each species.
+
+    :param Isotopes: dictionary of isotopeDiffusion instances (key is the isotope)
+    :param IsoParams: same as for isoDiff
+    :param iii: time step
+
+    :returns Isoz: dictionary of the updated isotope profiles
+    :returns Iso_sig2_z: dictionary of the updated diffusion lengths
+    '''
+
+    nt          = 1             # number of time steps
+    z_edges_vec, z_P_vec = iso_grid(IsoParams['z'])
+    geometry    = TR_geometry(z_edges_vec, z_P_vec)
+
+    Dd = {}
+    for isotope, iso in Isotopes.items():
+        for k,v in list(IsoParams.items()):
+            setattr(iso,k,v)
+        Dd[isotope] = iso.diffusivity()
+
+    solve = [isotope for isotope in Isotopes if Isotopes[isotope].diffuses()]
+    if solve:
+        Gamma_P = np.array([Dd[isotope] for isotope in solve])
+        phi_0   = np.array([Isotopes[isotope].del_z for isotope in solve])
+        phi_s   = phi_0[:,0] # isotope value at surface
+        c_vol   = np.ones_like(IsoParams['rho']) # Just a filler here to make the diffusion work.
+        phi_t   = transient_solve_TR_multi(z_edges_vec, z_P_vec, nt, IsoParams['dt'], Gamma_P, phi_0, phi_s, c_vol, geometry)
+        for kk, isotope in enumerate(solve):
+            Isotopes[isotope].del_z = phi_t[kk]
+
+    Isoz = {}
+    Iso_sig2_z = {}
+    for isotope, iso in Isotopes.items():
+        Isoz[isotope], Iso_sig2_z[isotope] = iso.advect(Dd[isotope],iii)
+
+    return Isoz, Iso_sig2_z 
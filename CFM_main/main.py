@@ -20,10 +20,10 @@ import sys
 import os
 # from firn_density_spin import FirnDensitySpin
 from firn_density_nospin import FirnDensityNoSpin
+from checkpoint import load_checkpoint, checkpoint_file
 import time
 import json
 import shutil
-import RCMpkl_to_spin as RCM
 
 __author__ = "C. Max Stevens, Vincent Verjans, Brita Horlings, Annika Horlings, Jessica Lundin"
 __license__ = "MIT"
@@ -72,17 +72,25 @@ if __name__ == '__main__':
 
     if 'input_type' not in c:
         c['input_type'] = "csv"
+    if 'checkpointFileName' not in c:
+        c['checkpointFileName'] = 'CFMcheckpoint.pkl'
 
-    if c['input_type'] == 'dataframe':
-        pkl_name = os.path.join(c['InputFileFolder'],c['DFfile'])
-        timeres = c['DFresample']
-        desired_depth = c['H'] - c['HbaseSpin']
-        climateTS, stepsperyear, depth_S1, depth_S2, desired_depth, SEBfluxes = RCM.makeSpinFiles(pkl_name,timeres = timeres, melt = c['MELT'], desired_depth = desired_depth)
-    else: # inputs from .csv (original CFM functionality)
-        climateTS = None
-        SEBfluxes = None
+    if '-r' in sys.argv: # continue a run from its last checkpoint (see checkpoint.py)
+        firn = load_checkpoint(checkpoint_file(c))
+
+    else:
+        if c['input_type'] == 'dataframe':
+            import RCMpkl_to_spin as RCM # (pandas) only needed for dataframe inputs
+            pkl_name = os.path.join(c['InputFileFolder'],c['DFfile'])
+            timeres = c['DFresample']
+            desired_depth = c['H'] - c['HbaseSpin']
+            climateTS, stepsperyear, depth_S1, depth_S2, desired_depth, SEBfluxes = RCM.makeSpinFiles(pkl_name,timeres = timeres, melt = c['MELT'], desired_depth = desired_depth)
+        else: # inputs from .csv (original CFM functionality)
+            climateTS = None
+            SEBfluxes = None
+
+        firn = FirnDensityNoSpin(configName, climateTS = climateTS, NewSpin = NewSpin, SEBfluxes=SEBfluxes)
 
-    firn = FirnDensityNoSpin(configName, climateTS = climateTS, NewSpin = NewSpin, SEBfluxes=SEBfluxes)
     firn.time_evolve()
 
     shutil.copy(configName,c['resultsFolder'])
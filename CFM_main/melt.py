@@ -10,18 +10,64 @@ from darcy_funcs import hydrconducsat_Calonne
 from darcy_funcs import vG_Yama_params
 from darcy_funcs import phead_vG
 from darcy_funcs import krel_vG
-from darcy_funcs import thetae_update
-from darcy_funcs import thetaeff_equaliser
 from darcy_funcs import dfdg_derivative
 from darcy_funcs import runoffZuoOerlemans
 from darcy_funcs import runoffDarcy
-from darcy_funcs import flux_bisection
-from darcy_funcs import flux_newtonraphson
+from darcy_funcs import flux_interfaces
 
 '''
 Functions to handle meltwater percolation.
 '''
 #############
+
+def ice_lenses(rho, dz, RhoImp, ThickImp, thicker=False):
+    '''
+    Find the ice lenses (runs of consecutive nodes with rho >= RhoImp) and
+    which of them are impermeable: those with thickness >= ThickImp (or
+    > ThickImp if thicker is True), and the deepest lens, because the bottom
+    of the domain is always impermeable.
+
+    :param rho: density [kg m-3]
+    :param dz: node thickness [m]
+    :param RhoImp: density threshold for a node to be part of an ice lens [kg m-3]
+    :param ThickImp: thickness threshold for an ice lens to be impermeable [m]
+    :param thicker: if True the lens thickness must exceed ThickImp
+
+    :return imp: indices of the impermeable nodes (integer array, increasing)
+    :return imptop: index of the top node of each impermeable lens
+    '''
+
+    ice     = rho >= RhoImp
+    lens0   = np.flatnonzero(ice[1:] & ~ice[:-1]) + 1 # top index of each ice lens
+    lens1   = np.flatnonzero(ice[:-1] & ~ice[1:]) # bottom index of each ice lens
+    if ice[0]: # if surface node is an ice lens
+        lens0 = np.append(0, lens0)
+    if ice[-1]: # bottom node is the end of the bottom ice lens
+        lens1 = np.append(lens1, len(rho) - 1)
+
+    if len(lens0) == 0:
+        return np.array([], dtype = int), np.array([], dtype = int)
+
+    ### thickness of each ice lens, summed node by node (for all lenses at once) so that the
+    ### thresholds see exactly the same sums as a loop over each lens. The deepest lens is
+    ### always impermeable, so its (possibly very long) sum is not needed.
+    nlens   = lens1 - lens0 + 1 # number of nodes in each ice lens
+    lensdz  = np.zeros(len(lens0))
+    for jj in range(int(np.max(nlens[:-1], initial = 0))):
+        inlens          = np.flatnonzero(nlens[:-1] > jj)
+        lensdz[inlens]  += dz[lens0[inlens] + jj]
+    if thicker:
+        isimp = lensdz > ThickImp
+    else:
+        isimp = lensdz >= ThickImp
+    isimp[-1] = True # impermeable bottom of the domain
+
+    lensid  = np.cumsum(np.r_[ice[0], ice[1:] & ~ice[:-1]]) - 1 # index of the lens that each ice node belongs to
+    imp     = np.flatnonzero(ice & isimp[np.maximum(lensid, 0)])
+    imptop  = lens0[isimp]
+
+    return imp, imptop
+
 def bucket(self,iii):   
     '''
     Percolation bucket scheme, with edits by Max
@@ -33,32 +79,16 @@ def bucket(self,iii):
 
     ####################
     ### USER CHOICES ###
-    try:
-        ColeouLesaffre     = self.c['ColeouLesaffre']  # parameterising irreducible water content following Coléou and Lesaffre (1998) formulation [True/False]
-        if ColeouLesaffre == False:
-            IrrVal         = self.c['IrrVal']   # [%] irreducible water content: proportion of pore space that holds irreducible water
-        RhoImp             = self.c['RhoImp']   # density threshold for nodes to be considered as ice lens [kg m-3]
-        DownToIce          = self.c['DownToIce']  # allows water to bypass all ice lenses until ice sheet is reached (depth where RhoImp density is definitely reached)
-        if DownToIce == False:
-            ThickImp       = self.c['ThickImp']    # thickness threshold for ice lens to be impermeable (all ice layers are impermeable if set to 0m) [m] # Using this is slow
-        Ponding            = self.c['Ponding']  # allowing LWC ponding above impermeable ice lenses [True/False]
-        DirectRunoff       = self.c['DirectRunoff']    # (applicable if Ponding==True) fraction of excess LWC not considered for ponding but running off directly [between 0 and 1]
-        RunoffZuoOerlemans = self.c['RunoffZuoOerlemans']  # (applicable if Ponding==True) computing lateral runoff following Zuo and Oerlemans (1996) Eqs.(21,22) [True/False]
-        Slope              = self.c['Slope']     # (used only if RunoffZuoOerlemans==True) slope value used in Zuo and Oerlemans (1996) Eq.(22) [/]
-
-    except:
-        print('You should add the new melt variables to your .json See melt.py and example.json')
-        ColeouLesaffre     = True  # parameterising irreducible water content following Coléou and Lesaffre (1998) formulation [True/False]
-        if ColeouLesaffre == False:
-            IrrVal         = 0.02   # [%] irreducible water content: proportion of pore space that holds irreducible water
-        RhoImp             = 830.   # density threshold for nodes to be considered as ice lens [kg m-3]
-        DownToIce          = False  # allows water to bypass all ice lenses until ice sheet is reached (depth where RhoImp density is definitely reached)
-        if DownToIce == False:
-            ThickImp       = 0.1    # thickness threshold for ice lens to be impermeable (all ice layers are impermeable if set to 0m) [m] # Using this is slow
-        Ponding            = False  # allowing LWC ponding above impermeable ice lenses [True/False]
-        DirectRunoff       = 0.0    # (applicable if Ponding==True) fraction of excess LWC not considered for ponding but running off directly [between 0 and 1]
-        RunoffZuoOerlemans = False  # (applicable if Ponding==True) computing lateral runoff following Zuo and Oerlemans (1996) Eqs.(21,22) [True/False]
-        Slope              = 0.1     # (used only if RunoffZuoOerlemans==True) slope value used in Zuo and Oerlemans (1996) Eq.(22) [/]
+    ### (set in the .json; see runplan.BUCKET_DEFAULTS for what they do and their defaults)
+    ColeouLesaffre     = self.plan.bucket['ColeouLesaffre']
+    IrrVal             = self.plan.bucket['IrrVal']
+    RhoImp             = self.plan.bucket['RhoImp']
+    DownToIce          = self.plan.bucket['DownToIce']
+    ThickImp           = self.plan.bucket['ThickImp']
+    Ponding            = self.plan.bucket['Ponding']
+    DirectRunoff       = self.plan.bucket['DirectRunoff']
+    RunoffZuoOerlemans = self.plan.bucket['RunoffZuoOerlemans']
+    Slope              = self.plan.bucket['Slope']
     ### END USER CHOICES ###
     ########################
 
@@ -138,7 +168,7 @@ def bucket(self,iii):
 
         self.LWC       = np.concatenate(([pm_lwc],self.LWC[ind1+1:-1],self.LWC[-1]*np.ones(n_melted)))
         
-        keep_firnthickness = self.c['keep_firnthickness']
+        keep_firnthickness = self.plan.keep_firnthickness
         
         if keep_firnthickness:
             nb_th = np.maximum(avg_dh_melted,self.dz[-1])
@@ -248,18 +278,7 @@ def bucket(self,iii):
     
     elif DownToIce==False:
         if ThickImp > 0:
-            lens0 = np.array([ii for ii in range(1,nnd) if (self.rho[ii]>=RhoImp and self.rho[ii-1]<RhoImp)]) # top index of each ice lens
-            lens1 = np.array([ii for ii in range(0,nnd-1) if (self.rho[ii]>=RhoImp and self.rho[ii+1]<RhoImp)]) # bottom index of each ice lens
-            
-            if self.rho[0] >= RhoImp: # if surface node is an ice lens
-                lens0 = np.append(0,lens0).astype(int) # add to list
-            
-            lens1 = np.append(lens1,nnd-1).astype(int) # bottom node is always end of the bottom ice lens
-            imp   = np.array([]) # prepare vector of impermeable nodes
-            for ii in range(len(lens0)):
-                lensdz = (sum(self.dz[lens0[ii]:lens1[ii]+1])) # thickness of the ice lens
-                if lensdz>=ThickImp or (ii==len(lens0)-1): # impermeability if thickimp reached (bottom of domain is always impermeable)
-                    imp = np.append(imp,np.arange(lens0[ii],lens1[ii]+1,1)).astype(int) #impermeable nodes
+            imp, imptop = ice_lenses(self.rho, self.dz, RhoImp, ThickImp) # impermeable nodes
         else:
             imp = np.where(self.rho>=RhoImp)[0] # all nodes exceeding RhoImp are considered impermeable
 
@@ -627,6 +646,7 @@ def darcyscheme(self,iii):
     dltz           = np.append(self.dz[0:-1]/2+self.dz[1:]/2,self.dz[-1]/2) #distance between centres of nodes
     runofftot      = 0. #total runoff over the entire Darcy routine
     refr_tot        = 0. #total refreezing over the entire Darcy routine
+    dh_melt        = 0. #thickness of the melted nodes over the entire Darcy routine (negative)
     if self.doublegrid: #if we have doublegrid: need to adjust gridtrack
         meltgridtrack  = np.copy(self.gridtrack) #prepare gridtrack adjusted for melting
     elif self.doublegrid==False:
@@ -653,6 +673,7 @@ def darcyscheme(self,iii):
             pm_lwc         = self.LWC[ind1]/self.dz[ind1] * pm_dz #lwc of partially melted node
             lwc_p          = sum(self.LWC[0:ind1+1])-pm_lwc #lwc of the melted part of the firn contributing to percolation
             n_mlt          = ind1+1 #number of nodes melted, including the partially melted node
+            dh_melt        = dh_melt - (np.sum(self.dz[0:ind1+1])-pm_dz) #thickness of melted nodes
             self.dz        = np.concatenate(([pm_dz],self.dz[ind1+1:-1],self.dz[-1]*np.ones(n_mlt))) #update dz
             self.dzn       = np.concatenate((np.zeros(n_mlt),self.dz[1:])) #taken from the code of Max
             self.dzn       = self.dzn[0:self.compboxes] #taken from the code of Max
@@ -684,18 +705,7 @@ def darcyscheme(self,iii):
         ### Spot ice lenses and evaluate their thickness ###
         if timer==0 or (n_mlt>1 or self.rho[0]>=RhoImp or len(rho_lens0[rho_lens0>=RhoImp])!=len(self.rho[self.rho>=RhoImp])):
             # Ice lens algorithm only at time step 0 or if the lens distribution has changed #
-            lens0 = np.array([ii for ii in range(1,ncv) if (self.rho[ii]>=RhoImp and self.rho[ii-1]<RhoImp)]) #top index of each ice lens
-            lens1 = np.array([ii for ii in range(0,ncv-1) if (self.rho[ii]>=RhoImp and self.rho[ii+1]<RhoImp)]) #bottom index of each ice lens
-            if self.rho[0]>=RhoImp: #if surface node is an ice lens
-                lens0 = np.append(0,lens0).astype(int) #add to list
-            lens1 = np.append(lens1,ncv-1).astype(int) #bottom node is always end of the bottom ice lens
-            imp    = np.array([]) #prepare vector of impermeable nodes
-            imptop = np.array([]) #prepare vector of nodes at the top of the impermeable ice lenses
-            for ii in range(len(lens0)):
-                lensdz = (sum(self.dz[lens0[ii]:lens1[ii]+1])) #thickness of the ice lens
-                if lensdz>ThickImp or (ii==len(lens0)-1): #impermeability if ThickImp reached (bottom of domain is always impermeable)
-                    imp = np.append(imp,np.arange(lens0[ii],lens1[ii]+1,1)).astype(int) #impermeable nodes
-                    imptop = np.append(imptop,lens0[ii]).astype(int) #surface node of the impermeable ice lens
+            imp, imptop = ice_lenses(self.rho, self.dz, RhoImp, ThickImp, thicker = True) # impermeable nodes and the top node of each impermeable lens
             
             if imp.size==0:
                 imp = np.array([len(self.rho)-1])
@@ -783,46 +793,14 @@ def darcyscheme(self,iii):
         # All i00 indices must have 0 outflow #
         i00      = np.unique(np.concatenate((indsdry,imp,imp_d,satnofl_d,[ncv-1]))).astype(int) #add imp, imp_d, satnofl_d and lower boundary volume to volumes without outflow
         # All i11 indices can have outflow >0 #
-        i11      = [ii for ii in range(i0dry) if ((ii in i00)==False)]
+        canflow  = np.ones(i0dry,dtype=bool)
+        canflow[i00[i00<i0dry]] = False
+        i11      = np.flatnonzero(canflow)
 
         ### Iterative guesses to determine qlim of Hirashima et al. (2010) ###
-        glw      = np.zeros(ncv-1) #initialise guess of downward transported lwc (equivalent of qlim in Hirashima 2010)
-        glwc     = np.copy(self.LWC) #initialise updated lwc after glw has been transported
-        glwcacm  = np.copy(LWCacm) #initialise updated lwcacm after glw has been transported
-        gtheta_e = np.copy(theta_e) #initialise updated theta_e after glw has been transported
-        ghd      = np.zeros(ncv-1) #initialise updated head pressure after glw has been transported
-        
-        for j1 in np.flip(i11): #find qlim at each interface in turn starting from bottom-most interface 
-            # qlim must equalise hd[j1] and hd[j1+1] assuming influx from j1-1 did not occur yet #
-            inds11 = np.array([j1,j1+1]) #indices at each side of the interface of interest
-            # First guess value for glw[j1] #
-            if timer==0 or abs(glwflux_d1[j1]-abs(glwflux_d2[j1])>0.1*glwflux_d1[j1]):
-                # glw flux is not in steady state: first guess equalises saturation[j1] and saturation[j1+1] #
-                glw[j1] = thetaeff_equaliser(theta_i[inds11],theta_s[inds11],glwc[inds11],self.dz[inds11])
-                glw[j1] = max(glw[j1],0) #avoid negative guess values
-                glw[j1] = min(glw[j1],min(LWCav[j1],glwcacm[j1+1])) #guess values cannot exceed available LWC
-            else:
-                # glw flux is stable: initial guess keeps previous value #
-                glw[j1] = dtsub*glwflux_d1[j1] #glw set to flux corresponding to glw calculated at previous Darcy step          
-                glw[j1] = min(glw[j1],min(LWCav[j1],glwcacm[j1+1])) #guess values cannot exceed available LWC
-
-            # Update gtheta_e and ghd #
-            gtheta_e[inds11] = thetae_update(glw[j1],theta_i[inds11],theta_s[inds11],glwc[inds11],self.dz[inds11])
-            ghd[inds11] = phead_vG(avG[inds11],nvG[inds11],mvG[inds11],gtheta_e[inds11]) #pressure head [m]
-            # Calculate equilibrium #
-            f_eq = ghd[j1]-ghd[j1+1]-dltz[j1] #Hirashima 2010 Eq.(20) evaluated at interface
-
-            if abs(f_eq>1.):
-                # Initial guess gives f_eq far from 0: Bisection algorithm #
-                glw[j1] = flux_bisection(glw[j1],LWCav,glwcacm,theta_i[inds11],theta_s[inds11],glwc[inds11],self.dz[inds11],avG[inds11],nvG[inds11],mvG[inds11],eps_cvg)
-            else:
-                # Initial guess gives f_eq close to 0: Newton-Raphson algorithm #
-                glw[j1] = flux_newtonraphson(glw[j1],LWCav,glwcacm,theta_i[inds11],theta_s[inds11],glwc[inds11],self.dz[inds11],avG[inds11],nvG[inds11],mvG[inds11],eps_cvg)
-                             
-            # Update glwc and glwcacm according to updated flow (to compute gtheta_e when dealing with upper nodes) #
-            glwc         = self.LWC+np.append(0,glw)-np.append(glw,0) #update glwc 
-            glwcacm      = self.dz*theta_s-glwc #update glwcacm
-            glwcacm[imp] = 0. #do not allow for water storage in impermeable ice lenses
+        # First guess at each interface: equalise saturation if glw flux is not in steady state, otherwise keep previous value #
+        unsteady = (timer==0) | ((glwflux_d1-np.abs(glwflux_d2))>0.1*glwflux_d1)
+        glw      = flux_interfaces(i11,unsteady,glwflux_d1,dtsub,self.LWC,LWCav,LWCacm,imp,theta_i,theta_s,self.dz,avG,nvG,mvG,dltz,eps_cvg) #downward transported lwc (equivalent of qlim in Hirashima 2010)
 
         glwflux_d2 = np.copy(glwflux_d1) #save glw fluxes computed at Darcy step -2
         glwflux_d1 = glw/dtsub #save glw fluxes computed at Darcy step -1
@@ -907,7 +885,7 @@ def darcyscheme(self,iii):
         print(f'{iii} CFM time: {self.modeltime[iii]}')
         print(f'Darcy scheme run time: {np.around(time.time()-ticdarcy,2)}')    
 
-    return self.rho,self.age,self.dz,self.Tz,self.r2,self.z,self.mass,self.dzn,self.LWC,meltgridtrack,refr_tot,runofftot
+    return self.rho,self.age,self.dz,self.Tz,self.r2,self.z,self.mass,self.dzn,self.LWC,meltgridtrack,refr_tot,runofftot,dh_melt
 
 
 # def LWC_correct(self):
@@ -37,6 +37,7 @@ import pandas as pd
 import fnmatch
 import time
 from scipy.spatial import cKDTree
+from RCMpkl_to_spin import decimal_year
 ######################################
 
 datatype = 'MAR' # RACMO or MAR
@@ -117,7 +118,7 @@ if datatype == 'RACMO':
 
         df_y = pd.DataFrame({'smb':s1,'tskin':t1,'smelt':m1},index=dti)
 
-        df_y['decdate'] = [toYearFraction(jj) for jj in dti]
+        df_y['decdate'] = decimal_year(dti)
 
         if kk == 0:
             df = df_y.copy()
@@ -157,7 +158,7 @@ elif datatype=='MAR':
 
         df_y = pd.DataFrame({'smb':s1,'tskin':t1,'smelt':m1},index=dti)
 
-        df_y['decdate'] = [toYearFraction(jj) for jj in dti]
+        df_y['decdate'] = decimal_year(dti)
 
         if kk == 0:
             df = df_y.copy()
@@ -16,6 +16,30 @@ from scipy import interpolate
 import sys
 import numpy.polynomial.polynomial as poly
 
+### map from the 'physRho' config value to the FirnPhysics method that implements it
+PHYSICS_METHODS = {
+    'HLdynamic':            'HL_dynamic',
+    'HLSigfus':             'HL_Sigfus',
+    'Barnola1991':          'Barnola_1991',
+    'Li2004':               'Li_2004',
+    'Li2011':               'Li_2011',
+    'Li2015':               'Li_2015',
+    'Ligtenberg2011':       'Ligtenberg_2011',
+    'Arthern2010S':         'Arthern_2010S',
+    'Simonsen2013':         'Simonsen_2013',
+    'Morris2014':           'Morris_HL_2014',
+    'Helsen2008':           'Helsen_2008',
+    'Arthern2010T':         'Arthern_2010T',
+    'Goujon2003':           'Goujon_2003',
+    'KuipersMunneke2015':   'KuipersMunneke_2015',
+    'Brils2022':            'Brils_2022',
+    'Veldhuijsen2023':      'Veldhuijsen_2023',
+    'Crocus':               'Crocus',
+    'GSFC2020':             'GSFC2020',
+    'MaxSP':                'MaxSP',
+    'Breant2017':           'Breant2017'
+}
+
 class FirnPhysics:
 
     '''
@@ -35,6 +59,12 @@ class FirnPhysics:
     :return drho_dt:
     :return viscosity:
 
+    HL_dynamic, Li_2004, Helsen_2008, Arthern_2010S, Arthern_2010T,
+    Ligtenberg_2011, KuipersMunneke_2015 (bdot_type 'instant' or 'mean'),
+    surfacegrain and graincalc (without MELT) also work on an ensemble of
+    columns (ensemble.py): the depth variables are then (nens, gridLen) arrays,
+    gridLen is their shape, and bdotSec, T_mean and bdot_av are indexed by time
+    step first and give (nens, 1) arrays.
     '''
 
     def __init__(self,PhysParams):
@@ -47,6 +77,22 @@ class FirnPhysics:
             setattr(self,k,v)
         self.RD = {} # RD = Return Dictionary, set up this way so that more things can be returned easily if needed.
 
+    def update(self,PhysParams):
+        '''
+        Load the current time step's parameters into an existing instance.
+        The spin and nospin time loops keep one FirnPhysics instance for the
+        whole run and call this each step rather than building a new one.
+        '''
+        self.__dict__.update(PhysParams)
+        self.RD = {}
+
+    def densification(self,physRho):
+        '''
+        Return the bound method for densification model physRho
+        (a key of PHYSICS_METHODS).
+        '''
+        return getattr(self,PHYSICS_METHODS[physRho])
+
 
     def HL_dynamic(self):
         '''
@@ -66,20 +112,17 @@ class FirnPhysics:
         drho_dt = np.zeros(self.gridLen)
         viscosity = np.zeros(self.gridLen)
         
-        if A_instant<0:
-            A_instant = 0.0
+        A_instant = np.maximum(A_instant, 0.0)
 
         if self.bdot_type == 'instant':
-            if A_instant<0:
-                A_instant = 0.0
             if (self.FirnAir and self.AirRunType=='steady'):
                 Tcon = self.steady_T * np.ones_like(self.Tz)
-                drho_dt[self.rho < RHO_1]     = k1 * np.exp(-Q1 / (R * Tcon[self.rho < RHO_1])) * (RHO_I_MGM - self.rho[self.rho < RHO_1] / 1000) * A_instant**aHL * 1000 / S_PER_YEAR
-                drho_dt[self.rho >= RHO_1]    = k2 * np.exp(-Q2 / (R * Tcon[self.rho >= RHO_1])) * (RHO_I_MGM - self.rho[self.rho >= RHO_1] / 1000) * A_instant**bHL * 1000 / S_PER_YEAR
             else:
-                drho_dt[self.rho < RHO_1]     = k1 * np.exp(-Q1 / (R * self.Tz[self.rho < RHO_1])) * (RHO_I_MGM - self.rho[self.rho < RHO_1] / 1000) * A_instant**aHL * 1000 / S_PER_YEAR
-                drho_dt[self.rho >= RHO_1]    = k2 * np.exp(-Q2 / (R * self.Tz[self.rho >= RHO_1])) * (RHO_I_MGM - self.rho[self.rho >= RHO_1] / 1000) * A_instant**bHL * 1000 / S_PER_YEAR
-                
+                Tcon = self.Tz
+            drho_dt = np.where(self.rho < RHO_1,
+                k1 * np.exp(-Q1 / (R * Tcon)) * (RHO_I_MGM - self.rho / 1000) * A_instant**aHL * 1000 / S_PER_YEAR,
+                k2 * np.exp(-Q2 / (R * Tcon)) * (RHO_I_MGM - self.rho / 1000) * A_instant**bHL * 1000 / S_PER_YEAR)
+            if not (self.FirnAir and self.AirRunType=='steady'):
                 viscosity[self.rho < RHO_I]   = (self.rho[self.rho < RHO_I]/ (2 * self.sigma[self.rho < RHO_I]))/drho_dt[self.rho < RHO_I]
                 # viscosity[self.rho < RHO_1]   = (self.rho[self.rho < RHO_1]* self.sigma[self.rho < RHO_1])/ (2 )/drho_dt[self.rho < RHO_1] 
                 # viscosity[self.rho >= RHO_1]  = (self.rho[self.rho >= RHO_1] * self.sigma[self.rho >= RHO_1] ) / (2)/drho_dt[self.rho >= RHO_1]
@@ -318,19 +361,20 @@ class FirnPhysics:
         Eg  = 42.4e3
 
         A_instant   = self.bdotSec[self.iii] * self.steps * S_PER_YEAR * RHO_I_MGM * 1000
-        A_mean_1    = self.bdot_mean[self.rho < RHO_1] * RHO_I_MGM * 1000
-        A_mean_2    = self.bdot_mean[self.rho >= RHO_1] * RHO_I_MGM * 1000
+        A_mean      = self.bdot_mean * RHO_I_MGM * 1000
         dr_dt       = np.zeros(self.gridLen)
         viscosity   = np.zeros(self.gridLen)
 
         if self.bdot_type == 'instant':
             if self.iii==0:
                 print("It is not recommended to use instant accumulation with Arthern 2010 physics")
-            dr_dt[self.rho < RHO_1]  = (RHO_I - self.rho[self.rho < RHO_1]) * ar1 * A_instant * GRAVITY * np.exp(-Ec / (R * self.Tz[self.rho < RHO_1]) + Eg / (R * self.T_mean[self.iii]))
-            dr_dt[self.rho >= RHO_1] = (RHO_I - self.rho[self.rho >= RHO_1]) * ar2 * A_instant * GRAVITY * np.exp(-Ec / (R * self.Tz[self.rho >= RHO_1]) + Eg / (R * self.T_mean[self.iii]))
+            dr_dt = np.where(self.rho < RHO_1,
+                (RHO_I - self.rho) * ar1 * A_instant * GRAVITY * np.exp(-Ec / (R * self.Tz) + Eg / (R * self.T_mean[self.iii])),
+                (RHO_I - self.rho) * ar2 * A_instant * GRAVITY * np.exp(-Ec / (R * self.Tz) + Eg / (R * self.T_mean[self.iii])))
         elif self.bdot_type == 'mean':
-            dr_dt[self.rho < RHO_1]  = (RHO_I - self.rho[self.rho < RHO_1]) * ar1 * A_mean_1 * GRAVITY * np.exp(-Ec / (R * self.Tz[self.rho < RHO_1]) + Eg / (R * self.T_mean[self.iii]))
-            dr_dt[self.rho >= RHO_1] = (RHO_I - self.rho[self.rho >= RHO_1]) * ar2 * A_mean_2 * GRAVITY * np.exp(-Ec / (R * self.Tz[self.rho >= RHO_1]) + Eg / (R * self.T_mean[self.iii]))
+            dr_dt = np.where(self.rho < RHO_1,
+                (RHO_I - self.rho) * ar1 * A_mean * GRAVITY * np.exp(-Ec / (R * self.Tz) + Eg / (R * self.T_mean[self.iii])),
+                (RHO_I - self.rho) * ar2 * A_mean * GRAVITY * np.exp(-Ec / (R * self.Tz) + Eg / (R * self.T_mean[self.iii])))
 
         drho_dt = dr_dt / S_PER_YEAR
         
@@ -470,19 +514,20 @@ class FirnPhysics:
             A_instant = self.bdotSec[self.iii] * self.steps * S_PER_YEAR * RHO_I_MGM * 1000
             M_0 = 1.435 - 0.151 * np.log(A_instant)
             M_1 = 2.366 - 0.293 * np.log(A_instant)
-            M_0 = np.max((0.25,M_0))
-            M_1 = np.max((0.25,M_1))
-            dr_dt[self.rho < RHO_1]  = (RHO_I - self.rho[self.rho < RHO_1]) * M_0 * ar1 * A_instant * GRAVITY * np.exp(-Ec / (R * self.Tz[self.rho < RHO_1]) + Eg / (R * self.T_mean[self.iii]))
-            dr_dt[self.rho >= RHO_1] = (RHO_I - self.rho[self.rho >= RHO_1]) * M_1 * ar2 * A_instant * GRAVITY * np.exp(-Ec / (R * self.Tz[self.rho >= RHO_1])+ Eg / (R * self.T_mean[self.iii]))
+            M_0 = np.maximum(0.25,M_0)
+            M_1 = np.maximum(0.25,M_1)
+            dr_dt = np.where(self.rho < RHO_1,
+                (RHO_I - self.rho) * M_0 * ar1 * A_instant * GRAVITY * np.exp(-Ec / (R * self.Tz) + Eg / (R * self.T_mean[self.iii])),
+                (RHO_I - self.rho) * M_1 * ar2 * A_instant * GRAVITY * np.exp(-Ec / (R * self.Tz)+ Eg / (R * self.T_mean[self.iii])))
         elif self.bdot_type == 'mean':
-            A_mean_1 = self.bdot_mean[self.rho < RHO_1] * RHO_I
-            A_mean_2 = self.bdot_mean[self.rho >= RHO_1] * RHO_I
-            M_0 = 1.435 - 0.151 * np.log(A_mean_1)
-            M_1 = 2.366 - 0.293 * np.log(A_mean_2)
+            A_mean = self.bdot_mean * RHO_I
+            M_0 = 1.435 - 0.151 * np.log(A_mean)
+            M_1 = 2.366 - 0.293 * np.log(A_mean)
             M_0[M_0<0.25]=0.25
             M_1[M_1<0.25]=0.25
-            dr_dt[self.rho < RHO_1]  = (RHO_I - self.rho[self.rho < RHO_1]) * M_0 * ar1 * A_mean_1 * GRAVITY * np.exp(-Ec / (R * self.Tz[self.rho < RHO_1]) + Eg / (R * self.T_mean[self.iii]))
-            dr_dt[self.rho >= RHO_1] = (RHO_I - self.rho[self.rho >= RHO_1]) * M_1 * ar2 * A_mean_2 * GRAVITY * np.exp(-Ec / (R * self.Tz[self.rho >= RHO_1]) + Eg / (R * self.T_mean[self.iii]))
+            dr_dt = np.where(self.rho < RHO_1,
+                (RHO_I - self.rho) * M_0 * ar1 * A_mean * GRAVITY * np.exp(-Ec / (R * self.Tz) + Eg / (R * self.T_mean[self.iii])),
+                (RHO_I - self.rho) * M_1 * ar2 * A_mean * GRAVITY * np.exp(-Ec / (R * self.Tz) + Eg / (R * self.T_mean[self.iii])))
 
         elif self.bdot_type == 'stress':
             A_mean_1 = self.bdot_mean[self.rho < RHO_1] * RHO_I
@@ -661,23 +706,24 @@ class FirnPhysics:
                 print("It is not recommended to use instant accumulation with Ligtenberg 2011 physics")
             M_0 = 1.042 - 0.0916 * np.log(A_instant)
             M_1 = 1.734 - 0.2039 * np.log(A_instant)
-            M_0 = np.max((0.25,M_0))
-            M_1 = np.max((0.25,M_1))
-            dr_dt[self.rho < RHO_1]  = (RHO_I - self.rho[self.rho < RHO_1]) * M_0 * ar1 * A_instant * GRAVITY * np.exp(-Ec / (R * self.Tz[self.rho < RHO_1]) + Eg / (R * self.T_mean[self.iii]))
-            dr_dt[self.rho >= RHO_1] = (RHO_I - self.rho[self.rho >= RHO_1]) * M_1 * ar2 * A_instant * GRAVITY * np.exp(-Ec / (R * self.Tz[self.rho >= RHO_1])+ Eg / (R * self.T_mean[self.iii]))
+            M_0 = np.maximum(0.25,M_0)
+            M_1 = np.maximum(0.25,M_1)
+            dr_dt = np.where(self.rho < RHO_1,
+                (RHO_I - self.rho) * M_0 * ar1 * A_instant * GRAVITY * np.exp(-Ec / (R * self.Tz) + Eg / (R * self.T_mean[self.iii])),
+                (RHO_I - self.rho) * M_1 * ar2 * A_instant * GRAVITY * np.exp(-Ec / (R * self.Tz)+ Eg / (R * self.T_mean[self.iii])))
 
         elif self.bdot_type == 'mean':
-            A_mean_1 = self.bdot_mean[self.rho < RHO_1] * RHO_I
-            A_mean_2 = self.bdot_mean[self.rho >= RHO_1] * RHO_I
+            A_mean = self.bdot_mean * RHO_I
 
-            M_0 = 1.042 - 0.0916 * np.log(A_mean_1)
-            M_1 = 1.734 - 0.2039 * np.log(A_mean_2)
+            M_0 = 1.042 - 0.0916 * np.log(A_mean)
+            M_1 = 1.734 - 0.2039 * np.log(A_mean)
 
             M_0[M_0<0.25]=0.25
             M_1[M_1<0.25]=0.25
 
-            dr_dt[self.rho < RHO_1]  = (RHO_I - self.rho[self.rho < RHO_1]) * M_0 * ar1 * A_mean_1 * GRAVITY * np.exp(-Ec / (R * self.Tz[self.rho < RHO_1]) + Eg / (R * self.T_mean[self.iii]))
-            dr_dt[self.rho >= RHO_1] = (RHO_I - self.rho[self.rho >= RHO_1]) * M_1 * ar2 * A_mean_2 * GRAVITY * np.exp(-Ec / (R * self.Tz[self.rho >= RHO_1]) + Eg / (R * self.T_mean[self.iii]))
+            dr_dt = np.where(self.rho < RHO_1,
+                (RHO_I - self.rho) * M_0 * ar1 * A_mean * GRAVITY * np.exp(-Ec / (R * self.Tz) + Eg / (R * self.T_mean[self.iii])),
+                (RHO_I - self.rho) * M_1 * ar2 * A_mean * GRAVITY * np.exp(-Ec / (R * self.Tz) + Eg / (R * self.T_mean[self.iii])))
 
             # dr_dt[self.rho < RHO_1]  = (RHO_I - self.rho[self.rho < RHO_1]) * M_0 * ar1 * A_mean_1 * GRAVITY * np.exp(-Ec / (R * self.Tz[self.rho < RHO_1]) + Eg / (R * self.T50))
             # dr_dt[self.rho >= RHO_1] = (RHO_I - self.rho[self.rho >= RHO_1]) * M_1 * ar2 * A_mean_2 * GRAVITY * np.exp(-Ec / (R * self.Tz[self.rho >= RHO_1]) + Eg / (R * self.T50))
@@ -815,6 +861,75 @@ class FirnPhysics:
     ### end Veldhuijsen_2023 ###
     ###############################
 
+    def zone12_gamma(self, sigma_bar, D, ind1, dDdt2):
+        '''
+        Find Gamma_Gou, the factor in the zone 1 densification rate of Goujon
+        (2003) (also used by Breant2017), that makes the densification rate
+        continuous at the zone 1/2 transition.
+
+        ind1 is the deepest node that gets the zone 1 rate; dDdt2 is the zone 2
+        rate at node ind1+1, which does not depend on Gamma. So only
+        the rate at node ind1 needs to be recomputed while searching, not the
+        whole column.
+
+        With 'GoujonGamma' = 'iterate' (default), Gamma is increased by 3% and
+        then decreased by 1.5% per step until the zone 1 rate at ind1 is just
+        below dDdt2 (the original CFM scheme). With 'analytic', Gamma is
+        solved for directly so that the two rates are equal.
+
+        Sets self.Gamma_Gou, self.Gamma_old_Gou, self.Gamma_old2_Gou, and
+        self.ind1_old.
+        '''
+
+        if self.iii == 0 or ind1 != self.ind1_old:
+            self.Gamma_Gou       = 0.5 / S_PER_YEAR
+            self.Gamma_old_Gou   = self.Gamma_Gou
+        else:
+            self.Gamma_Gou       = self.Gamma_old_Gou
+
+        ### zone 1 rate at ind1 is Gamma * s1 * f1 / d1 (same operations as for the full column)
+        s1  = sigma_bar[ind1]
+        f1  = (1.0-(5.0/3.0)*D[ind1])
+        d1  = D[ind1]**2.0
+        def dDdt1(Gamma):
+            return Gamma*s1*f1/d1
+
+        gfrac           = 0.03
+        gam_div         = 1 + gfrac #change this if want: making it larger will make the code run faster. Must be >=1.
+
+        mode = getattr(self, 'GoujonGamma', 'iterate')
+        if mode == 'analytic':
+            Gamma_An = dDdt2 * d1 / (s1 * f1) # rate at ind1 equal to dDdt2
+            if np.isfinite(Gamma_An) and Gamma_An > 0:
+                self.Gamma_Gou = float(Gamma_An)
+            else: # e.g. D[ind1] >= 0.6; fall back to iterating
+                mode = 'iterate'
+
+        if mode != 'analytic':
+            ########## iterate to increase gamma first if not in steady state
+            if self.iii != 0 and dDdt1(self.Gamma_Gou) <= dDdt2 and self.Gamma_Gou!=self.Gamma_old2_Gou:
+                cc = 1
+                while dDdt1(self.Gamma_Gou) < dDdt2:
+                    self.Gamma_Gou       = self.Gamma_Gou * (gam_div)
+                    cc += 1
+                    if cc>10000:
+                        print('Goujon is not converging. exiting')
+                        sys.exit()
+
+            ### then iterate to find the maximum value of gamma that will make a continuous drho/dt
+            counter = 1
+            while dDdt1(self.Gamma_Gou) >= dDdt2:
+                self.Gamma_Gou      = self.Gamma_Gou / (1 + gfrac/2.0)
+                counter += 1
+                if counter>10000:
+                    print('Goujon is not converging. exiting')
+                    sys.exit()
+
+        self.Gamma_old2_Gou  = self.Gamma_old_Gou
+        self.Gamma_old_Gou   = self.Gamma_Gou
+        self.ind1_old        = ind1
+
+
     def Goujon_2003(self):
         '''
         Uses stress
@@ -863,43 +978,9 @@ class FirnPhysics:
         # gamma_An    = (5.3*A[ind1] * (Dms**2*D0)**(1.0/3.0) * (a[ind1]/np.pi)**(1.0/2.0) * (sigmastar[ind1]/3.0)**n) / ((sigma_bar[ind1]/(Dms**2))*(1-(5.0/3.0*Dms))) #this is the analytic solution of what gamma should be by combining equations A1 and A3 and solving for gamma (densification rate should be smooth at the zone 1/2 transition). Does not get used.
         # gamma_An    = (5.3*A[ind1+1] * (Dms**2*D0)**(1.0/3.0) * (a[ind1+1]/np.pi)**(1.0/2.0) * (sigmastar[ind1+1]/3.0)**n) / ((sigma_bar[ind1+1]/(Dms**2))*(1-(5.0/3.0*Dms))) #this is the analytic solution of what gamma should be by combining equations A1 and A3 and solving for gamma (densification rate should be smooth at the zone 1/2 transition). Does not get used.
 
-        if self.iii == 0 or ind1 != self.ind1_old:
-            self.Gamma_Gou       = 0.5 / S_PER_YEAR
-            self.Gamma_old_Gou   = self.Gamma_Gou
-        else:
-            self.Gamma_Gou       = self.Gamma_old_Gou
-
+        dDdt[ind1+1:]   = 5.3*A[ind1+1:]* (((D[ind1+1:]**2.0)*D0)**(1/3.)) * (a[ind1+1:]/np.pi)**(1.0/2.0) * (sigmastar[ind1+1:]/3.0)**n
+        self.zone12_gamma(sigma_bar, D, ind1, dDdt[ind1+1])
         dDdt[0:ind1+1]  = self.Gamma_Gou*(sigma_bar[0:ind1+1])*(1.0-(5.0/3.0)*D[0:ind1+1])/((D[0:ind1+1])**2.0)
-        dDdt[ind1+1:]   = 5.3*A[ind1+1:]* (((D[ind1+1:]**2.0)*D0)**(1/3.)) * (a[ind1+1:]/np.pi)**(1.0/2.0) * (sigmastar[ind1+1:]/3.0)**n         
-        gfrac           = 0.03
-        gam_div         = 1 + gfrac #change this if want: making it larger will make the code run faster. Must be >=1.
-        
-        ########## iterate to increase gamma first if not in steady state    
-        if self.iii != 0 and dDdt[ind1] <= dDdt[ind1+1] and self.Gamma_Gou!=self.Gamma_old2_Gou:
-            cc = 1
-            while dDdt[ind1] < dDdt[ind1 + 1]:
-                self.Gamma_Gou       = self.Gamma_Gou * (gam_div)
-                dDdt[0:ind1+1]  = self.Gamma_Gou*(sigma_bar[0:ind1+1])*(1.0-(5.0/3.0)*D[0:ind1+1])/((D[0:ind1+1])**2.0)
-                dDdt[ind1+1:]   = 5.3*A[ind1+1:]* (((D[ind1+1:]**2.0)*D0)**(1/3.)) * (a[ind1+1:]/np.pi)**(1.0/2.0) * (sigmastar[ind1+1:]/3.0)**n
-
-                cc += 1
-                if cc>10000:
-                    print('Goujon is not converging. exiting')
-                    sys.exit()
-
-        ### then iterate to find the maximum value of gamma that will make a continuous drho/dt
-
-        counter = 1
-        while dDdt[ind1] >= dDdt[ind1 + 1]:
-            
-            self.Gamma_Gou      = self.Gamma_Gou / (1 + gfrac/2.0)
-            dDdt[0:ind1+1] = self.Gamma_Gou*(sigma_bar[0:ind1+1])*(1.0-(5.0/3.0)*D[0:ind1+1])/((D[0:ind1+1])**2.0)
-            dDdt[ind1+1:]  = 5.3*A[ind1+1:]* (((D[ind1+1:]**2.0)*D0)**(1/3.)) * (a[ind1+1:]/np.pi)**(1.0/2.0) * (sigmastar[ind1+1:]/3.0)**n
-            counter += 1
-
-            if counter>10000:
-                print('Goujon is not converging. exiting')
-                sys.exit()
 
         #####
         # dDdt[0:ind1+1] = gamma_An*(sigma_bar[0:ind1+1])*(1.0-(5.0/3.0)*D[0:ind1+1])/((D[0:ind1+1])**2.0)
@@ -908,9 +989,6 @@ class FirnPhysics:
 
         # if self.iii<10:
             # print('dDdt',dDdt[ind1:ind1+2])
-        self.Gamma_old2_Gou  = self.Gamma_old_Gou
-        self.Gamma_old_Gou   = self.Gamma_Gou
-        self.ind1_old        = ind1
         #####################
         
         rhoC        = RHO_2 #should be Martinerie density
@@ -1006,43 +1084,9 @@ class FirnPhysics:
         # gamma_An    = (5.3*A[ind1] * (Dms**2*D0)**(1.0/3.0) * (a[ind1]/np.pi)**(1.0/2.0) * (sigmastar[ind1]/3.0)**n) / ((sigma_bar[ind1]/(Dms**2))*(1-(5.0/3.0*Dms))) #this is the analytic solution of what gamma should be by combining equations A1 and A3 and solving for gamma (densification rate should be smooth at the zone 1/2 transition). Does not get used.
         # gamma_An    = (5.3*A[ind1+1] * (Dms**2*D0)**(1.0/3.0) * (a[ind1+1]/np.pi)**(1.0/2.0) * (sigmastar[ind1+1]/3.0)**n) / ((sigma_bar[ind1+1]/(Dms**2))*(1-(5.0/3.0*Dms))) #this is the analytic solution of what gamma should be by combining equations A1 and A3 and solving for gamma (densification rate should be smooth at the zone 1/2 transition). Does not get used.
 
-        if self.iii == 0 or ind1 != self.ind1_old:
-            self.Gamma_Gou       = 0.5 / S_PER_YEAR
-            self.Gamma_old_Gou   = self.Gamma_Gou
-        else:
-            self.Gamma_Gou       = self.Gamma_old_Gou
-
+        dDdt[ind1+1:]   = 5.3*A[ind1+1:]* (((D[ind1+1:]**2.0)*D0)**(1/3.)) * (a[ind1+1:]/np.pi)**(1.0/2.0) * (sigmastar[ind1+1:]/3.0)**n
+        self.zone12_gamma(sigma_bar, D, ind1, dDdt[ind1+1])
         dDdt[0:ind1+1]  = self.Gamma_Gou*(sigma_bar[0:ind1+1])*(1.0-(5.0/3.0)*D[0:ind1+1])/((D[0:ind1+1])**2.0)
-        dDdt[ind1+1:]   = 5.3*A[ind1+1:]* (((D[ind1+1:]**2.0)*D0)**(1/3.)) * (a[ind1+1:]/np.pi)**(1.0/2.0) * (sigmastar[ind1+1:]/3.0)**n         
-        gfrac           = 0.03
-        gam_div         = 1 + gfrac #change this if want: making it larger will make the code run faster. Must be >=1.
-        
-        ########## iterate to increase gamma first if not in steady state    
-        if self.iii != 0 and dDdt[ind1] <= dDdt[ind1+1] and self.Gamma_Gou!=self.Gamma_old2_Gou:
-            cc = 1
-            while dDdt[ind1] < dDdt[ind1 + 1]:
-                self.Gamma_Gou       = self.Gamma_Gou * (gam_div)
-                dDdt[0:ind1+1]  = self.Gamma_Gou*(sigma_bar[0:ind1+1])*(1.0-(5.0/3.0)*D[0:ind1+1])/((D[0:ind1+1])**2.0)
-                dDdt[ind1+1:]   = 5.3*A[ind1+1:]* (((D[ind1+1:]**2.0)*D0)**(1/3.)) * (a[ind1+1:]/np.pi)**(1.0/2.0) * (sigmastar[ind1+1:]/3.0)**n
-
-                cc += 1
-                if cc>10000:
-                    print('Goujon is not converging. exiting')
-                    sys.exit()
-
-        ### then iterate to find the maximum value of gamma that will make a continuous drho/dt
-
-        counter = 1
-        while dDdt[ind1] >= dDdt[ind1 + 1]:
-            
-            self.Gamma_Gou      = self.Gamma_Gou / (1 + gfrac/2.0)
-            dDdt[0:ind1+1] = self.Gamma_Gou*(sigma_bar[0:ind1+1])*(1.0-(5.0/3.0)*D[0:ind1+1])/((D[0:ind1+1])**2.0)
-            dDdt[ind1+1:]  = 5.3*A[ind1+1:]* (((D[ind1+1:]**2.0)*D0)**(1/3.)) * (a[ind1+1:]/np.pi)**(1.0/2.0) * (sigmastar[ind1+1:]/3.0)**n
-            counter += 1
-
-            if counter>10000:
-                print('Goujon is not converging. exiting')
-                sys.exit()
 
         #####
         # dDdt[0:ind1+1] = gamma_An*(sigma_bar[0:ind1+1])*(1.0-(5.0/3.0)*D[0:ind1+1])/((D[0:ind1+1])**2.0)
@@ -1051,9 +1095,6 @@ class FirnPhysics:
 
         # if self.iii<10:
             # print('dDdt',dDdt[ind1:ind1+2])
-        self.Gamma_old2_Gou  = self.Gamma_old_Gou
-        self.Gamma_old_Gou   = self.Gamma_Gou
-        self.ind1_old        = ind1
         #####################
         
         rhoC        = RHO_2 #should be Martinerie density
@@ -8,17 +8,28 @@ import numpy as np
 # from string import join
 from constants import *
 import h5py
+import sys
 
-def read_input(filename,StartDate=None):
+### extensions of the files read with read_input_hdf5 rather than as .csv
+HDF_EXTENSIONS = ['.h5', '.hdf5', '.hdf', '.nc']
+
+def read_input(filename,StartDate=None,varname=None):
     '''
     Read in data from csv input files
 
+    If filename is an HDF5 (or netCDF4) forcing file, varname is read from
+    it with read_input_hdf5.
+
     :param filename: name of the file which holds the accumulation rate data
+    :param varname: name of the variable (only used for HDF5/netCDF forcing files)
 
     :return input_data: vector of field of interest (e.g. temperature, accumulation rate from a specified csv file
     :return input_year: corresponding time vector (in years)
     '''
 
+    if os.path.splitext(filename)[1].lower() in HDF_EXTENSIONS:
+        return read_input_hdf5(filename,[varname],StartDate)[varname]
+
     spot = os.getcwd()
 
     FID        = os.path.join(spot, filename)
@@ -52,6 +63,85 @@ def read_input(filename,StartDate=None):
 
     return input_data, input_year, input_data_full, input_year_full
 
+### location of each variable in the HDF5 forcing files that have been read (see read_input_hdf5);
+### keyed by (path, modification time, size), so a file that is rewritten is indexed again
+_hdf_index = {}
+
+def read_input_hdf5(filename,varnames,StartDate=None):
+    '''
+    Read several forcing variables from an HDF5 (or netCDF4) forcing file.
+
+    The file has one group per variable (e.g. 'TSKIN', 'BDOT', 'SMELT'),
+    each holding a 'time' dataset (decimal years) and a 'data' dataset (with
+    time along the last dimension); writer.write_forcing_hdf5 makes these files.
+
+    The file is only opened the first time it is read, to find where each
+    dataset is. The locations are kept for later reads of the same file, as
+    long as the file's modification time and size have not changed (if the
+    file is rewritten, it is opened and indexed again). The arrays
+    are then memory-mapped copy-on-write, so nothing is read until it is used
+    and the model can modify the returned arrays without changing the file.
+    Datasets that are chunked or compressed can not be mapped and are read
+    in the usual way.
+
+    :param filename: name of the forcing file
+    :param varnames: list of the variables to read
+
+    :return: dictionary with a tuple (input_data, input_year, input_data_full,
+    input_year_full) for each variable, as returned by read_input
+    '''
+
+    FID = os.path.abspath(filename)
+    st  = os.stat(FID)
+    key = (FID, st.st_mtime_ns, st.st_size)
+    if key not in _hdf_index:
+        for old in [k for k in _hdf_index if k[0] == FID]: # an older version of this file
+            del _hdf_index[old]
+        _hdf_index[key] = {}
+    index = _hdf_index[key]
+
+    if not index: # first time this version of the file is read: find all of the variables in it
+        with h5py.File(FID,'r') as f5:
+            for vn in f5:
+                if not ((isinstance(f5[vn], h5py.Group)) and ('time' in f5[vn]) and ('data' in f5[vn])):
+                    continue # not a forcing variable
+                index[vn] = {}
+                for dn in ['time','data']:
+                    dset = f5[vn][dn]
+                    offset = dset.id.get_offset()
+                    if ((offset is None) or (dset.chunks is not None)):
+                        index[vn][dn] = dset[()] # can not be mapped
+                    else:
+                        index[vn][dn] = (offset, dset.dtype, dset.shape)
+
+    for vn in varnames:
+        if vn not in index:
+            print(f'{vn} is not in forcing file {filename}')
+            sys.exit()
+
+    def load(vn,dn):
+        loc = index[vn][dn]
+        if isinstance(loc,np.ndarray):
+            return loc.copy()
+        offset, dtype, shape = loc
+        return np.asarray(np.memmap(FID, dtype=dtype, mode='c', offset=offset, shape=shape))
+
+    inputs = {}
+    for vn in varnames:
+        input_year_full = load(vn,'time')
+        input_data_full = load(vn,'data')
+        input_year = load(vn,'time') # separate maps, so changes to input_data do not show up in input_data_full
+        input_data = load(vn,'data')
+
+        if StartDate is not None:
+            StartInd = np.where(input_year>=StartDate)[0][0] # forcing times are increasing, so this is a view
+            input_year = input_year[StartInd:]
+            input_data = input_data[...,StartInd:]
+
+        inputs[vn] = (input_data, input_year, input_data_full, input_year_full)
+
+    return inputs
+
 def read_init(folder, resultsFileName, varname, udate = None):
 
     '''
@@ -76,3 +166,46 @@ def read_init(folder, resultsFileName, varname, udate = None):
 
     return init_value
 
+def read_output(filename, varname, rows = None, cols = None):
+    '''
+    Read (part of) an output from a results file.
+
+    Only the requested part of the dataset is read from the file, so e.g. the
+    time series at one depth of a large output is read without reading the
+    whole output. This is fastest when the output was written with 'depth'
+    chunks (see 'output_chunks' in the .json), and works with any of the
+    compression settings (h5py decompresses the data).
+
+    The outputs have the model time in the first column and one column per
+    layer (or per depth, with grid_outputs) after that; the first row is the
+    initial state.
+
+    :param filename: the results file
+    :param varname: name of the output in the results file, e.g. 'density'
+    :param rows: index or slice of the write times (rows) to read (default: all)
+    :param cols: index or slice of the layers/depths to read, not counting the time column (default: all)
+
+    :return time: model time of each row
+    :return values: the output values, with shape (rows, cols)
+    '''
+
+    if rows is None:
+        rows = slice(None)
+
+    with h5py.File(filename, 'r') as f:
+        ds = f[varname]
+        if ds.ndim == 1:
+            return None, ds[rows]
+        ncol = ds.shape[1] - 1 # number of layers/depths
+        if cols is None:
+            sel = slice(1, None)
+        elif isinstance(cols, slice):
+            start, stop, step = cols.indices(ncol)
+            sel = slice(start + 1, stop + 1, step)
+        elif isinstance(cols, (int, np.integer)):
+            sel = range(ncol)[cols] + 1
+        else:
+            sel = np.arange(ncol)[cols] + 1 # increasing indices (h5py)
+        time    = ds[rows, 0]
+        values  = ds[rows, sel]
+    return time, values
@@ -110,139 +110,244 @@ def regrid22(self):
         grid3  -> high resolution by splitting the lowest layer of grid23 in nodestocombine layers
 
     gridtrack keeps track of which grid each layer is in
+
+    The subgrids are found with section_starts, and each field is put back
+    together with regrid_field as new top layers (down to the new grid2 or
+    grid22 layer), the layers below them, which move up, and new bottom
+    layers. When the number of layers does not change (the usual case), the
+    fields in the LayerBuffer (self.LB) are regridded by moving their window
+    down, so only the top and bottom layers are written and a regrid costs
+    O(grid1 + nodestocombine) (plus grid2, every multnodestocombine regrids,
+    when a grid22 layer is made). Fields that were replaced by new arrays
+    during the time step are moved in place, O(number of layers).
+
+    z, mass_sum and sigma are not summed again over the whole column either:
+    the layers that move up keep their values and only the new layers are
+    added. The merged layers are summed in a different order than by cumsum,
+    so the values below them differ from a full sum by rounding, and they are
+    the sums from earlier in the time step, as on a step without regridding.
     '''
 
     n1      = self.c['nodestocombine'] # nodes to combine from grid1 to grid2 and to split from grid23 to grid3
     n2      = self.c['multnodestocombine'] # nodes to combine from grid2 to grid22 and to split from grid22 to grid23
     # if self.c['multnodestocombine'] is set to 0 -> process of grid22 is turned off and regrid works as old regrid
-    inds1   = np.where(self.gridtrack==1)[0] # layers in grid1 
-    inds2   = np.where(self.gridtrack==2)[0] # layers in grid2
-    i1_2    = inds1[-1*n1:] # layers to transition from grid1 to grid2
-    ind2a   = i1_2[0] # index of the future upper layer of grid2
-    ind2b   = inds2[0] # index of old upper layer of grid2
-    # Next grids
-    inds22  = np.where(self.gridtrack==22)[0] # all nodes in grid22
-    inds23  = np.where(self.gridtrack==23)[0] # all nodes in grid23
+    N       = len(self.dz)
+    s2, s22, s23, s3 = section_starts(self) # first layers of grid2 (layers above are grid1), grid22, grid23 and grid3
+    ind2a   = max(s2 - n1, 0) # index of the future upper layer of grid2
+    i1_2    = slice(ind2a, s2) # layers to transition from grid1 to grid2
+    ind2b   = s2 # index of old upper layer of grid2
+    if ind2a == ind2b:
+        raise IndexError('regrid22: no grid1 layers to merge into grid2')
+
+    r2      = self.r2 is not None
+    fields  = ['dz', 'rho', 'Tz', 'mass', 'age', 'bdot_mean', 'LWC', 'gridtrack'] + (['r2'] if r2 else [])
 
     ### properties of the new subgrid 2 node
-    g2dz    = np.array([np.sum(self.dz[i1_2])]) # sum thickness
-    g2mass  = np.sum(self.mass[i1_2]) # sum mass
-    g2rho   = g2mass/g2dz
-    g2Tz0   = np.sum(self.Tz[i1_2]*self.mass[i1_2])
-    g2Tz    = np.array([g2Tz0 / g2mass]) # Use a weighted average for temperature (effectively the enthalpy)
-    g2gt    = 2 #gridtrack
-    g2age   = np.mean(self.age[i1_2]) # mean age
+    g2 = {}
+    g2['dz']    = np.array([np.sum(self.dz[i1_2])]) # sum thickness
+    g2['mass']  = np.array([np.sum(self.mass[i1_2])]) # sum mass
+    g2['rho']   = g2['mass']/g2['dz']
+    g2Tz0       = np.sum(self.Tz[i1_2]*self.mass[i1_2])
+    g2['Tz']    = g2Tz0 / g2['mass'] # Use a weighted average for temperature (effectively the enthalpy)
+    g2['gridtrack'] = np.array([2]) #gridtrack
+    g2['age']   = np.array([np.mean(self.age[i1_2])]) # mean age
     #g2age   = np.sum(self.age[i1_2]*self.mass[i1_2])/g2mass #VV test weighted average for age -> change is imperceptible
-    g2bdm   = np.mean(self.bdot_mean[i1_2]) #mean bdot_mean
-    g2lwc   = np.sum(self.LWC[i1_2]) # sum for lwc
-    if self.r2 is not None:
-        g2r2    = np.mean(self.r2[i1_2]) # mean for r2
+    g2['bdot_mean'] = np.array([np.mean(self.bdot_mean[i1_2])]) #mean bdot_mean
+    g2['LWC']   = np.array([np.sum(self.LWC[i1_2])]) # sum for lwc
+    if r2:
+        g2['r2']    = np.array([np.mean(self.r2[i1_2])]) # mean for r2
     
-    if (len(inds23)==0 and n2>0): # No more layer in grid23 -> we have to split a layer from grid22
+    if (s3==s23 and n2>0): # No more layer in grid23 -> we have to split a layer from grid22
         ## First: merge n2 layers from grid2 ##
-        i2_22 = inds2[-1*n2:] # layers to transition from grid2 to grid22
-        ind22a   = i2_22[0] # index of the future upper layer of grid22
-        ind22b   = inds22[0] # current upper node of grid22
+        ind22a  = max(s22 - n2, s2) # index of the future upper layer of grid22
+        i2_22   = slice(ind22a, s22) # layers to transition from grid2 to grid22
+        ind22b  = s22 # current upper node of grid22
         # Properties of the new grid22 layer
-        g22dz    = np.array([np.sum(self.dz[i2_22])]) # sum thickness
-        g22mass  = np.sum(self.mass[i2_22]) # sum mass
-        g22rho   = g22mass/g22dz
-        g22Tz0   = np.sum(self.Tz[i2_22]*self.mass[i2_22])
-        g22Tz    = np.array([g22Tz0 / g22mass]) # Use a weighted average for temperature (the enthalpy)
-        g22gt    = 22 #gridtrack
-        g22age   = np.mean(self.age[i2_22])
-        g22bdm   = np.mean(self.bdot_mean[i2_22])
-        g22lwc   = np.sum(self.LWC[i2_22])
-        if self.r2 is not None:
-            g22r2    = np.mean(self.r2[i2_22])
+        g22 = {}
+        g22['dz']   = np.array([np.sum(self.dz[i2_22])]) # sum thickness
+        g22['mass'] = np.array([np.sum(self.mass[i2_22])]) # sum mass
+        g22['rho']  = g22['mass']/g22['dz']
+        g22Tz0      = np.sum(self.Tz[i2_22]*self.mass[i2_22])
+        g22['Tz']   = g22Tz0 / g22['mass'] # Use a weighted average for temperature (the enthalpy)
+        g22['gridtrack'] = np.array([22]) #gridtrack
+        g22['age']  = np.array([np.mean(self.age[i2_22])])
+        g22['bdot_mean'] = np.array([np.mean(self.bdot_mean[i2_22])])
+        g22['LWC']  = np.array([np.sum(self.LWC[i2_22])])
+        if r2:
+            g22['r2']   = np.array([np.mean(self.r2[i2_22])])
         
         ## Second: split the last grid22 layer in n2 layers for grid23
-        ind22c   = inds22[-1] # current lower layer of grid22 -> to be split (is also the last layer of the column)
-        g23dz    = self.dz[ind22c]/n2 * np.ones(n2)
-        g23rho   = self.rho[ind22c] * np.ones(n2)
-        g23mass  = g23rho * g23dz
-        g23gt    = 23 * np.ones(n2) #gridtrack values
-        g23Tz    = self.Tz[ind22c]* np.ones(n2)
-        g23age   = self.age[ind22c]*np.ones(n2)
-        g23bdm   = self.bdot_mean[ind22c]*np.ones(n2)
-        g23lwc   = self.LWC[ind22c]/n2 * np.ones(n2)
-        if self.r2 is not None:
-            g23r2    = self.r2[ind22c]*np.ones(n2)
+        ind22c  = s23 - 1 # current lower layer of grid22 -> to be split (is also the last layer of the column)
+        g23 = {}
+        g23['dz']   = self.dz[ind22c]/n2 * np.ones(n2)
+        g23['rho']  = self.rho[ind22c] * np.ones(n2)
+        g23['mass'] = g23['rho'] * g23['dz']
+        g23['gridtrack'] = 23 * np.ones(n2) #gridtrack values
+        g23['Tz']   = self.Tz[ind22c]* np.ones(n2)
+        g23['age']  = self.age[ind22c]*np.ones(n2)
+        g23['bdot_mean'] = self.bdot_mean[ind22c]*np.ones(n2)
+        g23['LWC']  = self.LWC[ind22c]/n2 * np.ones(n2)
+        if r2:
+            g23['r2']   = self.r2[ind22c]*np.ones(n2)
         
         ## Third: split the last layer of the new grid23 in n1 layers for grid3
-        # g3dz0 = g23dz[-1]/n1
-        # if g3dz0<self.c['merge_min']:
-        #     g3dz0 = self.c['merge_min']
-        #     print('doing thing')
-        #     input()
-        # g3dz = g3dz0 * np.ones(n1)
-
-        # g3dz    = g23dz[-1]/n1 * np.ones(n1)
-
-        g3dz    = g23dz[-1]/n1 * np.ones(n1)
-        g3rho   = g23rho[-1] * np.ones(n1)
-        g3mass  = g3rho * g3dz
-        g3gt    = 3 * np.ones(n1)
-        g3Tz    = g23Tz[-1]* np.ones(n1)
-        g3age   = g23age[-1]*np.ones(n1)
-        g3bdm   = g23bdm[-1]*np.ones(n1)
-        g3lwc   = g23lwc[-1]/n1 * np.ones(n1)
-        if self.r2 is not None:
-            g3r2    = g23r2[-1]*np.ones(n1)
+        g3 = {}
+        g3['dz']    = g23['dz'][-1]/n1 * np.ones(n1)
+        g3['rho']   = g23['rho'][-1] * np.ones(n1)
+        g3['mass']  = g3['rho'] * g3['dz']
+        g3['gridtrack'] = 3 * np.ones(n1)
+        g3['Tz']    = g23['Tz'][-1]* np.ones(n1)
+        g3['age']   = g23['age'][-1]*np.ones(n1)
+        g3['bdot_mean'] = g23['bdot_mean'][-1]*np.ones(n1)
+        g3['LWC']   = g23['LWC'][-1]/n1 * np.ones(n1)
+        if r2:
+            g3['r2']    = g23['r2'][-1]*np.ones(n1)
         
-        ## Fourth: concatenate everything together
-        self.dz         = np.concatenate((self.dz[0:ind2a],g2dz,self.dz[ind2b:ind22a],g22dz,self.dz[ind22b:ind22c],g23dz[0:-1],g3dz))
-        self.z          = self.dz.cumsum(axis=0)
-        self.z          = np.concatenate(([0], self.z[:-1]))
-        self.rho        = np.concatenate((self.rho[0:ind2a],g2rho,self.rho[ind2b:ind22a],g22rho,self.rho[ind22b:ind22c],g23rho[0:-1],g3rho))
-        self.Tz         = np.concatenate((self.Tz[0:ind2a],g2Tz,self.Tz[ind2b:ind22a],g22Tz,self.Tz[ind22b:ind22c],g23Tz[0:-1],g3Tz))
-        self.mass       = np.concatenate((self.mass[0:ind2a],[g2mass],self.mass[ind2b:ind22a],[g22mass],self.mass[ind22b:ind22c],g23mass[0:-1],g3mass))
-        self.mass_sum   = self.mass.cumsum(axis = 0)
-        self.age        = np.concatenate((self.age[0:ind2a],[g2age],self.age[ind2b:ind22a],[g22age],self.age[ind22b:ind22c],g23age[0:-1],g3age))
-        self.bdot_mean  = np.concatenate((self.bdot_mean[0:ind2a],[g2bdm],self.bdot_mean[ind2b:ind22a],[g22bdm],self.bdot_mean[ind22b:ind22c],g23bdm[0:-1],g3bdm))
-        self.LWC        = np.concatenate((self.LWC[0:ind2a],[g2lwc],self.LWC[ind2b:ind22a],[g22lwc],self.LWC[ind22b:ind22c],g23lwc[0:-1],g3lwc))
-        self.sigma      = (self.mass+self.LWC*RHO_W_KGM)*self.dx*GRAVITY
-        self.sigma      = self.sigma.cumsum(axis = 0)
-        self.gridtrack  = np.concatenate((self.gridtrack[0:ind2a],[g2gt],self.gridtrack[ind2b:ind22a],[g22gt],self.gridtrack[ind22b:ind22c],g23gt[0:-1],g3gt))
-        if self.r2 is not None:
-            self.r2         = np.concatenate((self.r2[0:ind2a],[g2r2],self.r2[ind2b:ind22a],[g22r2],self.r2[ind22b:ind22c],g23r2[0:-1],g3r2))
+        ## Fourth: the pieces of the new column
+        top     = [slice(0, ind2a), g2, slice(ind2b, ind22a), g22]
+        middle  = slice(ind22b, ind22c)
+        bottom  = {f: np.concatenate((g23[f][0:-1], g3[f])) for f in fields}
+        top_z   = [slice(0, ind2a + 1), slice(ind2b, ind22a + 1)] # z of the new grid2 and grid22 layers: z of their top layer
+        top_sum = [slice(0, ind2a), slice(ind2b - 1, ind22a), slice(ind22b - 1, ind22b)] # mass_sum and sigma of the new layers: down to their bottom layer
+        nt      = ind2a + 1 + (ind22a - ind2b) + 1 # number of top layers
+        starts  = [ind2a, nt - 1, N - n1 - (n2 - 1), N - n1] # new section starts if the number of layers does not change
         
-    if (len(inds23)>0 or n2==0): # Still some layers in grid23 -> no need to split a layer from grid22
+    else: # Still some layers in grid23 -> no need to split a layer from grid22
         ## Split the last layer of grid23 (layer [-1]) in n1 layers for grid3
-        g3dz    = self.dz[-1]/n1 * np.ones(n1)
-        g3rho   = self.rho[-1] * np.ones(n1)
-        g3mass  = g3rho * g3dz
-        g3gt    = 3 * np.ones(n1)
-        g3Tz    = self.Tz[-1]* np.ones(n1)
-        g3age   = self.age[-1]*np.ones(n1)
-        g3bdm   = self.bdot_mean[-1]*np.ones(n1)
-        g3lwc   = self.LWC[-1]/n1 * np.ones(n1)
-        if self.r2 is not None:
-            g3r2    = self.r2[-1]*np.ones(n1)
+        g3 = {}
+        g3['dz']    = self.dz[-1]/n1 * np.ones(n1)
+        g3['rho']   = self.rho[-1] * np.ones(n1)
+        g3['mass']  = g3['rho'] * g3['dz']
+        g3['gridtrack'] = 3 * np.ones(n1)
+        g3['Tz']    = self.Tz[-1]* np.ones(n1)
+        g3['age']   = self.age[-1]*np.ones(n1)
+        g3['bdot_mean'] = self.bdot_mean[-1]*np.ones(n1)
+        g3['LWC']   = self.LWC[-1]/n1 * np.ones(n1)
+        if r2:
+            g3['r2']    = self.r2[-1]*np.ones(n1)
         
-        ## Concatenate everything together
-        self.dz         = np.concatenate((self.dz[0:ind2a],g2dz,self.dz[ind2b:-1],g3dz))
+        ## The pieces of the new column
+        top     = [slice(0, ind2a), g2]
+        middle  = slice(ind2b, N - 1)
+        bottom  = g3
+        top_z   = [slice(0, ind2a + 1)]
+        top_sum = [slice(0, ind2a), slice(ind2b - 1, ind2b)]
+        nt      = ind2a + 1
+        starts  = [ind2a, min(s22 - ind2b + nt, N - n1), min(s23 - ind2b + nt, N - n1), N - n1]
+
+    ## Put everything together
+    nb      = len(bottom['dz'])
+    if (nt + len(self.dz[middle]) + nb == N) and (middle.start >= nt):
+        d   = middle.start - nt # the number of layers does not change: the middle moves up by d
+    else:
+        d   = None
+    for f in fields:
+        x   = getattr(self, f)
+        setattr(self, f, regrid_field(self.LB, f, x, np.concatenate([x[p] if isinstance(p, slice) else p[f] for p in top]), middle, bottom[f], d))
+
+    if d is not None: # only the sums of the new layers
+        z_bot   = self.z[N - 1] + np.concatenate(([0], bottom['dz'][:-1].cumsum(axis = 0)))
+        ms_bot  = self.mass_sum[N - 2] + bottom['mass'].cumsum(axis = 0)
+        sig_bot = self.sigma[N - 2] + ((bottom['mass'] + bottom['LWC'] * RHO_W_KGM) * self.dx[N - nb:] * GRAVITY).cumsum(axis = 0)
+        self.z          = regrid_field(self.LB, 'z', self.z, np.concatenate([self.z[p] for p in top_z]), middle, z_bot, d)
+        self.mass_sum   = regrid_field(self.LB, 'mass_sum', self.mass_sum, np.concatenate([self.mass_sum[p] for p in top_sum]), middle, ms_bot, d)
+        self.sigma      = regrid_field(self.LB, 'sigma', self.sigma, np.concatenate([self.sigma[p] for p in top_sum]), middle, sig_bot, d)
+        if self.gridtrack is self.LB.view.get('gridtrack'): # keep the new section starts for the next regrid
+            self.grid_offsets = [self.LB.head['gridtrack'] + s for s in starts]
+        else:
+            self.grid_offsets = None
+    else:
         self.z          = self.dz.cumsum(axis=0)
         self.z          = np.concatenate(([0], self.z[:-1]))
-        #print("self.z[-1]:",self.z[-1])
-        self.rho        = np.concatenate((self.rho[0:ind2a],g2rho,self.rho[ind2b:-1],g3rho))
-        self.Tz         = np.concatenate((self.Tz[0:ind2a],g2Tz,self.Tz[ind2b:-1],g3Tz))
-        self.mass       = np.concatenate((self.mass[0:ind2a],[g2mass],self.mass[ind2b:-1],g3mass))
         self.mass_sum   = self.mass.cumsum(axis = 0)
-        self.age        = np.concatenate((self.age[0:ind2a],[g2age],self.age[ind2b:-1],g3age))
-        self.bdot_mean  = np.concatenate((self.bdot_mean[0:ind2a],[g2bdm],self.bdot_mean[ind2b:-1],g3bdm))
-        self.LWC        = np.concatenate((self.LWC[0:ind2a],[g2lwc],self.LWC[ind2b:-1],g3lwc))
         self.sigma      = (self.mass+self.LWC*RHO_W_KGM)*self.dx*GRAVITY
         self.sigma      = self.sigma.cumsum(axis = 0)
-        self.gridtrack  = np.concatenate((self.gridtrack[0:ind2a],[g2gt],self.gridtrack[ind2b:-1],g3gt))
-        if self.r2 is not None:
-            self.r2 = np.concatenate((self.r2[0:ind2a],[g2r2],self.r2[ind2b:-1],g3r2)) 
+        self.grid_offsets = None
 
     #self.bdot_mean  = (np.concatenate(([self.mass_sum[0] / (RHO_I * S_PER_YEAR)], self.mass_sum[1:] * self.t / (self.age[1:] * RHO_I))))*self.c['stpsPerYear']*S_PER_YEAR
     #print('sum(self.dz):',sum(self.dz))
 
     return self.dz, self.z, self.rho, self.Tz, self.mass, self.sigma, self.mass_sum, self.age, self.bdot_mean, self.LWC, self.gridtrack, self.r2
 
+GRID_ORDER = {1:0, 2:1, 22:2, 23:3, 3:4} # order of the subgrids of regrid22, from the surface down
+
+def section_start(gridtrack, grid):
+    '''
+    Index of the first layer of subgrid 'grid' in gridtrack (or of the first
+    layer below it, if there are no layers in that subgrid).
+
+    The subgrids are contiguous and in the order of GRID_ORDER, so this is a
+    binary search instead of a search of the whole column.
+    '''
+
+    rank    = GRID_ORDER[grid]
+    lo, hi  = 0, len(gridtrack)
+    while lo < hi:
+        mid = (lo + hi) // 2
+        if GRID_ORDER[gridtrack[mid]] < rank:
+            lo = mid + 1
+        else:
+            hi = mid
+    return lo
+
+def section_starts(self):
+    '''
+    First layers of grid2, grid22, grid23 and grid3 (see section_start).
+
+    regrid22 keeps them in self.grid_offsets as positions in the gridtrack
+    buffer of self.LB, which do not change when layers are added at the
+    surface. They are checked with is_section_start (O(1)), and searched for
+    again only if they are not right (e.g. after the buffer was copied) or if
+    gridtrack was replaced by a new array (e.g. by the melt schemes).
+    '''
+
+    offsets = getattr(self, 'grid_offsets', None)
+    if (offsets is not None) and (self.gridtrack is self.LB.view.get('gridtrack')):
+        starts  = [o - self.LB.head['gridtrack'] for o in offsets]
+        if all(is_section_start(self.gridtrack, s, grid) for s, grid in zip(starts, (2, 22, 23, 3))):
+            return starts
+    return [section_start(self.gridtrack, grid) for grid in (2, 22, 23, 3)]
+
+def is_section_start(gridtrack, s, grid):
+    '''
+    True if s is section_start(gridtrack, grid).
+    '''
+
+    rank    = GRID_ORDER[grid]
+    if not 0 <= s <= len(gridtrack):
+        return False
+    return (s == 0 or GRID_ORDER[gridtrack[s - 1]] < rank) and (s == len(gridtrack) or GRID_ORDER[gridtrack[s]] >= rank)
+
+def regrid_field(LB, name, x, top, middle, bottom, d):
+    '''
+    Put a regridded field back together: np.concatenate((top, x[middle], bottom)).
+
+    :param LB: the LayerBuffer of the model
+    :param name: field name
+    :param x: the field (one value per layer)
+    :param top: new layers at the top of the column
+    :param middle: slice of x, the layers that are not changed
+    :param bottom: new layers at the bottom of the column
+    :param d: number of layers the middle moves up, if the number of layers
+        does not change (None otherwise)
+
+    :return: the regridded field. If the number of layers does not change, x
+        is changed in place: fields in LB are moved with LB.shift (which only
+        writes top and bottom), other fields are moved up in x. Otherwise it
+        is a new array.
+    '''
+
+    if d is None:
+        return np.concatenate((top, x[middle], bottom))
+    if name in LB.buf:
+        return LB.shift(name, x, d, top, bottom)
+
+    n       = len(x)
+    x[len(top):n - len(bottom)] = x[middle]
+    x[:len(top)]        = top
+    x[n - len(bottom):] = bottom
+    return x
+
 
 
 def regrid22_reciprocal(self):
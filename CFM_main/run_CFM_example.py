@@ -58,6 +58,7 @@ Email me if you have questions or issues! maxstev@umd.edu
 
 from firn_density_nospin import FirnDensityNoSpin
 import RCMpkl_to_spin as RCM
+from sitestore import write_site
 
 ##########
 ### below function gets climate data from the zarr store
@@ -125,8 +126,8 @@ def MERRA2_zarr_to_dataframe(lat_int,lon_int):
 #################################
 
 class M2_CFM():
-    def __init__(self):
-        pass
+    def __init__(self, store = None):
+        self.store = store # if set, the results go in this site store (see sitestore.py) instead of a results folder
 
     def run_CFM(self, input_coords):
 
@@ -278,7 +279,12 @@ class M2_CFM():
 
         shutil.move(configName,os.path.join(c['resultsFolder'],configName))
 
-        print ("output folder = ", c['resultsFolder'])
+        if self.store is not None:
+            write_site(self.store, f'{lat_int} {lon_int}', lat_int, lon_int, c['resultsFolder'], c)
+            shutil.rmtree(c['resultsFolder'])
+            print ("results in store ", self.store)
+        else:
+            print ("output folder = ", c['resultsFolder'])
         # print('run time =' , time.time()-tic , 'seconds')
 
 def unwrap_fun(ll):
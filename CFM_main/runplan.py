@@ -0,0 +1,193 @@
+#!/usr/bin/env python
+'''
+runplan.py
+==========
+
+The settings that the time loop uses, checked and read from the .json
+configuration once before a run instead of being looked up (and compared as
+strings) at every time step.
+
+check_config checks a configuration when the model is set up, before the
+spin up: an option that the model does not know (e.g. a misspelled physRho
+or liquid scheme), a setting of the wrong type, or a setting that an option
+needs but that is missing. All of the problems are printed and the run
+stops, so a mistake in the .json does not end a run at the first time step
+that uses the setting (e.g. the first melt, hours into a run).
+
+RunPlan holds the settings of the time loop (FirnDensitySpin.time_evolve and
+FirnDensityNoSpin.time_evolve) and of the modules it calls (e.g. melt.bucket,
+diffusion.heatDiff). It is made at the end of the model's __init__, after
+the defaults are set, and is the model's 'plan' attribute. Choices between
+functions are bound once: e.g. plan.LWC_heat_method is the heat diffusion
+scheme used when the firn has liquid water.
+'''
+
+import os
+import sys
+import functools
+from physics import PHYSICS_METHODS
+from diffusion import enthalpyDiff, heatDiff_highC, heatDiff_Teff, heatDiff_LWCcorr
+
+### liquid water schemes ('liquid' in the .json); bucketVV and percolation_bucket are old names of bucket
+LIQUID_SCHEMES = ['bucket', 'darcy', 'prefsnowpack', 'resingledomain']
+LIQUID_ALIASES = ['bucketVV', 'percolation_bucket']
+
+### heat diffusion when the firn has liquid water ('LWC_heat' in the .json)
+LWC_HEAT_METHODS = {
+    'enthalpy':     enthalpyDiff,
+    'highC':        heatDiff_highC,
+    'Teff':         heatDiff_Teff,
+    'LWCcorr':      heatDiff_LWCcorr,
+}
+
+### densification schemes that carry Gamma from one time step to the next
+GOUJON_METHODS = ['Goujon2003', 'Breant2017']
+
+### settings of the bucket scheme (melt.bucket) and their defaults
+BUCKET_DEFAULTS = {
+    'ColeouLesaffre':       True,   # parameterising irreducible water content following Coléou and Lesaffre (1998) formulation [True/False]
+    'IrrVal':               0.02,   # [%] irreducible water content: proportion of pore space that holds irreducible water
+    'RhoImp':               830.,   # density threshold for nodes to be considered as ice lens [kg m-3]
+    'DownToIce':            False,  # allows water to bypass all ice lenses until ice sheet is reached (depth where RhoImp density is definitely reached)
+    'ThickImp':             0.1,    # thickness threshold for ice lens to be impermeable (all ice layers are impermeable if set to 0m) [m]
+    'Ponding':              False,  # allowing LWC ponding above impermeable ice lenses [True/False]
+    'DirectRunoff':         0.0,    # (applicable if Ponding==True) fraction of excess LWC not considered for ponding but running off directly [between 0 and 1]
+    'RunoffZuoOerlemans':   False,  # (applicable if Ponding==True) computing lateral runoff following Zuo and Oerlemans (1996) Eqs.(21,22) [True/False]
+    'Slope':                0.1,    # (used only if RunoffZuoOerlemans==True) slope value used in Zuo and Oerlemans (1996) Eq.(22) [/]
+}
+
+### settings that the time loop reads without a default, so they must be in the .json
+REQUIRED_KEYS = ['physRho', 'bdot_type', 'physGrain', 'calcGrainSize', 'r2s0', 'GrGrowPhysics',
+    'heatDiff', 'isoDiff', 'FirnAir', 'strain_softening', 'horizontal_divergence']
+
+def is_number(value):
+    '''
+    True if value is an int or a float (but not a bool).
+    '''
+    return isinstance(value, (int, float)) and not isinstance(value, bool)
+
+def check_config(c):
+    '''
+    Check the settings of a .json configuration before a run. Each problem is
+    printed, and the run stops if there are any.
+
+    :param c: the .json configuration (dictionary)
+    '''
+
+    errors = []
+
+    for key in REQUIRED_KEYS:
+        if key not in c:
+            errors.append('"{}" is missing'.format(key))
+
+    if (('physRho' in c) and (c['physRho'] not in PHYSICS_METHODS)):
+        errors.append('physRho "{}" is not one of: {}'.format(c['physRho'], ', '.join(PHYSICS_METHODS)))
+
+    if c.get('GoujonGamma', 'iterate') not in ['iterate', 'analytic']:
+        errors.append('GoujonGamma "{}" must be "iterate" or "analytic"'.format(c['GoujonGamma']))
+
+    if c.get('merging', False):
+        if not (is_number(c.get('merge_min', 1e-4)) and c.get('merge_min', 1e-4) > 0):
+            errors.append('merging is on, so "merge_min" must be a thickness > 0 (m)')
+
+    for key in ['checkpointInterval', 'checkpointMinutes']:
+        if not (is_number(c.get(key, 0)) and c.get(key, 0) >= 0):
+            errors.append('"{}" must be a number >= 0'.format(key))
+
+    if c.get('isoDiff', False) and not c.get('iso'):
+        errors.append('isoDiff is on, so "iso" (the isotopes to diffuse) must be given')
+
+    if c.get('FirnAir', False) and not os.path.isfile(c.get('AirConfigName', '')):
+        errors.append('FirnAir is on, but the firn air .json "{}" (AirConfigName) does not exist'.format(c.get('AirConfigName', '')))
+
+    if c.get('MELT', False):
+        liquid = c.get('liquid', 'bucket')
+        if liquid not in LIQUID_SCHEMES + LIQUID_ALIASES:
+            errors.append('liquid "{}" is not one of: {}'.format(liquid, ', '.join(LIQUID_SCHEMES)))
+
+        LWC_heat = c.get('LWC_heat', 'enthalpy')
+        if LWC_heat not in LWC_HEAT_METHODS:
+            errors.append('LWC_heat "{}" is not one of: {}'.format(LWC_heat, ', '.join(LWC_HEAT_METHODS)))
+        elif LWC_heat == 'LWCcorr':
+            for key in ['LWCcorr_subdt', 'correct_therm_prop']:
+                if key not in c:
+                    errors.append('LWC_heat is "LWCcorr", so "{}" must be given'.format(key))
+
+        for key in ['IrrVal', 'RhoImp', 'ThickImp', 'DirectRunoff', 'Slope']:
+            if ((key in c) and not is_number(c[key])):
+                errors.append('"{}" must be a number'.format(key))
+        if (is_number(c.get('DirectRunoff', 0.0)) and not (0 <= c.get('DirectRunoff', 0.0) <= 1)):
+            errors.append('"DirectRunoff" must be between 0 and 1')
+
+        missing = [key for key in BUCKET_DEFAULTS if key not in c]
+        if c.get('ColeouLesaffre', True) and ('IrrVal' in missing): # IrrVal is only used without ColeouLesaffre
+            missing.remove('IrrVal')
+        if c.get('DownToIce', False) and ('ThickImp' in missing): # ThickImp is only used without DownToIce
+            missing.remove('ThickImp')
+        if missing:
+            print('You should add the new melt variables to your .json See runplan.BUCKET_DEFAULTS and example.json')
+            print('Using the defaults for: {}'.format(', '.join(missing)))
+
+    if errors:
+        print('There are errors in the .json configuration:')
+        for error in errors:
+            print('  ' + error)
+        print('QUITTING MODEL RUN.')
+        sys.exit()
+
+class RunPlan:
+    '''
+    The settings of the time loop, read once from the configuration.
+
+    :param c: the .json configuration (dictionary), with the model's defaults set
+    '''
+
+    def __init__(self, c):
+        self.physRho                = c['physRho']
+        self.goujon                 = self.physRho in GOUJON_METHODS
+        self.goujon2003             = self.physRho == 'Goujon2003' # Goujon2003 also needs the Gamma values of the previous steps
+        self.morris                 = self.physRho == 'Morris2014'
+
+        self.MELT                   = c.get('MELT', False)
+        self.SEB                    = c.get('SEB', False)
+        self.SUBLIM                 = c.get('SUBLIM', False)
+        self.manualT                = c.get('manualT', False)
+        self.heatDiff               = c.get('heatDiff', True)
+        self.FirnAir                = c.get('FirnAir', False)
+        self.isoDiff                = c.get('isoDiff', False)
+        self.physGrain              = c.get('physGrain', False)
+        self.THist                  = c.get('THist', False)
+        self.no_densification       = c.get('no_densification', False)
+        self.strain_softening       = c.get('strain_softening', False)
+        self.horizontal_divergence  = c.get('horizontal_divergence', False)
+        self.keep_firnthickness     = c.get('keep_firnthickness', False)
+
+        self.merging                = c.get('merging', False)
+        self.merge_min              = c.get('merge_min', 1e-4)
+        self.spinUpdate             = c.get('spinUpdate', False)
+        self.checkpointInterval     = c.get('checkpointInterval', 0)
+        self.checkpointMinutes      = c.get('checkpointMinutes', 0)
+        self.timing                 = c.get('timing', False)
+
+        ### liquid water and the heat diffusion of wet firn
+        self.liquid                 = c.get('liquid', 'bucket')
+        self.LWCheat                = c.get('LWCheat')
+        self.LWC_heat               = c.get('LWC_heat', 'enthalpy')
+        if self.LWC_heat == 'LWCcorr':
+            self.LWC_heat_method    = functools.partial(heatDiff_LWCcorr, iters = c.get('LWCcorr_subdt'), correct_therm_prop = c.get('correct_therm_prop'))
+        else:
+            self.LWC_heat_method    = LWC_HEAT_METHODS.get(self.LWC_heat)
+        self.bucket                 = {key:c.get(key, value) for key, value in BUCKET_DEFAULTS.items()}
+
+        ### entries of the physics parameters (PhysParams) that are the same at every time step
+        self.phys_params = {
+            'bdot_type':        c['bdot_type'],
+            'physGrain':        c['physGrain'],
+            'calcGrainSize':    c['calcGrainSize'],
+            'r2s0':             c['r2s0'],
+            'GrGrowPhysics':    c['GrGrowPhysics'],
+        }
+        if self.morris:
+            self.phys_params['QMorris']     = c['QMorris']
+        if self.goujon:
+            self.phys_params['GoujonGamma'] = c['GoujonGamma']
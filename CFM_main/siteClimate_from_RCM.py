@@ -8,6 +8,9 @@ MAR - for a particular site and puts that data into a pandas dataframe.
 
 The output can be fed to RCMpkl_to_spin.py to generate a time series to force the CFM
 
+For many sites, use getClimate_sites, which reads all of the sites in one pass
+through the RCM files.
+
 YOU MAY HAVE TO EDIT THIS SCRIPT A LOT TO MAKE IT WORK WITH YOUR FILE STRUCTURE 
 AND WHAT CLIMATE FILES YOU HAVE.
 
@@ -26,7 +29,6 @@ import sys
 import decimal
 import os
 import sys
-import matplotlib.pyplot as plt
 from dateutil import rrule
 from datetime import datetime, timedelta, date
 import pandas as pd
@@ -36,10 +38,28 @@ from scipy.spatial import cKDTree
 # from sklearn.metrics import mean_squared_error, r2_score
 # from sklearn.svm import SVR
 import time
-import xarray as xr
 import glob
 import hl_analytic as hla
+### xarray is imported in the functions that read the RCM files, so it is not
+### needed when the forcing of a site is loaded from its pickle
+
+
+MERRA_VARS = ['TS','EVAP','SMELT','PRECTOT','PRECSNO']
+
+_TREES = {} # KD-trees of the RCM grids, so each grid's tree is only built once
 
+def grid_tree(lon,lat):
+    '''
+    KD-tree of the grid points of an RCM grid (built on the first call for
+    that grid, then reused).
+    '''
+    lon = np.asarray(lon)
+    lat = np.asarray(lat)
+    key = (lon.shape, hash(lon.tobytes()), hash(lat.tobytes()))
+    if key not in _TREES:
+        lonlat = np.column_stack((lon.ravel(),lat.ravel()))
+        _TREES[key] = cKDTree(lonlat)
+    return _TREES[key]
 
 def find_indices(points,lon,lat,tree=None):
     '''
@@ -47,8 +67,7 @@ def find_indices(points,lon,lat,tree=None):
     '''
     if tree is None:
         # lon,lat = lon.T,lat.T
-        lonlat = np.column_stack((lon.ravel(),lat.ravel()))
-        tree = cKDTree(lonlat)
+        tree = grid_tree(lon,lat)
     dist,idx = tree.query(points,k=[1])
     ind = np.column_stack(np.unravel_index(idx,lon.shape))
     print(ind)
@@ -58,11 +77,25 @@ def find_indices(points,lon,lat,tree=None):
 
     return ii,jj #, [(i,j) for i,j in ind]
 
+def find_sites(points,lon,lat,tree=None):
+    '''
+    find the grid points nearest many coordinates at once.
+
+    :param points: (n x 2) array of lon, lat pairs
+
+    :return ii, jj: arrays of the indices of the grid point nearest each point
+    '''
+    if tree is None:
+        tree = grid_tree(lon,lat)
+    dist,idx = tree.query(np.atleast_2d(points))
+    ii,jj = np.unravel_index(idx,np.shape(lon))
+    return ii,jj
 
 def read_netcdfs_merra(files, dim, ii, jj, vv, transform_func=None):
     '''
     Read merra files and concatenate into a pandas dataframe
     '''
+    import xarray as xr
     def process_one_path(path):
         with xr.open_dataset(path) as ds:
             # transform_func should do some sort of selection or
@@ -83,6 +116,7 @@ def read_netcdfs_mar(files, dim, ii, jj, vv):
     '''
     Read mar files and concatenate into a pandas dataframe
     '''
+    import xarray as xr
     def process_one_path(path):
         with xr.open_dataset(path) as ds:
             dsd = {}
@@ -98,6 +132,52 @@ def read_netcdfs_mar(files, dim, ii, jj, vv):
     datasets = [process_one_path(p) for p in files]
     return (pd.concat(datasets)).sort_index()
 
+def read_netcdfs_merra_sites(files, dim, ii, jj, vv):
+    '''
+    Read merra files for many grid cells at once: each file is opened once
+    and all of the cells are read from it.
+
+    :return frames: list of dataframes (as from read_netcdfs_merra), one for each cell (ii[k], jj[k])
+    '''
+    import xarray as xr
+    ii = xr.DataArray(np.asarray(ii), dims='site')
+    jj = xr.DataArray(np.asarray(jj), dims='site')
+    def process_one_path(path):
+        with xr.open_dataset(path) as ds:
+            ds = ds[vv].isel(lat=ii,lon=jj)
+            ds.load()
+            return ds
+    datasets = [process_one_path(p) for p in files]
+    combined = xr.concat(datasets, dim)
+    tindex = combined[dim].to_index()
+    data = {v:combined[v].transpose(dim,'site').values for v in vv}
+    return [pd.DataFrame({v:data[v][:,k] for v in vv}, index=tindex).sort_index() for k in range(len(ii))]
+
+def read_netcdfs_mar_sites(files, dim, ii, jj, vv):
+    '''
+    Read mar files for many grid cells at once: each file is opened once
+    and all of the cells are read from it.
+
+    :return frames: list of dataframes (as from read_netcdfs_mar), one for each cell (ii[k], jj[k])
+    '''
+    import xarray as xr
+    ii = xr.DataArray(np.asarray(ii), dims='site')
+    jj = xr.DataArray(np.asarray(jj), dims='site')
+    def process_one_path(path):
+        with xr.open_dataset(path) as ds:
+            dsd = {}
+            for v in vv:
+                da = ds[v]
+                sel = {da.dims[-2]:ii, da.dims[-1]:jj}
+                if len(da.dims)==4:
+                    sel[da.dims[1]] = 0
+                dsd[v] = da.isel(sel).transpose(dim,'site').values
+            return ds[dim].to_index(), dsd
+    parts = [process_one_path(p) for p in files]
+    tindex = parts[0][0].append([p[0] for p in parts[1:]])
+    data = {v:np.concatenate([p[1][v] for p in parts]) for v in vv}
+    return [pd.DataFrame({v:data[v][:,k] for v in vv}, index=tindex).sort_index() for k in range(len(ii))]
+
 def effectiveT(T):
     '''
     The Arrhenius mean temperature.
@@ -108,6 +188,130 @@ def effectiveT(T):
     km  = np.mean(k)
     return Q/(R*np.log(km))
 
+def merra_source(lat_int, runtype):
+    '''
+    Folder of the MERRA files (Antarctica or Greenland) and the reference
+    climate interval.
+
+    :return ddir, spin_date_st, spin_date_end:
+    '''
+    ### Set directory to find climate files.
+    if lat_int < 0: # Antarctica
+        if runtype=='local':
+            # ddir = 'PATH/TO/LOCAL/DATA/MERRA/Antarctica/Hourly'
+            ddir = '/Volumes/Samsung_T1/MERRA/Antarctica/daily_melt'
+        elif runtype=='remote':
+            ddir = 'PATH/TO/REMOTE/DATA/MERRA/Antarctica/Hourly'
+        elif runtype=='differentremote':
+            ddir = 'PATH/TO/OTHER/REMOTE/DATA/CFM/MERRA/Antarctica/Hourly'
+
+        # Adjust these as you see fit to set the Reference Climate Interval (RCI)
+        spin_date_st = 1980 
+        spin_date_end = 2019
+
+    else: # Greenland
+        if runtype=='local':
+            # ddir = 'PATH/TO/LOCAL/DATA/MERRA/Greenland/Hourly'
+            # ddir = '/Volumes/Samsung_T1/MERRA/Greenland/daily_melt'
+            ddir = '/Users/cdsteve2/RCMdata/MERRA2/Greenland/daily_melt'
+        elif runtype=='remote':
+            ddir = 'PATH/TO/REMOTE/DATA/MERRA/Greenland/Hourly'
+        elif runtype == 'loki':
+            ddir = '/home/maxstev/CFM_main/MERRA/Greenland/daily_melt'
+
+
+        # Adjust these as you see fit to set the Reference Climate Interval (RCI)
+        spin_date_st = 1980
+        spin_date_end = 1995
+
+    return ddir, spin_date_st, spin_date_end
+
+def mar_source(dsource, SEB):
+    '''
+    Folder, variables, and reference climate interval of a MAR product.
+
+    :return ddir, d2, vv, spin_date_st, spin_date_end:
+    '''
+    if dsource == 'ERA10km':
+        MARver='311'
+        # d2 = '/ERA_10km/'
+        d2='/ERA_1958-2019-10km/'
+        if SEB:
+            vv = ['AL2','LHF','ME','RF','RU','SF','SHF','ST2','SU','SWD','LWD','TT']
+        else:
+            vv = ['ME','SF','ST2','RF','SU','TT']
+        spin_date_st = 1950
+        spin_date_end = 1979
+    elif dsource == 'ERA6k':
+        MARver='311'
+        d2 = '/ERA_1979-2020-6km/'
+        vv = ['ME','SF','ST2','RF','TT']
+        spin_date_st = 1979
+        spin_date_end = 1995
+    elif dsource == 'NCEP20k':
+        MARver='311'
+        d2 = '/NCEP1_1948-2020_20km/'
+        vv = ['ME','SF','ST2','RF','SU','TT']
+        spin_date_st = 1948
+        spin_date_end = 1979       
+    elif dsource == 'ERA5_20km': # MAR3.12
+        MARver='312'
+        d2 = '/ERA5_20km/'
+        if SEB:
+            vv = ['AL2','LHF','ME','RF','SF','SHF','ST2','SU','SWD','TT']
+        else:    
+            vv = ['ME','SF','ST2','RF','SU','TT']
+        spin_date_st = 1958
+        spin_date_end = 1979
+
+    if MARver == '311':
+        ddir = f'/Volumes/Samsung_T1/MAR{MARver}/Greenland/daily'
+    elif MARver == '312':
+        ddir = '/Volumes/LaCie'
+
+    return ddir, d2, vv, spin_date_st, spin_date_end
+
+def mar_to_CLIM(df_CLIM, SEB):
+    '''
+    Put MAR variables into the units and names of df_CLIM.
+    '''
+    if not SEB:
+        if 'SMB' in df_CLIM.columns:
+            df_BDOT = pd.DataFrame(df_CLIM['SMB']/1000*917).rename(columns = ['BDOT']) #put into units kg/m^2/day (i.e. per time resolution in the files))
+            df_MELT = None
+            df_RAIN = None
+        else:
+            if 'SU' in df_CLIM.columns:
+                df_BDOT = pd.DataFrame(((df_CLIM['SF']-df_CLIM['SU'])/1000*917),columns=['BDOT']) #put into units kg/m^2/day (i.e. per time resolution in the files))
+                df_CLIM['BDOT'] = df_BDOT.BDOT.values
+                df_CLIM.drop(['SF','SU'],axis=1,inplace=True)
+            else:
+                df_BDOT = pd.DataFrame((df_CLIM['SF'])/1000*917).rename(columns={'SF':'BDOT'}) #put into units kg/m^2/day (i.e. per time resolution in the files))
+                df_CLIM['BDOT'] = df_BDOT.BDOT.values
+                df_CLIM.drop(['SF'],axis=1,inplace=True)
+            df_CLIM['ME'] = df_CLIM['ME']/1000*917 #put into units kg/m^2/day (i.e. per time resolution in the files))
+            df_CLIM['RF'] = df_CLIM['RF']/1000*917 #put into units kg/m^2/day (i.e. per time resolution in the files))
+            # df_MELT = pd.DataFrame(df_CLIM['ME']/1000*917/3600).rename(columns={'ME':'MELT'}) #put into equivalent units to the merra data (kg/m^2/s)
+            # df_RAIN = pd.DataFrame(df_CLIM['RF']/1000*917/3600).rename(columns={'RF':'RAIN'}) #put into equivalent units to the merra data (kg/m^2/s)
+        df_TS = pd.DataFrame(df_CLIM[['ST2','TT']]).rename(columns = {'ST2':'TSKIN','TT':'T2m'}) + 273.15
+
+        drn = {'ME':'SMELT','SU':'SUBLIMATION','SF':'BDOT','RF':'RAIN','ST2':'TSKIN','SMB':'BDOT','TT':'T2m'}
+        df_CLIM.rename(mapper=drn,axis=1,inplace=True)
+        df_CLIM.TSKIN = df_CLIM.TSKIN + 273.15
+        df_CLIM.T2m = df_CLIM.T2m + 273.15
+    else:
+        df_CLIM['ME'] = df_CLIM['ME']/1000*917 #put into units kg/m^2/day (i.e. per time resolution in the files))
+        df_CLIM['RF'] = df_CLIM['RF']/1000*917 #put into units kg/m^2/day (i.e. per time resolution in the files))
+        df_CLIM['SU'] = df_CLIM['SU']/1000*917 #put into units kg/m^2/day (i.e. per time resolution in the files))
+        df_CLIM['SF'] = df_CLIM['SF']/1000*917 #put into units kg/m^2/day (i.e. per time resolution in the files))
+        drn = {'AL2':'ALBEDO','LHF':'QL','ME':'SMELT','RF':'RAIN','SF':'BDOT','SHF':'QH','ST2':'TSKIN','SU':'SUBL','SWD':'SW_d','TT':'T2m'}
+        # drn = {'ME':'SMELT','SU':'SUBLIMATION','SF':'BDOT','RF':'RAIN','ST2':'TSKIN','SMB':'BDOT','TT':'T2m'}
+        df_CLIM.rename(mapper=drn,axis=1,inplace=True)
+        df_CLIM.TSKIN = df_CLIM.TSKIN + 273.15
+        df_CLIM.T2m = df_CLIM.T2m + 273.15
+
+    return df_CLIM
+
 def getClimate(lat_int,lon_int,writer=True,datatype='MERRA',timeres='1D',melt=False,runtype='local',dsource = None,SEB=False):
     '''
     Load data from MERRA or MAR or whatever.
@@ -183,34 +387,7 @@ def getClimate(lat_int,lon_int,writer=True,datatype='MERRA',timeres='1D',melt=Fa
 
         '''
 
-        ### Set directory to find climate files.
-        if lat_int < 0: # Antarctica
-            if runtype=='local':
-                # ddir = 'PATH/TO/LOCAL/DATA/MERRA/Antarctica/Hourly'
-                ddir = '/Volumes/Samsung_T1/MERRA/Antarctica/daily_melt'
-            elif runtype=='remote':
-                ddir = 'PATH/TO/REMOTE/DATA/MERRA/Antarctica/Hourly'
-            elif runtype=='differentremote':
-                ddir = 'PATH/TO/OTHER/REMOTE/DATA/CFM/MERRA/Antarctica/Hourly'
-            
-            # Adjust these as you see fit to set the Reference Climate Interval (RCI)
-            spin_date_st = 1980 
-            spin_date_end = 2019
-
-        else: # Greenland
-            if runtype=='local':
-                # ddir = 'PATH/TO/LOCAL/DATA/MERRA/Greenland/Hourly'
-                # ddir = '/Volumes/Samsung_T1/MERRA/Greenland/daily_melt'
-                ddir = '/Users/cdsteve2/RCMdata/MERRA2/Greenland/daily_melt'
-            elif runtype=='remote':
-                ddir = 'PATH/TO/REMOTE/DATA/MERRA/Greenland/Hourly'
-            elif runtype == 'loki':
-                ddir = '/home/maxstev/CFM_main/MERRA/Greenland/daily_melt'
-
-            
-            # Adjust these as you see fit to set the Reference Climate Interval (RCI)
-            spin_date_st = 1980
-            spin_date_end = 1995
+        ddir, spin_date_st, spin_date_end = merra_source(lat_int, runtype)
 
         # input_datetimes = [dparser.parse((re.search(r'\d{8}',xx)).group()) for xx in ff] # this will extract the dates for each file
         # yy = np.array([float((re.search(r'\d{8}',xx)).group()[0:4]) for xx in glob.glob(ddir+'/TS/*.nc*')])
@@ -254,7 +431,7 @@ def getClimate(lat_int,lon_int,writer=True,datatype='MERRA',timeres='1D',melt=Fa
 
         else:
             pwriter = True
-            vv=['TS','EVAP','SMELT','PRECTOT','PRECSNO']
+            vv=MERRA_VARS
             # flist_TS = glob.glob(ddir+'/TS/*.nc*')
 
             # df_TS = read_netcdfs_merra(flist_TS, dim='time',ii=ii,jj=jj,vv='TS')
@@ -285,43 +462,7 @@ def getClimate(lat_int,lon_int,writer=True,datatype='MERRA',timeres='1D',melt=Fa
             dsource = 'ERA10km'
             print('using MAR ', dsource)
 
-        if dsource == 'ERA10km':
-            MARver='311'
-            # d2 = '/ERA_10km/'
-            d2='/ERA_1958-2019-10km/'
-            if SEB:
-                vv = ['AL2','LHF','ME','RF','RU','SF','SHF','ST2','SU','SWD','LWD','TT']
-            else:
-                vv = ['ME','SF','ST2','RF','SU','TT']
-            spin_date_st = 1950
-            spin_date_end = 1979
-        elif dsource == 'ERA6k':
-            MARver='311'
-            d2 = '/ERA_1979-2020-6km/'
-            vv = ['ME','SF','ST2','RF','TT']
-            spin_date_st = 1979
-            spin_date_end = 1995
-        elif dsource == 'NCEP20k':
-            MARver='311'
-            d2 = '/NCEP1_1948-2020_20km/'
-            vv = ['ME','SF','ST2','RF','SU','TT']
-            spin_date_st = 1948
-            spin_date_end = 1979       
-        elif dsource == 'ERA5_20km': # MAR3.12
-            MARver='312'
-            d2 = '/ERA5_20km/'
-            if SEB:
-                vv = ['AL2','LHF','ME','RF','SF','SHF','ST2','SU','SWD','TT']
-            else:    
-                vv = ['ME','SF','ST2','RF','SU','TT']
-            spin_date_st = 1958
-            spin_date_end = 1979
-
-        if MARver == '311':
-            ddir = f'/Volumes/Samsung_T1/MAR{MARver}/Greenland/daily'
-        elif MARver == '312':
-            ddir = '/Volumes/LaCie'
-        
+        ddir, d2, vv, spin_date_st, spin_date_end = mar_source(dsource, SEB)
 
         pickle_folder = ddir + '/pickles' + d2
         print(pickle_folder)
@@ -356,40 +497,7 @@ def getClimate(lat_int,lon_int,writer=True,datatype='MERRA',timeres='1D',melt=Fa
         else:
             pwriter = True
             df_CLIM = (read_netcdfs_mar(flist,'TIME',ii=ii,jj=jj,vv=vv))[str(spin_date_st):]
-            if not SEB:
-                if 'SMB' in df_CLIM.columns:
-                    df_BDOT = pd.DataFrame(df_CLIM['SMB']/1000*917).rename(columns = ['BDOT']) #put into units kg/m^2/day (i.e. per time resolution in the files))
-                    df_MELT = None
-                    df_RAIN = None
-                else:
-                    if 'SU' in df_CLIM.columns:
-                        df_BDOT = pd.DataFrame(((df_CLIM['SF']-df_CLIM['SU'])/1000*917),columns=['BDOT']) #put into units kg/m^2/day (i.e. per time resolution in the files))
-                        df_CLIM['BDOT'] = df_BDOT.BDOT.values
-                        df_CLIM.drop(['SF','SU'],axis=1,inplace=True)
-                    else:
-                        df_BDOT = pd.DataFrame((df_CLIM['SF'])/1000*917).rename(columns={'SF':'BDOT'}) #put into units kg/m^2/day (i.e. per time resolution in the files))
-                        df_CLIM['BDOT'] = df_BDOT.BDOT.values
-                        df_CLIM.drop(['SF'],axis=1,inplace=True)
-                    df_CLIM['ME'] = df_CLIM['ME']/1000*917 #put into units kg/m^2/day (i.e. per time resolution in the files))
-                    df_CLIM['RF'] = df_CLIM['RF']/1000*917 #put into units kg/m^2/day (i.e. per time resolution in the files))
-                    # df_MELT = pd.DataFrame(df_CLIM['ME']/1000*917/3600).rename(columns={'ME':'MELT'}) #put into equivalent units to the merra data (kg/m^2/s)
-                    # df_RAIN = pd.DataFrame(df_CLIM['RF']/1000*917/3600).rename(columns={'RF':'RAIN'}) #put into equivalent units to the merra data (kg/m^2/s)
-                df_TS = pd.DataFrame(df_CLIM[['ST2','TT']]).rename(columns = {'ST2':'TSKIN','TT':'T2m'}) + 273.15
-
-                drn = {'ME':'SMELT','SU':'SUBLIMATION','SF':'BDOT','RF':'RAIN','ST2':'TSKIN','SMB':'BDOT','TT':'T2m'}
-                df_CLIM.rename(mapper=drn,axis=1,inplace=True)
-                df_CLIM.TSKIN = df_CLIM.TSKIN + 273.15
-                df_CLIM.T2m = df_CLIM.T2m + 273.15
-            else:
-                df_CLIM['ME'] = df_CLIM['ME']/1000*917 #put into units kg/m^2/day (i.e. per time resolution in the files))
-                df_CLIM['RF'] = df_CLIM['RF']/1000*917 #put into units kg/m^2/day (i.e. per time resolution in the files))
-                df_CLIM['SU'] = df_CLIM['SU']/1000*917 #put into units kg/m^2/day (i.e. per time resolution in the files))
-                df_CLIM['SF'] = df_CLIM['SF']/1000*917 #put into units kg/m^2/day (i.e. per time resolution in the files))
-                drn = {'AL2':'ALBEDO','LHF':'QL','ME':'SMELT','RF':'RAIN','SF':'BDOT','SHF':'QH','ST2':'TSKIN','SU':'SUBL','SWD':'SW_d','TT':'T2m'}
-                # drn = {'ME':'SMELT','SU':'SUBLIMATION','SF':'BDOT','RF':'RAIN','ST2':'TSKIN','SMB':'BDOT','TT':'T2m'}
-                df_CLIM.rename(mapper=drn,axis=1,inplace=True)
-                df_CLIM.TSKIN = df_CLIM.TSKIN + 273.15
-                df_CLIM.T2m = df_CLIM.T2m + 273.15
+            df_CLIM = mar_to_CLIM(df_CLIM, SEB)
         ###############
         ### end MAR ###
         ###############
@@ -449,6 +557,122 @@ def getClimate(lat_int,lon_int,writer=True,datatype='MERRA',timeres='1D',melt=Fa
     # return CD, stepsperyear, depth_S1, depth_S2, desired_depth
 
 
+def getClimate_sites(lats,lons,writer=True,datatype='MERRA',runtype='local',dsource=None,SEB=False):
+    '''
+    getClimate for many sites at once. The grid cell of every site is found
+    with one KD-tree query, and each RCM file is opened once to read all of
+    the cells (rather than opening every file for each site). Sites in the
+    same grid cell are read once.
+
+    Each site's dataframe is saved to the same pickle that getClimate uses
+    (if writer is True), and sites that already have a pickle are not read
+    from the RCM files again, so this can be used to extract the forcing of a
+    whole batch before the runs (see batch_runner.py), after which getClimate
+    finds each site's pickle.
+
+    Parameters
+    ----------
+    lats: array
+        latitudes of the sites
+    lons: array
+        longitudes of the sites
+    writer, datatype, runtype, dsource, SEB:
+        as in getClimate ('MERRA' or 'MAR')
+
+    Returns
+    -------
+    GCdicts: list
+        for each site, the dictionary returned by getClimate (df_CLIM, SDS, SDE)
+    '''
+
+    lats = np.atleast_1d(np.asarray(lats,dtype=float))
+    lons = np.atleast_1d(np.asarray(lons,dtype=float))
+    GCdicts = [None]*len(lats)
+
+    if datatype == 'MERRA':
+        pickle_folder = 'IDS/pickle/'
+        if not os.path.exists(pickle_folder):
+            os.makedirs(pickle_folder)
+        for south in [True, False]: # Antarctic and Greenland files are in different folders
+            group = np.flatnonzero((lats < 0) == south)
+            if len(group) == 0:
+                continue
+            ddir, spin_date_st, spin_date_end = merra_source(lats[group[0]], runtype)
+            fn_ll = glob.glob(ddir + '/*.nc*')
+            with nc.Dataset(fn_ll[0],'r') as nc_ll:
+                lat_ll = nc_ll.variables['lat'][:]
+                lon_ll = nc_ll.variables['lon'][:]
+            ii = np.argmin(np.abs(np.asarray(lat_ll)[None,:] - lats[group,None]),axis=1)
+            jj = np.argmin(np.abs(np.asarray(lon_ll)[None,:] - lons[group,None]),axis=1)
+            names = ['MERRA2_CLIM_df_{}_{}.pkl'.format(lat_ll[i],lon_ll[j]) for i,j in zip(ii,jj)]
+            frames = extract_cells(ii, jj, names, pickle_folder, writer,
+                lambda ci,cj: read_netcdfs_merra_sites(fn_ll, 'time', ci, cj, MERRA_VARS))
+            for k,df in zip(group,frames):
+                GCdicts[k] = {'df_CLIM':df,'SDS':spin_date_st,'SDE':spin_date_end}
+
+    elif datatype == 'MAR':
+        if np.any(lats < 0):
+            print('no Antarctic MAR data')
+            sys.exit()
+        if not dsource:
+            dsource = 'ERA10km'
+            print('using MAR ', dsource)
+        ddir, d2, vv, spin_date_st, spin_date_end = mar_source(dsource, SEB)
+        pickle_folder = ddir + '/pickles' + d2
+        if not os.path.exists(pickle_folder):
+            os.makedirs(pickle_folder)
+        flist = glob.glob(ddir + d2 + '*.nc')
+        with nc.Dataset(flist[0],'r') as rgr:
+            lat = rgr['LAT'][:,:]
+            lon = rgr['LON'][:,:]
+        ii,jj = find_sites(np.column_stack((lons,lats)),lon,lat)
+        fmt = 'MAR_{}_CLIM_df_{}_{}_SEB.pkl' if SEB else 'MAR_{}_CLIM_df_{}_{}.pkl'
+        names = [fmt.format(dsource,lat[i,j],lon[i,j]) for i,j in zip(ii,jj)]
+        frames = extract_cells(ii, jj, names, pickle_folder, writer,
+            lambda ci,cj: [mar_to_CLIM(df[str(spin_date_st):], SEB) for df in read_netcdfs_mar_sites(flist, 'TIME', ci, cj, vv)])
+        GCdicts = [{'df_CLIM':df,'SDS':spin_date_st,'SDE':spin_date_end} for df in frames]
+
+    else:
+        print('getClimate_sites only reads MERRA or MAR')
+        sys.exit()
+
+    return GCdicts
+
+def extract_cells(ii, jj, names, pickle_folder, writer, reader):
+    '''
+    Dataframes for the grid cells (ii[k], jj[k]) of a group of sites: cells
+    with a pickle are loaded from it, and the rest are read with one call to
+    reader(ii, jj) (which returns a dataframe for each cell).
+
+    :return frames: dataframe for each site
+    '''
+
+    cells, first, inverse = np.unique(np.column_stack((ii,jj)), axis=0, return_index=True, return_inverse=True)
+    inverse = np.ravel(inverse)
+    cell_frames = [None]*len(cells)
+    toread = []
+    for c in range(len(cells)):
+        pname = os.path.join(pickle_folder, names[first[c]])
+        if os.path.isfile(pname):
+            cell_frames[c] = pd.read_pickle(pname)
+        else:
+            toread.append(c)
+    print('{} sites in {} grid cells, {} cells to read'.format(len(names), len(cells), len(toread)))
+
+    if toread:
+        for c,df in zip(toread, reader(cells[toread,0], cells[toread,1])):
+            cell_frames[c] = df
+            if writer:
+                df.to_pickle(os.path.join(pickle_folder, names[first[c]]))
+
+    used = np.zeros(len(cells),dtype=bool)
+    frames = []
+    for c in inverse: # sites in the same cell each get their own copy
+        frames.append(cell_frames[c].copy() if used[c] else cell_frames[c])
+        used[c] = True
+    return frames
+
+
 if __name__ == '__main__':
     tic = time.time()
 
@@ -0,0 +1,311 @@
+#!/usr/bin/env python
+'''
+sitestore.py
+============
+
+One HDF5 file (a 'site store') that holds the results of many sites, instead
+of a results folder for each site (with a spin file, a results file, and a
+copy of the .json). For large batches (e.g. all grid cells of an ice sheet),
+this avoids writing many small files, and the results of all sites can be
+analyzed from one file.
+
+Each output in the results file (e.g. 'density', 'temperature', 'DIP',
+'forcing') becomes a dataset in the store with an extra first dimension for
+the site: store['density'][k] holds the density output of site k. Sites can
+have outputs of different sizes (e.g. a different number of layers), so the
+datasets grow to the largest site and the rest is filled with NaN; the size
+of each site's output is in store['extent/density'][k]. The store also has:
+
+- site: site names (e.g. the lat/lon pair, '72.5 -38.5')
+- lat, lon: coordinates of each site
+- config: the .json configuration of each site (as a string)
+
+The datasets are chunked by site, so reading some of the sites (or one
+write time of every site, e.g. store['density'][:, -1, :]) only reads those
+parts of the file.
+
+A site is added in two steps, so that a process that dies (e.g. a batch on
+preemptible nodes) can not damage the sites that are already in the store:
+
+1. write_site copies the outputs of the site into a 'part' file in the
+   folder store + '.parts'. The part is written under a temporary name,
+   synced to disk, and then renamed, so a part file is always complete.
+   After this, the site's results folder can be removed.
+2. merge_parts adds the parts to the store. It writes them into a copy of
+   the store and then renames the copy to the store, so the store on disk is
+   always either the old one or the new one. Merged parts are then removed.
+   A merge that does not finish leaves the store and the parts as they
+   were, and the next merge adds them.
+
+Many processes (e.g. the workers of batch_runner.py) can write parts at the
+same time. Merges hold a lock on the store (a lock file next to it). By
+default write_site merges right away; because each merge copies the store,
+batches write the parts only (merge = False) and merge once at the end
+(batch_runner.run_batch does this). Sites that are in the parts folder but
+not yet merged are not seen by read_site or list_sites. Writing a site that
+is already in the store replaces it. Open the store for reading after the
+writers are done (HDF5 does not allow reading a file that another process
+is writing).
+
+To use it, give a store file to firnbatch_generic.run_CFM (or
+batch_runner.run_batch) or to run_CFM_example.M2_CFM, or call write_site
+after a run:
+
+>>> write_site('CFMstore.hdf5', '72.5 -38.5', 72.5, -38.5, firn.c['resultsFolder'], firn.c)
+
+and to read the results of a site:
+
+>>> density = read_site('CFMstore.hdf5', '72.5 -38.5', 'density')
+'''
+
+import os
+import re
+import json
+import time
+import glob
+import shutil
+import hashlib
+import contextlib
+import numpy as np
+import h5py
+from writer import CHUNK_BYTES
+
+try:
+    import fcntl
+except ImportError: # Windows
+    fcntl = None
+
+@contextlib.contextmanager
+def store_lock(store):
+    '''
+    Hold an exclusive lock on a store (the file store + '.lock'). The lock is
+    released if the process dies.
+    '''
+
+    lockname = store + '.lock'
+    if fcntl is not None:
+        with open(lockname, 'a') as lf:
+            fcntl.flock(lf, fcntl.LOCK_EX)
+            try:
+                yield
+            finally:
+                fcntl.flock(lf, fcntl.LOCK_UN)
+    else: # no flock: create the lock file exclusively (a lock file left by a process that died has to be removed by hand)
+        while True:
+            try:
+                fd = os.open(lockname, os.O_CREAT | os.O_EXCL | os.O_WRONLY)
+                break
+            except FileExistsError:
+                time.sleep(0.1)
+        try:
+            yield
+        finally:
+            os.close(fd)
+            os.remove(lockname)
+
+def write_site(store, site, lat, lon, resultsFolder, config = None, resultsFileName = None, merge = True):
+    '''
+    Add the results of a site to a store (or replace them, if the site is
+    already in the store).
+
+    :param store: the store file (created if it does not exist)
+    :param site: site name
+    :param lat: latitude of the site
+    :param lon: longitude of the site
+    :param resultsFolder: the results folder of the site's run
+    :param config: the .json configuration of the run (dictionary), saved in the store
+    :param resultsFileName: the results file (default: config['resultsFileName'], or CFMresults.hdf5)
+    :param merge: if True, the site is merged into the store now; if False,
+        it is only written to the parts folder (see merge_parts)
+    '''
+
+    if resultsFileName is None:
+        resultsFileName = (config or {}).get('resultsFileName', 'CFMresults.hdf5')
+
+    folder = parts_folder(store)
+    os.makedirs(folder, exist_ok = True)
+    part = os.path.join(folder, part_name(site))
+    tmp = part + '.{}.tmp'.format(os.getpid())
+    with h5py.File(os.path.join(resultsFolder, resultsFileName), 'r') as fr:
+        with h5py.File(tmp, 'w') as fp:
+            fp.attrs['site'] = site
+            fp.attrs['lat'] = lat
+            fp.attrs['lon'] = lon
+            fp.attrs['config'] = json.dumps(config, default = str) if config is not None else ''
+            for name, ds in fr.items():
+                if (isinstance(ds, h5py.Dataset) and ds.ndim >= 1):
+                    fp.create_dataset(name, data = ds[()])
+    with open(tmp, 'rb+') as f: # the part is on disk before it replaces an older part of the site
+        os.fsync(f.fileno())
+    os.replace(tmp, part)
+
+    if merge:
+        merge_parts(store)
+
+def parts_folder(store):
+    '''
+    Folder of the parts of a store that are not yet merged.
+    '''
+    return store + '.parts'
+
+def part_name(site):
+    '''
+    File name of the part of a site (the site name, made safe for a file
+    name, and a hash of the site name, so that two sites can not share a part).
+    '''
+    return '{}_{}.hdf5'.format(re.sub('[^A-Za-z0-9.-]+', '_', site), hashlib.sha1(site.encode()).hexdigest()[:10])
+
+def merge_parts(store):
+    '''
+    Merge the parts of a store (written by write_site) into the store. The
+    parts are added to a copy of the store, which then replaces the store,
+    and the merged parts are removed.
+
+    If a part can not be added (e.g. one of its outputs does not have the
+    same number of dimensions as in the store), the error is raised, the
+    store is not changed, and the parts are kept.
+
+    :param store: the store file (created if it does not exist)
+
+    :return: number of parts merged
+    '''
+
+    folder = parts_folder(store)
+    if not os.path.isdir(folder):
+        return 0
+
+    with store_lock(store):
+        ### claim the parts: parts written from now on are left for the next merge.
+        ### Parts claimed by a merge that did not finish are merged again (a newer part of the same site replaces them).
+        for part in glob.glob(os.path.join(folder, '*.hdf5')):
+            os.replace(part, part + '.merging')
+        claimed = sorted(glob.glob(os.path.join(folder, '*.hdf5.merging')))
+        if not claimed:
+            return 0
+
+        tmp = store + '.merging.tmp'
+        if os.path.isfile(store):
+            shutil.copyfile(store, tmp)
+        elif os.path.isfile(tmp):
+            os.remove(tmp)
+        try:
+            with h5py.File(tmp, 'a') as fs:
+                for part in claimed:
+                    with h5py.File(part, 'r') as fp:
+                        site = fp.attrs['site']
+                        k = site_index(fs, site, create = True)
+                        fs['lat'][k] = fp.attrs['lat']
+                        fs['lon'][k] = fp.attrs['lon']
+                        fs['config'][k] = fp.attrs['config']
+                        for name, ds in fp.items():
+                            write_region(fs, name, k, ds[()], site)
+            with open(tmp, 'rb+') as f:
+                os.fsync(f.fileno())
+        except BaseException:
+            os.remove(tmp)
+            raise
+        os.replace(tmp, store)
+
+        for part in claimed:
+            os.remove(part)
+
+    return len(claimed)
+
+def site_index(fs, site, create = False):
+    '''
+    Index of a site in an open store.
+
+    :param fs: the store (open h5py file)
+    :param site: site name
+    :param create: if True, a site that is not in the store is added
+
+    :return k: index of the site (None if it is not in the store and create is False)
+    '''
+
+    if 'site' not in fs:
+        if not create:
+            return None
+        fs.create_dataset('site', shape = (0,), maxshape = (None,), dtype = h5py.string_dtype(), chunks = (1024,))
+        fs.create_dataset('lat', shape = (0,), maxshape = (None,), dtype = 'float64', chunks = (1024,), fillvalue = np.nan)
+        fs.create_dataset('lon', shape = (0,), maxshape = (None,), dtype = 'float64', chunks = (1024,), fillvalue = np.nan)
+        fs.create_dataset('config', shape = (0,), maxshape = (None,), dtype = h5py.string_dtype(), chunks = (64,))
+
+    names = fs['site'].asstr()[:]
+    found = np.flatnonzero(names == site)
+    if len(found) > 0:
+        return int(found[0])
+    if not create:
+        return None
+
+    k = len(names)
+    for key in ['site', 'lat', 'lon', 'config']:
+        fs[key].resize((k + 1,))
+    fs['site'][k] = site
+    return k
+
+def write_region(fs, name, k, data, site = None):
+    '''
+    Write the output of site k to dataset name in an open store, making the
+    dataset larger if needed. Values outside of the site's output are NaN.
+    Raises ValueError if the output does not have the same number of
+    dimensions as the dataset in the store.
+    '''
+
+    data = np.asarray(data)
+    dtype = np.result_type(data.dtype, np.float32) # float, so that the padding can be NaN
+    if name not in fs:
+        chunk = list(data.shape)
+        rowbytes = int(np.prod(chunk[1:])) * np.dtype(dtype).itemsize
+        chunk[0] = int(min(chunk[0], max(1, CHUNK_BYTES // max(rowbytes, 1))))
+        fs.create_dataset(name, shape = (k + 1,) + data.shape, maxshape = (None,) * (data.ndim + 1), dtype = dtype,
+            chunks = tuple([1] + chunk), fillvalue = np.nan, compression = 'gzip', shuffle = True)
+        fs.create_dataset('extent/' + name, shape = (k + 1, data.ndim), maxshape = (None, data.ndim), dtype = 'int64',
+            chunks = (1024, data.ndim), fillvalue = 0)
+
+    ds = fs[name]
+    ext = fs['extent/' + name]
+    if ds.ndim != data.ndim + 1:
+        raise ValueError('output {} of site {} has {} dimensions, but {} in the store'.format(name, site, data.ndim, ds.ndim - 1))
+    new_shape = (max(ds.shape[0], k + 1),) + tuple(max(n, m) for n, m in zip(ds.shape[1:], data.shape))
+    if new_shape != ds.shape:
+        ds.resize(new_shape)
+    if ext.shape[0] < k + 1:
+        ext.resize((k + 1, data.ndim))
+
+    old = ext[k]
+    if np.any(old > np.array(data.shape)): # replacing a larger output of this site
+        ds[(k,) + tuple(slice(0, n) for n in old)] = np.nan
+    ds[(k,) + tuple(slice(0, n) for n in data.shape)] = data
+    ext[k] = data.shape
+
+def read_site(store, site, name):
+    '''
+    Read an output of one site from a store.
+
+    :param store: the store file
+    :param site: site name
+    :param name: name of the output (as in the results file, e.g. 'density')
+
+    :return: the output, with the same shape as in the site's results file
+    '''
+
+    with h5py.File(store, 'r') as fs:
+        k = site_index(fs, site)
+        if k is None:
+            raise KeyError('site {} is not in {}'.format(site, store))
+        extent = fs['extent/' + name][k]
+        return fs[name][(k,) + tuple(slice(0, n) for n in extent)]
+
+def list_sites(store):
+    '''
+    Sites in a store.
+
+    :return site: site names
+    :return lat: latitudes
+    :return lon: longitudes
+    '''
+
+    with h5py.File(store, 'r') as fs:
+        if 'site' not in fs:
+            return np.array([], dtype = object), np.array([]), np.array([])
+        return fs['site'].asstr()[:], fs['lat'][:], fs['lon'][:]
@@ -5,10 +5,6 @@ Functions to solve the diffusion equation
 
 import numpy as np
 np.set_printoptions(precision=4)
-from scipy import interpolate
-import scipy.integrate
-from scipy.sparse import spdiags
-import scipy.sparse.linalg as splin
 from constants import *
 import sys
 from scipy.linalg import lapack
@@ -39,6 +35,8 @@ def solver(a_U, a_D, a_P, b):
     use_dgtsv=True
 
     if use_splin:
+        from scipy.sparse import spdiags
+        import scipy.sparse.linalg as splin
         nz = np.size(b)
 
         diags = (np.append([a_U, -a_P], [a_D], axis = 0))
@@ -61,9 +59,71 @@ def solver(a_U, a_D, a_P, b):
         print(np.max(np.abs(phi_t-phi_t_spsolve))/np.median(np.abs(phi_t)))
     return phi_t
 
+def solver_batch(a_U, a_D, a_P, b):
+    '''
+    function for solving several independent tridiagonal problems at once
+
+    Each row of the (2-D) inputs is one system, e.g. one firn column or one
+    diffused field. The rows are stacked into a single block-diagonal system
+    (the coefficients coupling neighbouring rows are zeroed) so that all of
+    them are solved with one lapack.dgtsv call.
+
+    :param a_U: [nsys, nz]
+    :param a_D: [nsys, nz]
+    :param a_P: [nsys, nz]
+    :param b:   [nsys, nz]
+
+    :return phi_t: [nsys, nz]
+    '''
+
+    nsys, nz = np.shape(b)
+
+    dl = np.array(a_U, dtype=float)
+    dl[:,0] = 0.0
+    du = np.array(a_D, dtype=float)
+    du[:,-1] = 0.0
+
+    dl  = dl.ravel()[1:]
+    d   = np.ascontiguousarray(-a_P).ravel()
+    du  = du.ravel()[:-1]
+    rhs = np.ascontiguousarray(-b).ravel()
+    _, _, _, phi_t, _ = lapack.dgtsv(dl, d, du, rhs)
+
+    return phi_t.reshape(nsys, nz)
+
 ####!!!!
 
-def transient_solve_TR(z_edges, Z_P, nt, dt, Gamma_P, phi_0, nz_P, nz_fv, phi_s, tot_rho, c_vol, airdict=None):
+def TR_geometry(z_edges, Z_P):
+    '''
+    grid geometry for the finite volume solver
+
+    This depends only on the grid, so it can be calculated once and shared by
+    all of the fields that are diffused on that grid during a time step.
+
+    :param z_edges: edges of the volumes
+    :param Z_P: node positions
+
+    :return dZ: width of the volumes
+    :return deltaZ_u: distance from each node to the node above
+    :return deltaZ_d: distance from each node to the node below
+    :return f_u: interpolation factor, upper edge (Patankar eq. 4.9)
+    :return f_d: interpolation factor, lower edge
+    '''
+
+    dZ = np.diff(z_edges) #width of nodes
+
+    deltaZ_u = np.diff(Z_P)
+    deltaZ_u = np.append(deltaZ_u[0], deltaZ_u)
+
+    deltaZ_d = np.diff(Z_P)
+    deltaZ_d = np.append(deltaZ_d, deltaZ_d[-1])
+
+    f_u = 1 - (Z_P[:] - z_edges[0:-1]) / deltaZ_u[:]
+    f_d = 1 - (z_edges[1:] - Z_P[:]) / deltaZ_d[:]
+
+    return dZ, deltaZ_u, deltaZ_d, f_u, f_d
+
+def transient_solve_TR(z_edges, Z_P, nt, dt, Gamma_P, phi_0, nz_P, nz_fv, phi_s, tot_rho, c_vol, airdict=None, geometry=None):
     '''
     transient 1-d diffusion finite volume method
 
@@ -79,24 +139,18 @@ def transient_solve_TR(z_edges, Z_P, nt, dt, Gamma_P, phi_0, nz_P, nz_fv, phi_s,
     :param nz_P:
     :param nz_fv:
     :param phi_s:
+    :param geometry: (optional) output of TR_geometry for this grid
     :return phi_t:
     '''
 
     phi_t = phi_0
     phi_t_old = phi_t.copy()
 
-    for i_time in range(nt):
-
-        dZ = np.diff(z_edges) #width of nodes
-
-        deltaZ_u = np.diff(Z_P)
-        deltaZ_u = np.append(deltaZ_u[0], deltaZ_u)
-
-        deltaZ_d = np.diff(Z_P)
-        deltaZ_d = np.append(deltaZ_d, deltaZ_d[-1])
+    if geometry is None:
+        geometry = TR_geometry(z_edges, Z_P)
+    dZ, deltaZ_u, deltaZ_d, f_u, f_d = geometry
 
-        f_u = 1 - (Z_P[:] - z_edges[0:-1]) / deltaZ_u[:]
-        f_d = 1 - (z_edges[1:] - Z_P[:]) / deltaZ_d[:]
+    for i_time in range(nt):
 
         #######################################
         # this part is for gas diffusion, which takes a bit more physics
@@ -238,6 +292,78 @@ def transient_solve_TR(z_edges, Z_P, nt, dt, Gamma_P, phi_0, nz_P, nz_fv, phi_s,
 ### end transient_solve_TR ########
 ###################################
 
+def transient_solve_TR_multi(z_edges, Z_P, nt, dt, Gamma_P, phi_0, phi_s, c_vol, geometry=None):
+    '''
+    transient 1-d diffusion finite volume method for several fields at once
+
+    Same scheme and boundary conditions as transient_solve_TR (without the gas
+    physics), for fields that are diffused on the same grid, e.g. the
+    different isotope species. The grid geometry is calculated once and the
+    fields are solved together with solver_batch.
+
+    :param z_edges:
+    :param Z_P:
+    :param nt:
+    :param dt:
+    :param Gamma_P: [nfields, nz] diffusivity of each field
+    :param phi_0: [nfields, nz] initial profile of each field
+    :param phi_s: [nfields] surface value of each field
+    :param c_vol: [nz] or [nfields, nz]
+    :param geometry: (optional) output of TR_geometry for this grid
+    :return phi_t: [nfields, nz]
+    '''
+
+    phi_t   = np.atleast_2d(phi_0)
+    Gamma_P = np.atleast_2d(Gamma_P)
+    phi_s   = np.atleast_1d(phi_s)
+
+    if geometry is None:
+        geometry = TR_geometry(z_edges, Z_P)
+    dZ, deltaZ_u, deltaZ_d, f_u, f_d = geometry
+
+    for i_time in range(nt):
+
+        Gamma_U = np.concatenate((Gamma_P[:,:1], Gamma_P[:,:-1]), axis=1)
+        Gamma_D = np.concatenate((Gamma_P[:,1:], Gamma_P[:,-1:]), axis=1)
+
+        Gamma_u =  1 / ((1 - f_u) / Gamma_P + f_u / Gamma_U) # Patankar eq. 4.9
+        Gamma_d =  1 / ((1 - f_d) / Gamma_P + f_d / Gamma_D)
+
+        D_u = (Gamma_u / deltaZ_u)
+        D_d = (Gamma_d / deltaZ_d)
+
+        a_U = D_u # Patankar eq. 4.41a,b
+        a_D = D_d # Patankar eq. 4.41a,b
+
+        a_P_0 = c_vol * dZ / dt # Patankar eq. 4.41c
+
+        S_P     = 0.0
+        a_P     = a_U + a_D + a_P_0 - S_P*dZ
+
+        b       = a_P_0 * phi_t #Patankar 4.41d (no source term)
+
+        ### Boundary conditions: specified value at the surface,
+        ### zero gradient at the bottom (see transient_solve_TR)
+        #Upper boundary
+        a_P[:,0]  = 1
+        a_U[:,0]  = 0
+        a_D[:,0]  = 0
+        b[:,0]    = phi_s
+
+        #Down boundary
+        a_P[:,-1] = 1
+        a_D[:,-1] = 0
+        a_U[:,-1] = 1
+        b[:,-1]   = 0.0
+
+        phi_t = solver_batch(a_U, a_D, a_P, b)
+
+    return phi_t
+
+###################################
+### end transient_solve_TR_multi ##
+###################################
+
 def transient_solve_EN(z_edges, Z_P, nt, dt, Gamma_P, phi_0, nz_P, nz_fv, phi_s, mix_rho, c_vol, LWC, mass_sol, dz, ICT, rho_firn, iii=0):
     '''
     transient 1-d diffusion finite volume method for enthalpy
@@ -0,0 +1,117 @@
+#!/usr/bin/env python
+'''
+spincache.py
+============
+
+Cache of spin-up results, so that runs that share the same spin up (e.g.
+sensitivity tests that only change how the main run is done) do not each
+repeat it.
+
+To use it, add "spinCache": "path/to/cache/folder" to the .json. Each spin up
+is stored in that folder under a key made from the .json (without the keys
+in SPIN_CACHE_IGNORE, which do not affect the spin up) and the contents of
+the forcing (the input files, or climateTS for dataframe inputs) and of the
+initial profile (initfirnFile, when initprofile is true). When a run
+needs a spin up and the cache has one with the same key, the cached file is
+copied to the run's resultsFolder/spinFileName instead of running the spin up.
+
+The key does not include the model code, so clear the cache folder if you
+change the code that does the spin up.
+'''
+
+import os
+import json
+import hashlib
+import shutil
+import numpy as np
+
+### .json keys that are only used after the spin up; changing these does not change the spin up.
+SPIN_CACHE_IGNORE = [
+    'resultsFolder', 'resultsFileName', 'spinFileName', 'spinCache', 'NewSpin',
+    'outputs', 'TWriteInt', 'TWriteStart', 'output_bits', 'output_stream',
+    'output_compression', 'output_compression_opts', 'output_shuffle', 'output_chunks', 'output_filters',
+    'grid_outputs', 'grid_output_res', 'dHhistory', 'DIPhorizon',
+    'spinUpdate', 'spinUpdateDate', 'input_type_options',
+    'checkpointInterval', 'checkpointMinutes', 'checkpointFileName', 'timing',
+    ]
+
+def spin_key(config, climateTS=None):
+    '''
+    Key for the spin up of a run.
+
+    :param config: the .json configuration (dictionary)
+    :param climateTS: dictionary of forcing arrays, if using dataframe inputs
+
+    :return key: hex digest
+    '''
+
+    h = hashlib.sha1()
+
+    spin_config = {k:v for k,v in config.items() if k not in SPIN_CACHE_IGNORE}
+    h.update(json.dumps(spin_config, sort_keys=True, default=str).encode())
+
+    if climateTS is not None:
+        for k in sorted(climateTS):
+            h.update(k.encode())
+            h.update(np.ascontiguousarray(climateTS[k]).tobytes())
+    else:
+        ### hash any input file named in the .json (the isotope files have the isotope added to the name)
+        folder = config.get('InputFileFolder', '')
+        names = [v for k,v in sorted(config.items()) if (k.startswith('InputFileName') and isinstance(v, str))]
+        if 'InputFileNameIso' in config:
+            fn = os.path.splitext(config['InputFileNameIso'])
+            names.extend([fn[0] + '_{}'.format(iso) + fn[1] for iso in config.get('iso', [])])
+        for name in names:
+            hash_file(h, os.path.join(folder, name), name)
+
+    ### the spin up reads the initial profile at its last step
+    if config.get('initprofile') and isinstance(config.get('initfirnFile'), str):
+        hash_file(h, config['initfirnFile'], config['initfirnFile'])
+
+    return h.hexdigest()
+
+def hash_file(h, fname, name):
+    '''
+    Add the name and the contents of file fname (if it exists) to hash h.
+    '''
+    if os.path.isfile(fname):
+        h.update(name.encode())
+        with open(fname, 'rb') as f:
+            for block in iter(lambda: f.read(2**20), b''):
+                h.update(block)
+
+def cache_file(config, key):
+    '''
+    Name of the cached spin file for key.
+    '''
+    return os.path.join(config['spinCache'], key + '.hdf5')
+
+def get_cached_spin(config, key):
+    '''
+    If the cache has a spin up for key, copy it to the run's spin file.
+
+    :return: True if the spin file came from the cache
+    '''
+
+    cfile = cache_file(config, key)
+    if not os.path.isfile(cfile):
+        return False
+
+    os.makedirs(config['resultsFolder'], exist_ok=True)
+    shutil.copyfile(cfile, os.path.join(config['resultsFolder'], config['spinFileName']))
+    print('Using cached spin up', cfile)
+    return True
+
+def store_spin(config, key):
+    '''
+    Put the run's spin file in the cache (if it is not already there).
+    '''
+
+    cfile = cache_file(config, key)
+    if os.path.isfile(cfile):
+        return
+
+    os.makedirs(config['spinCache'], exist_ok=True)
+    tmp = cfile + '.{}.tmp'.format(os.getpid()) # copy then rename, so that runs sharing the cache never see a partial file
+    shutil.copyfile(os.path.join(config['resultsFolder'], config['spinFileName']), tmp)
+    os.replace(tmp, cfile)
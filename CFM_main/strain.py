@@ -61,7 +61,7 @@ def load_strain(self, spin=False):
     
     int_type = self.c['int_type']
     
-    input_eps, input_year_eps, input_eps_full, input_year_eps_full = read_input(os.path.join(self.c['InputFileFolder'], self.c['InputFileNameStrain']))
+    input_eps, input_year_eps, input_eps_full, input_year_eps_full = read_input(os.path.join(self.c['InputFileFolder'], self.c['InputFileNameStrain']),varname='STRAIN')
     if np.ndim(input_eps) == 1:
         if spin:
             if self.c['spinup_climate_type'] == 'initial':
@@ -57,7 +57,7 @@ def sublim(self,iii):
     self.age        = np.concatenate((self.age[ind1:-1] , self.age[-1]*np.ones(num_boxes_sublim))) #+ self.dt[iii] # age of each layer increases of dt
     # self.dz                  = np.concatenate((self.dz[ind1:-1] , self.dz[-1]/divider*np.ones(num_boxes_sublim))) # this splits the last box into many.
     
-    keep_firnthickness = self.c['keep_firnthickness']
+    keep_firnthickness = self.plan.keep_firnthickness
     
     if keep_firnthickness:
         avg_dh_sub = -1 * dh_sub/num_boxes_sublim # average thickness of melted nodes
@@ -78,7 +78,7 @@ def sublim(self,iii):
     self.dzn        = self.dzn[0:self.compboxes]
     self.Tz         = np.concatenate((self.Tz[ind1:-1] , self.Tz[-1]*np.ones(num_boxes_sublim)))
     self.Tz[0]      = np.copy(self.Ts[iii])
-    if self.c['physGrain']:
+    if self.plan.physGrain:
         self.r2         = np.concatenate((self.r2[ind1:-1] , self.r2[-1]*np.ones(num_boxes_sublim)))
     self.bdot_mean  = np.concatenate((self.bdot_mean[ind1:-1] , self.bdot_mean[-1]*np.ones(num_boxes_sublim)))
     self.z          = self.dz.cumsum(axis = 0)
@@ -0,0 +1,122 @@
+#!/usr/bin/env python
+'''
+timing.py
+=========
+
+Timers for the phases of the time step in FirnDensityNoSpin.time_evolve, so
+that you can see where a run spends its time without using a profiler.
+
+To use it, set "timing": true in the .json. For each phase, the run keeps
+the total time, the number of time steps in which the phase was done, and a
+histogram of the time it took in each of those steps. These are printed at
+the end of the run and written to the results file, in the group 'timing':
+
+- phases: names of the phases
+- total: total time in each phase (seconds)
+- calls: number of time steps in which each phase was done
+- histogram: (phase x bin) number of time steps in each bin
+- bin_edges: edges of the histogram bins (seconds); the first and last bins
+  also hold the times below and above the edges
+- attribute 'steps': number of time steps timed
+
+The timer is a lap timer: PhaseTimer.lap(phase) charges the time since the
+previous lap (or since the start of the time step) to phase, so it only adds
+a perf_counter call per phase. When "timing" is false, NullTimer is used,
+which does nothing.
+'''
+
+import time
+import numpy as np
+
+### phases of the time step, in the order they are done in time_evolve; 'other' is the bookkeeping between them
+TIMED_PHASES = ['merge', 'physics', 'strain', 'SEB', 'melt', 'firnair', 'isotopes', 'grain',
+    'accumulation', 'sublimation', 'other', 'heat', 'output', 'regrid']
+
+class PhaseTimer:
+    '''
+    Time spent in each phase of the time step.
+
+    :param phases: names of the phases
+    :param bin_edges: edges of the histogram bins of the time per step (seconds).
+        The default is 4 bins per decade from 1 microsecond to 10 seconds.
+    '''
+
+    def __init__(self, phases = TIMED_PHASES, bin_edges = None):
+        self.phases     = list(phases)
+        self.index      = {phase:i for i, phase in enumerate(self.phases)}
+        if bin_edges is None:
+            bin_edges   = np.logspace(-6, 1, 29)
+        self.bin_edges  = np.asarray(bin_edges, dtype = float)
+        self.total      = np.zeros(len(self.phases))
+        self.calls      = np.zeros(len(self.phases), dtype = int)
+        self.histogram  = np.zeros((len(self.phases), len(self.bin_edges) + 1), dtype = int)
+        self.steps      = 0
+        self.step_time  = np.zeros(len(self.phases)) # time in each phase in the current step
+        self.t0         = time.perf_counter()
+
+    def start_step(self):
+        '''
+        Start a time step.
+        '''
+        self.step_time[:]   = 0
+        self.t0             = time.perf_counter()
+
+    def lap(self, phase):
+        '''
+        Charge the time since the last lap (or the start of the step) to phase.
+        '''
+        t   = time.perf_counter()
+        self.step_time[self.index[phase]] += t - self.t0
+        self.t0 = t
+
+    def end_step(self, phase = 'other'):
+        '''
+        End a time step: charge the time since the last lap to phase, then add
+        the step to the totals and the histograms.
+        '''
+        self.lap(phase)
+        done = np.flatnonzero(self.step_time) # phases that were done in this step
+        self.total[done]    += self.step_time[done]
+        self.calls[done]    += 1
+        self.histogram[done, np.searchsorted(self.bin_edges, self.step_time[done])] += 1
+        self.steps          += 1
+
+    def summary(self):
+        '''
+        Table of the total, share, and mean time per step of each phase.
+        '''
+        grand = max(np.sum(self.total), 1e-300)
+        lines = ['{:<14}{:>12}{:>8}{:>10}{:>14}'.format('phase', 'total (s)', '%', 'steps', 'mean (ms)')]
+        for i in np.argsort(self.total)[::-1]:
+            if self.calls[i] == 0:
+                continue
+            lines.append('{:<14}{:>12.3f}{:>8.1f}{:>10d}{:>14.4f}'.format(self.phases[i], self.total[i],
+                100 * self.total[i] / grand, self.calls[i], 1000 * self.total[i] / self.calls[i]))
+        lines.append('{:<14}{:>12.3f}{:>8}{:>10d}'.format('total', np.sum(self.total), '', self.steps))
+        return '\n'.join(lines)
+
+    def write(self, f):
+        '''
+        Write the timing to the group 'timing' of an open h5py file.
+        '''
+        g = f.create_group('timing')
+        g.create_dataset('phases', data = np.array(self.phases, dtype = 'S'))
+        g.create_dataset('total', data = self.total)
+        g.create_dataset('calls', data = self.calls)
+        g.create_dataset('histogram', data = self.histogram)
+        g.create_dataset('bin_edges', data = self.bin_edges)
+        g.attrs['steps'] = self.steps
+
+class NullTimer:
+    '''
+    Stand-in for PhaseTimer when timing is off.
+    '''
+
+    def start_step(self):
+        pass
+
+    def lap(self, phase):
+        pass
+
+    def end_step(self, phase = 'other'):
+        pass
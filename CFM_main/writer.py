@@ -8,41 +8,118 @@ Functions for writing model outputs.
 
 import csv
 import os
+import sys
 import numpy as np
 import h5py
 from constants import *
 
+def output_name(VW):
+    '''
+    Name of the dataset in the results file for model output VW.
+    '''
+
+    if VW == 'rho': 
+        wn = 'density'
+    elif VW == 'Tz':
+        wn = 'temperature'
+    elif VW == 'z':
+        wn = 'depth'
+    elif VW == 'climate':
+        wn = 'Modelclimate'
+    elif VW == 'Hx':
+        wn = 'temp_Hx'
+    else:
+        wn = VW
+
+    return wn
+
+### target size of a chunk of a compressed/chunked output dataset (bytes)
+CHUNK_BYTES = 2**20
+
+def output_dataset_options(config, wn, shape, dtype, layout = None):
+    '''
+    Chunking and compression settings (keyword arguments for h5py
+    create_dataset) for output wn of the results file.
+
+    The settings come from the .json: 'output_compression' (None, 'gzip', or
+    'lzf'), 'output_compression_opts' (gzip level), 'output_shuffle',
+    'output_chunks' ('time' or 'depth'), and 'output_filters', which has
+    settings for individual outputs (key is the name in the results file,
+    e.g. 'density'; value is a dictionary with any of 'compression',
+    'compression_opts', 'shuffle', 'scaleoffset', and 'chunks').
+
+    'time' chunks hold whole rows (all depths at a few write times), which is
+    fastest for writing and for reading profiles. 'depth' chunks hold whole
+    columns (a few depths at all write times), which is fastest for reading
+    time series at a depth.
+
+    :param config: the .json configuration (dictionary)
+    :param wn: name of the dataset in the results file
+    :param shape: shape of the dataset
+    :param dtype: dtype of the dataset
+    :param layout: if set, used instead of 'output_chunks' (ModelOutputs uses 'time' when streaming)
+
+    :return opts: dictionary of keyword arguments for create_dataset; empty if
+    the dataset is written contiguous and uncompressed (the default)
+    '''
+
+    filt = dict(config.get('output_filters', {}).get(wn, {}))
+    compression = filt.get('compression', config.get('output_compression', None))
+    scaleoffset = filt.get('scaleoffset', None)
+    chunks = filt.get('chunks', layout or config.get('output_chunks', None))
+
+    opts = {}
+    if compression:
+        opts['compression'] = compression
+        copts = filt.get('compression_opts', config.get('output_compression_opts', None))
+        if ((copts is not None) and (compression == 'gzip')):
+            opts['compression_opts'] = copts
+    if filt.get('shuffle', config.get('output_shuffle', True)) and (compression or scaleoffset is not None):
+        opts['shuffle'] = True
+    if scaleoffset is not None:
+        opts['scaleoffset'] = scaleoffset # decimal digits kept for floats (lossy); not for outputs with NaN (e.g. gridded outputs below the domain)
+
+    if (opts or chunks) and np.prod(shape) > 0:
+        if chunks in (None, True, 'time'):
+            chunks = 'time'
+        if isinstance(chunks, str):
+            itemsize = np.dtype(dtype).itemsize
+            if len(shape) == 1:
+                chunks = (int(min(shape[0], max(1, CHUNK_BYTES // itemsize))),)
+            elif chunks == 'time':
+                chunks = (int(min(shape[0], max(1, CHUNK_BYTES // (shape[1] * itemsize)))), shape[1])
+            elif chunks == 'depth':
+                chunks = (shape[0], int(min(shape[1], max(1, CHUNK_BYTES // (shape[0] * itemsize)))))
+            else:
+                print('output_chunks must be "time" or "depth"; exiting')
+                sys.exit()
+        opts['chunks'] = tuple(chunks)
+
+    return opts
+
 def write_nospin_hdf5(self,Mout_dict,forcing_dict=None):
     '''
     Write the results fromt the main model run to hdf file.
 
+    If the outputs were streamed to the results file during the run
+    ('output_stream' in the .json), only the forcing is added here.
+
     Parameters
     ----------
     Mout_dict: dict
         contains all of the model outputs; each key is the name of the output 
     '''
 
-    f4 = h5py.File(os.path.join(self.c['resultsFolder'], self.c['resultsFileName']),'w')
-
-    for VW in Mout_dict.keys():
-
-        if VW == 'rho': 
-            wn = 'density'
-        elif VW == 'Tz':
-            wn = 'temperature'
-        elif VW == 'z':
-            wn = 'depth'
-        elif VW == 'age':
-            Mout_dict[VW] = Mout_dict[VW]/S_PER_YEAR
-            wn = 'age'
-        elif VW == 'climate':
-            wn = 'Modelclimate'
-        elif VW == 'Hx':
-            wn = 'temp_Hx'
-        else:
-            wn = VW
+    MOutputs = getattr(self, 'MOutputs', None)
+    if ((MOutputs is not None) and MOutputs.stream):
+        f4 = MOutputs.f_out
+    else:
+        f4 = h5py.File(os.path.join(self.c['resultsFolder'], self.c['resultsFileName']),'w')
 
-        f4.create_dataset(wn, data = Mout_dict[VW])
+        for VW in Mout_dict.keys():
+            if VW == 'age':
+                Mout_dict[VW] = Mout_dict[VW]/S_PER_YEAR
+            f4.create_dataset(output_name(VW), data = Mout_dict[VW], **output_dataset_options(self.c, output_name(VW), np.shape(Mout_dict[VW]), Mout_dict[VW].dtype))
 
     if forcing_dict:
         ks = list(forcing_dict)
@@ -65,8 +142,38 @@ def write_nospin_hdf5(self,Mout_dict,forcing_dict=None):
             forcing_out[:,5] = -9999* np.ones_like(forcing_dict['dectime'])
         f4.create_dataset('forcing',data=forcing_out,dtype='float64')
 
+    if hasattr(self,'dHhist'): # elevation change at each write step ('dHhistory' in .json)
+        f4.create_dataset('dHhistory',data=self.dHhist,dtype='float64')
+
+    if (self.c.get('timing') and hasattr(self,'timer')): # time in each phase of the time step ('timing' in .json)
+        self.timer.write(f4)
+
     f4.close()
 
+def write_forcing_hdf5(filename,forcing):
+    '''
+    Write forcing data to a single HDF5 file that can be read with
+    reader.read_input_hdf5 (e.g. by setting InputFileNameTemp,
+    InputFileNamebdot, etc. to this file).
+
+    The datasets are stored contiguous and uncompressed so that the reader
+    can memory-map them.
+
+    Parameters
+    ----------
+    filename: str
+        name of the file to write
+    forcing: dict
+        key is the variable name (e.g. 'TSKIN', 'BDOT', 'SMELT', 'RAIN',
+        'SUBLIM', 'SRHO', 'd18O'), value is a tuple (time, data)
+    '''
+
+    with h5py.File(filename,'w') as f6:
+        for vn, (time, data) in forcing.items():
+            g = f6.create_group(vn)
+            g.create_dataset('time', data = np.asarray(time, dtype='float64'))
+            g.create_dataset('data', data = np.asarray(data, dtype='float64'))
+
 def write_spin_hdf5(self):
     '''
     Write the model outputs to hdf file at the end of spin up.